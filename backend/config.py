@@ -8,6 +8,8 @@ def _int_env(key, default: int = 0):
 
 # Database configuration
 DATABASE_URL = os.environ.get("DATABASE_URL", "")
+# Defaults to DATABASE_URL with an async driver (asyncpg, aiosqlite for sqlite)
+ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL", "")
 DB_POOL_SIZE = _int_env("DB_POOL_SIZE", 50)
 DB_MAX_OVERFLOW = _int_env("DB_MAX_OVERFLOW", 50)
 DB_POOL_RECYCLE = _int_env("DB_POOL_RECYCLE", 1800)  # 30 minutes in seconds
@@ -25,9 +27,64 @@ MODEL_MEDIUM_REASONING = os.getenv("MODEL_MEDIUM_REASONING", "o3-mini-2025-01-31
 MODEL_LOW_REASONING = os.getenv(
     "MODEL_LOW_REASONING", "gpt-4o"
 )  # model should support markdown
+# Shared LLM HTTP connection pool (one per worker process)
+LLM_MAX_CONNECTIONS = _int_env("LLM_MAX_CONNECTIONS", 100)
+LLM_MAX_KEEPALIVE_CONNECTIONS = _int_env("LLM_MAX_KEEPALIVE_CONNECTIONS", 20)
+LLM_KEEPALIVE_EXPIRY = _int_env("LLM_KEEPALIVE_EXPIRY", 60)  # seconds
+# LLM scheduler limits per reasoning tier, per worker process (0 TPM = no budget)
+LLM_HIGH_MAX_CONCURRENCY = _int_env("LLM_HIGH_MAX_CONCURRENCY", 10)
+LLM_HIGH_TOKENS_PER_MINUTE = _int_env("LLM_HIGH_TOKENS_PER_MINUTE", 0)
+LLM_MEDIUM_MAX_CONCURRENCY = _int_env("LLM_MEDIUM_MAX_CONCURRENCY", 50)
+LLM_MEDIUM_TOKENS_PER_MINUTE = _int_env("LLM_MEDIUM_TOKENS_PER_MINUTE", 0)
+LLM_LOW_MAX_CONCURRENCY = _int_env("LLM_LOW_MAX_CONCURRENCY", 50)
+LLM_LOW_TOKENS_PER_MINUTE = _int_env("LLM_LOW_TOKENS_PER_MINUTE", 0)
+# LLM retries/timeouts (seconds)
+LLM_TIMEOUT = _int_env("LLM_TIMEOUT", 600)
+LLM_MAX_RETRIES = _int_env("LLM_MAX_RETRIES", 3)
+LLM_BACKOFF_BASE = _int_env("LLM_BACKOFF_BASE", 1)
+LLM_BACKOFF_MAX = _int_env("LLM_BACKOFF_MAX", 30)
+LLM_HEDGE_AFTER = _int_env("LLM_HEDGE_AFTER", 0)  # 0 disables hedged requests
+LLM_DIMENSION_ATTEMPTS = _int_env("LLM_DIMENSION_ATTEMPTS", 2)
+# Only re-simulate the dimensions the diff step lists as changed, others are carried
+# forward with their growth rates applied (0 re-simulates every dimension)
+SIMULATE_CHANGED_DIMENSIONS_ONLY = _int_env("SIMULATE_CHANGED_DIMENSIONS_ONLY", 1)
+# LLM response cache, see model/llm_cache.py for modes (off, cache, record, replay)
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "cache")
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory")  # memory or sqlite
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+LLM_CACHE_TTL = _int_env("LLM_CACHE_TTL", 60 * 60 * 24)
+LLM_CACHE_MAX_ENTRIES = _int_env("LLM_CACHE_MAX_ENTRIES", 10_000)
 
-# Cache configuration
+# Cache configuration (shared by all workers, see utils/shared_cache.py)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite")  # sqlite, memory or redis
+CACHE_PATH = os.getenv("CACHE_PATH", "/tmp/state-sandbox-cache.sqlite3")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 CACHE_TTL_STATES_LEADERBOARD = _int_env("CACHE_TTL_STATES_LEADERBOARD", 60 * 60 * 6)
+# Serve the leaderboard this long past its TTL while it is rebuilt in the background
+CACHE_STALE_TTL_STATES_LEADERBOARD = _int_env(
+    "CACHE_STALE_TTL_STATES_LEADERBOARD", 60 * 60
+)
+
+# Snapshot storage, see db/compression.py and db/snapshots.py
+SNAPSHOT_COMPRESSION = os.getenv("SNAPSHOT_COMPRESSION", "none")  # none or zstd
+SNAPSHOT_COMPRESSION_LEVEL = _int_env("SNAPSHOT_COMPRESSION_LEVEL", 10)
+SNAPSHOT_STORAGE = os.getenv("SNAPSHOT_STORAGE", "full")  # full or delta
+SNAPSHOT_KEYFRAME_INTERVAL = _int_env("SNAPSHOT_KEYFRAME_INTERVAL", 10)
+SNAPSHOT_MARKDOWN_CACHE_SIZE = _int_env("SNAPSHOT_MARKDOWN_CACHE_SIZE", 256)
+
+# Turn job configuration
+TURN_WORKER_MODE = os.getenv("TURN_WORKER_MODE", "inprocess")  # inprocess or external
+TURN_WORKER_CONCURRENCY = _int_env("TURN_WORKER_CONCURRENCY", 10)  # jobs per process
+TURN_JOB_LEASE_SECONDS = _int_env("TURN_JOB_LEASE_SECONDS", 120)
+TURN_JOB_MAX_ATTEMPTS = _int_env("TURN_JOB_MAX_ATTEMPTS", 3)
+TURN_JOB_POLL_SECONDS = _int_env("TURN_JOB_POLL_SECONDS", 1)
+JOB_EVENTS_RETENTION_HOURS = _int_env("JOB_EVENTS_RETENTION_HOURS", 24)
+
+# Event stream configuration (seconds)
+STREAM_HEARTBEAT_INTERVAL = _int_env("STREAM_HEARTBEAT_INTERVAL", 2)
+STREAM_IDLE_TIMEOUT = _int_env("STREAM_IDLE_TIMEOUT", 15 * 60)  # 0 disables
+# Streamed LLM text is logged as job events at most this often, per job
+STREAM_PROGRESS_INTERVAL = _int_env("STREAM_PROGRESS_INTERVAL", 2)
 
 # Misc configuration
 FRONTEND_URL = os.getenv("FRONTEND_URL", "https://state.sshh.io")
@@ -0,0 +1,158 @@
+from typing import Dict, Optional, Tuple
+import base64
+import hashlib
+
+import zstandard
+from sqlalchemy import String, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.types import TypeDecorator
+
+from config import SNAPSHOT_COMPRESSION, SNAPSHOT_COMPRESSION_LEVEL
+from db.database import async_engine, engine
+
+# Compressed values are stored as "zstd:<dictionary id>:<base85 zstd frame>" so
+# they fit the existing String columns and plain rows stay readable as-is.
+_PREFIX = "zstd:"
+
+
+def _build_dictionary_data() -> bytes:
+    """Raw-content dictionary from the dimension templates every state document repeats."""
+    from model.state_config import DIMENSIONS
+
+    return "\n\n".join(
+        f"# {dimension.title}\n{dimension.template.strip()}"
+        for dimension in DIMENSIONS
+    ).encode("utf-8")
+
+
+def _current_dictionary() -> Tuple[str, bytes]:
+    data = _build_dictionary_data()
+    return hashlib.sha256(data).hexdigest()[:16], data
+
+
+def _save_dictionary(conn, dictionary_id: str, data: bytes):
+    from db.models import CompressionDictionary
+
+    exists = conn.scalar(
+        select(CompressionDictionary.id).where(
+            CompressionDictionary.id == dictionary_id
+        )
+    )
+    if not exists:
+        conn.execute(
+            CompressionDictionary.__table__.insert().values(id=dictionary_id, data=data)
+        )
+
+
+def _read_dictionaries(conn) -> Dict[str, bytes]:
+    from db.models import CompressionDictionary
+
+    rows = conn.execute(select(CompressionDictionary.id, CompressionDictionary.data))
+    return {dictionary_id: data for dictionary_id, data in rows}
+
+
+class _DictionaryRegistry:
+    """
+    Dictionaries are saved in the database under a hash of their content, so
+    rows compressed before a template change can still be read after it. They
+    are all loaded once at startup (load_compression_dictionaries), compressing
+    and decompressing never touch the database.
+    """
+
+    def __init__(self):
+        self._dictionaries: Dict[str, zstandard.ZstdCompressionDict] = {}
+        self._current_id: Optional[str] = None
+
+    def load(self, dictionaries: Dict[str, bytes], current_id: str):
+        self._dictionaries = {
+            dictionary_id: zstandard.ZstdCompressionDict(
+                data, dict_type=zstandard.DICT_TYPE_RAWCONTENT
+            )
+            for dictionary_id, data in dictionaries.items()
+        }
+        self._current_id = current_id
+
+    def current(self) -> Tuple[str, zstandard.ZstdCompressionDict]:
+        if self._current_id is None:
+            raise LookupError(
+                "Compression dictionaries not loaded, call "
+                "load_compression_dictionaries() at startup"
+            )
+        return self._current_id, self._dictionaries[self._current_id]
+
+    def get(self, dictionary_id: str) -> zstandard.ZstdCompressionDict:
+        dictionary = self._dictionaries.get(dictionary_id)
+        if dictionary is None:
+            raise LookupError(f"Unknown compression dictionary {dictionary_id}")
+        return dictionary
+
+
+_registry = _DictionaryRegistry()
+
+
+async def load_compression_dictionaries():
+    """Save the current dictionary and load all of them, once per process at startup."""
+    dictionary_id, data = _current_dictionary()
+    try:
+        async with async_engine.begin() as conn:
+            await conn.run_sync(_save_dictionary, dictionary_id, data)
+    except IntegrityError:
+        pass  # saved concurrently by another process
+    async with async_engine.connect() as conn:
+        dictionaries = await conn.run_sync(_read_dictionaries)
+    _registry.load(dictionaries, dictionary_id)
+
+
+def load_compression_dictionaries_sync():
+    """load_compression_dictionaries for scripts using the sync engine."""
+    dictionary_id, data = _current_dictionary()
+    try:
+        with engine.begin() as conn:
+            _save_dictionary(conn, dictionary_id, data)
+    except IntegrityError:
+        pass  # saved concurrently by another process
+    with engine.connect() as conn:
+        dictionaries = _read_dictionaries(conn)
+    _registry.load(dictionaries, dictionary_id)
+
+
+def compress_text(text: str) -> str:
+    dictionary_id, dictionary = _registry.current()
+    frame = zstandard.ZstdCompressor(
+        level=SNAPSHOT_COMPRESSION_LEVEL, dict_data=dictionary
+    ).compress(text.encode("utf-8"))
+    compressed = f"{_PREFIX}{dictionary_id}:{base64.b85encode(frame).decode()}"
+    # short values can come out larger, keep those plain
+    return compressed if len(compressed) < len(text) else text
+
+
+def decompress_text(value: str) -> str:
+    if not value.startswith(_PREFIX):
+        return value
+    dictionary_id, frame = value[len(_PREFIX) :].split(":", 1)
+    return (
+        zstandard.ZstdDecompressor(dict_data=_registry.get(dictionary_id))
+        .decompress(base64.b85decode(frame))
+        .decode("utf-8")
+    )
+
+
+class CompressedString(TypeDecorator):
+    """
+    String column that is written zstd compressed when SNAPSHOT_COMPRESSION=zstd.
+    Reads handle both compressed and plain values, so rows can be migrated
+    gradually with `python -m tasks.backfill compressed_snapshots`.
+    """
+
+    impl = String
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or SNAPSHOT_COMPRESSION != "zstd":
+            return value
+        return compress_text(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return value
+        return decompress_text(value)
@@ -1,9 +1,13 @@
+import os
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 from config import (
     DATABASE_URL,
+    ASYNC_DATABASE_URL,
     DB_POOL_SIZE,
     DB_MAX_OVERFLOW,
     DB_POOL_RECYCLE,
@@ -17,12 +21,52 @@ engine = create_engine(
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+_ASYNC_DRIVERS = {
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def _async_url(url: str) -> str:
+    """Map the sync DATABASE_URL onto its async driver (asyncpg or aiosqlite)."""
+    scheme, sep, rest = url.partition("://")
+    return f"{_ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+
+def _create_async_engine():
+    url = make_url(ASYNC_DATABASE_URL or _async_url(DATABASE_URL))
+    if url.get_backend_name() == "sqlite":
+        # sqlite (tests/dev) uses SQLAlchemy's default pool for aiosqlite
+        return create_async_engine(url)
+    return create_async_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+
+
+async_engine = _create_async_engine()
+# expire_on_commit=False so attributes stay readable after commit without implicit IO
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
 
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 
 def init_db():
-    # Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
+    """Bring the schema up to date, same as `alembic upgrade head` from backend/."""
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(os.path.join(_BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(_BACKEND_DIR, "migrations"))
+    command.upgrade(config, "head")
 
 
 def get_db():
@@ -31,3 +75,12 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def close_async_db():
+    await async_engine.dispose()
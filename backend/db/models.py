@@ -1,8 +1,21 @@
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Boolean
+from sqlalchemy import (
+    Column,
+    String,
+    Integer,
+    DateTime,
+    ForeignKey,
+    Boolean,
+    Float,
+    JSON,
+    Index,
+    LargeBinary,
+    UniqueConstraint,
+)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
 from config import CREDITS_DEFAULT
+from db.compression import CompressedString
 from db.database import Base
 
 
@@ -32,7 +45,10 @@ class State(TimestampMixin, Base):
     flag_svg = Column(String, nullable=False)
     description = Column(String, nullable=False)
     turn_in_progress = Column(Boolean, nullable=False, default=False)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    # newest StateSnapshot.id, maintained when a turn is committed so the
+    # leaderboard can skip a max(date) scan over all snapshots
+    latest_snapshot_id = Column(Integer, nullable=True, index=True)
 
     # Relationships
     user = relationship("User", back_populates="states")
@@ -41,16 +57,97 @@ class State(TimestampMixin, Base):
 
 class StateSnapshot(TimestampMixin, Base):
     __tablename__ = "state_snapshots"
+    __table_args__ = (Index("ix_state_snapshots_state_id_date", "state_id", "date"),)
 
     id = Column(Integer, primary_key=True, index=True)
     date = Column(String, nullable=False)  # Format: YYYY-MM
     state_id = Column(Integer, ForeignKey("states.id"), nullable=False)
 
-    markdown_state = Column(String, nullable=False)
-    markdown_future_events = Column(String, nullable=False)
-    markdown_future_events_policy = Column(String, nullable=False)
-    markdown_delta = Column(String, nullable=True)
-    markdown_delta_report = Column(String, nullable=True)
+    markdown_state = Column(CompressedString, nullable=False)
+    markdown_future_events = Column(CompressedString, nullable=False)
+    markdown_future_events_policy = Column(CompressedString, nullable=False)
+    markdown_delta = Column(CompressedString, nullable=True)
+    markdown_delta_report = Column(CompressedString, nullable=True)
+
+    # With SNAPSHOT_STORAGE=delta, markdown_state is empty and the changed
+    # sections since delta_base_id are stored instead, see db/snapshots.py
+    markdown_state_delta = Column(CompressedString, nullable=True)
+    delta_base_id = Column(Integer, ForeignKey("state_snapshots.id"), nullable=True)
+    delta_depth = Column(Integer, nullable=True)  # deltas since the last keyframe
+
+    # parse_state(markdown_state) computed once at write time, see PARSED_STATE_VERSION
+    parsed_state = Column(JSON, nullable=True)
+    parsed_state_version = Column(Integer, nullable=True)
 
     # Relationship to State
     state = relationship("State", back_populates="snapshots")
+
+
+class TurnJob(TimestampMixin, Base):
+    """A persisted create-state or next-year simulation, run by tasks/turn_jobs.py."""
+
+    __tablename__ = "turn_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # create_state or next_turn
+    status = Column(
+        String, nullable=False, default="pending", index=True
+    )  # pending, running, completed, failed
+    step = Column(String, nullable=True)  # last completed step
+    message = Column(String, nullable=True)  # user facing progress message
+    state_id = Column(Integer, ForeignKey("states.id"), nullable=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    snapshot_id = Column(Integer, ForeignKey("state_snapshots.id"), nullable=True)
+
+    payload = Column(JSON, nullable=False)  # request inputs
+    checkpoint = Column(JSON, nullable=False, default=dict)  # completed step outputs
+    error = Column(String, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    worker_id = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class JobEvent(TimestampMixin, Base):
+    """Progress events of a TurnJob, replayed to clients that reconnect."""
+
+    __tablename__ = "job_events"
+    __table_args__ = (UniqueConstraint("job_id", "seq"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("turn_jobs.id"), nullable=False, index=True)
+    seq = Column(Integer, nullable=False)  # per-job event id, starting at 1
+    type = Column(String, nullable=False)  # job_created, state_created, status, error, complete
+    data = Column(JSON, nullable=False, default=dict)
+
+
+class StateMetric(Base):
+    """One numeric value of a snapshot's parsed state, indexed for ranking and charts."""
+
+    __tablename__ = "state_metrics"
+    __table_args__ = (
+        UniqueConstraint("snapshot_id", "key"),
+        Index("ix_state_metrics_ranking", "key", "latest", "value"),
+        Index("ix_state_metrics_series", "state_id", "key", "date"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    snapshot_id = Column(
+        Integer, ForeignKey("state_snapshots.id"), nullable=False, index=True
+    )
+    state_id = Column(Integer, ForeignKey("states.id"), nullable=False)
+    date = Column(String, nullable=False)  # Format: YYYY-MM, copied from the snapshot
+    # dot-notation key path, e.g. people.people_metrics.total_population
+    key = Column(String, nullable=False)
+    value = Column(Float, nullable=False)
+    unit = Column(String, nullable=True)
+    # whether snapshot_id is its state's latest_snapshot_id
+    latest = Column(Boolean, nullable=False, default=False)
+
+
+class CompressionDictionary(TimestampMixin, Base):
+    """zstd dictionaries used by CompressedString columns, keyed by content hash."""
+
+    __tablename__ = "compression_dictionaries"
+
+    id = Column(String, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
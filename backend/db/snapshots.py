@@ -0,0 +1,121 @@
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import json
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from config import (
+    SNAPSHOT_STORAGE,
+    SNAPSHOT_KEYFRAME_INTERVAL,
+    SNAPSHOT_MARKDOWN_CACHE_SIZE,
+)
+from db.models import StateSnapshot
+
+# Snapshot storage modes (SNAPSHOT_STORAGE):
+# - full: every snapshot stores its whole markdown_state
+# - delta: snapshots store the "# Dimension" sections that changed since the
+#   previous snapshot, with a full keyframe every SNAPSHOT_KEYFRAME_INTERVAL
+#   snapshots so a read applies at most that many deltas
+
+# Reconstructed markdown by snapshot id, snapshot markdown never changes once written
+_markdown_cache: "OrderedDict[int, str]" = OrderedDict()
+
+
+def _split_sections(markdown: str) -> List[Tuple[str, str]]:
+    """Split markdown into (key, chunk) per h1 section, chunks join back to the input."""
+    sections = []
+    seen = {}
+    header, lines = "", []
+    for line in markdown.splitlines(keepends=True):
+        if line.startswith("# ") and lines:
+            sections.append((header, "".join(lines)))
+            lines = []
+        if line.startswith("# "):
+            header = line.strip()
+            # repeated headers get their own keys so sections never collide
+            seen[header] = seen.get(header, 0) + 1
+            if seen[header] > 1:
+                header = f"{header} ({seen[header]})"
+        lines.append(line)
+    if lines:
+        sections.append((header, "".join(lines)))
+    return sections
+
+
+def encode_delta(base_markdown: str, markdown: str) -> list:
+    """[key, chunk] per section of markdown, with chunk None where base has it unchanged."""
+    base_sections = dict(_split_sections(base_markdown))
+    return [
+        [key, None if base_sections.get(key) == chunk else chunk]
+        for key, chunk in _split_sections(markdown)
+    ]
+
+
+def apply_delta(base_markdown: str, delta: list) -> str:
+    base_sections = dict(_split_sections(base_markdown))
+    return "".join(
+        chunk if chunk is not None else base_sections[key] for key, chunk in delta
+    )
+
+
+def set_markdown_state(
+    snapshot: StateSnapshot,
+    markdown: str,
+    previous: Optional[StateSnapshot] = None,
+    previous_markdown: Optional[str] = None,
+):
+    """Store markdown as the snapshot's state, as a delta on previous when enabled."""
+    depth = (previous.delta_depth or 0) + 1 if previous is not None else 0
+    if (
+        SNAPSHOT_STORAGE != "delta"
+        or previous is None
+        or depth >= SNAPSHOT_KEYFRAME_INTERVAL
+    ):
+        snapshot.markdown_state = markdown
+        snapshot.markdown_state_delta = None
+        snapshot.delta_base_id = None
+        snapshot.delta_depth = 0
+        return
+    # markdown_state is not nullable, the content lives in markdown_state_delta
+    snapshot.markdown_state = ""
+    delta = encode_delta(previous_markdown, markdown)
+    snapshot.markdown_state_delta = json.dumps(delta)
+    snapshot.delta_base_id = previous.id
+    snapshot.delta_depth = depth
+
+
+def _cache_markdown(snapshot_id: int, markdown: str):
+    _markdown_cache[snapshot_id] = markdown
+    _markdown_cache.move_to_end(snapshot_id)
+    while len(_markdown_cache) > SNAPSHOT_MARKDOWN_CACHE_SIZE:
+        _markdown_cache.popitem(last=False)
+
+
+def _reconstruct(base: StateSnapshot, chain: List[StateSnapshot]) -> str:
+    """Apply the deltas in chain (newest first) on top of base."""
+    markdown = _markdown_cache.get(base.id)
+    if markdown is None:
+        markdown = base.markdown_state
+    for snapshot in reversed(chain):
+        markdown = apply_delta(markdown, json.loads(snapshot.markdown_state_delta))
+        _cache_markdown(snapshot.id, markdown)
+    return markdown
+
+
+async def get_markdown_state(db: AsyncSession, snapshot: StateSnapshot) -> str:
+    """The snapshot's full markdown_state, rebuilt from its keyframe if it is a delta."""
+    chain = []
+    while snapshot.delta_base_id is not None and snapshot.id not in _markdown_cache:
+        chain.append(snapshot)
+        snapshot = await db.get(StateSnapshot, snapshot.delta_base_id)
+    return _reconstruct(snapshot, chain)
+
+
+def get_markdown_state_sync(db: Session, snapshot: StateSnapshot) -> str:
+    """get_markdown_state for sync sessions (backfills)."""
+    chain = []
+    while snapshot.delta_base_id is not None and snapshot.id not in _markdown_cache:
+        chain.append(snapshot)
+        snapshot = db.get(StateSnapshot, snapshot.delta_base_id)
+    return _reconstruct(snapshot, chain)
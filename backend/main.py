@@ -1,31 +1,42 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi_cache import FastAPICache
-from fastapi_cache.backends.inmemory import InMemoryBackend
 import asyncio
 
-from db.database import init_db
-from tasks.tasks import reset_stuck_states
-from routers import auth, states, stripe
+from db.compression import load_compression_dictionaries
+from db.database import init_db, close_async_db
+from model.providers import close_provider
+from tasks.tasks import reset_stuck_states, prune_job_events
+from tasks.turn_jobs import run_turn_workers
+from config import TURN_WORKER_MODE
+from routers import auth, states, stripe, metrics, llm
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Initialize in-memory cache
-    FastAPICache.init(InMemoryBackend(), prefix="fastapi-cache")
+    # Before any snapshot is read or written, CompressedString does no I/O itself
+    await load_compression_dictionaries()
 
     # Start background task to reset stuck states
     reset_task = asyncio.create_task(reset_stuck_states())
+    background_tasks = [reset_task, asyncio.create_task(prune_job_events())]
+
+    # Run turn simulations in this process unless they run in a separate worker
+    if TURN_WORKER_MODE == "inprocess":
+        background_tasks.append(asyncio.create_task(run_turn_workers()))
 
     yield
 
-    # Cleanup background task
-    reset_task.cancel()
-    try:
-        await reset_task
-    except asyncio.CancelledError:
-        pass
+    # Cleanup background tasks
+    for task in background_tasks:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    await close_provider()
+    await close_async_db()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -48,6 +59,8 @@ app.add_middleware(
 app.include_router(auth.router)
 app.include_router(states.router)
 app.include_router(stripe.router)
+app.include_router(metrics.router)
+app.include_router(llm.router)
 
 if __name__ == "__main__":
     import uvicorn
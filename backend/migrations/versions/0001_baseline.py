@@ -0,0 +1,191 @@
+"""Baseline schema
+
+Databases created before migrations (by Base.metadata.create_all and the old
+add-missing-columns step in init_db) may be missing any of these tables or
+nullable columns, so this creates whatever is missing instead of assuming an
+empty database.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 00:00:00
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _timestamps():
+    return [
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+    ]
+
+
+def _create_or_update_table(name: str, *elements, indexes=()):
+    """Create the table, or add its missing nullable columns if it already exists."""
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(name):
+        op.create_table(name, *elements)
+    else:
+        existing = {c["name"] for c in inspector.get_columns(name)}
+        for column in elements:
+            if isinstance(column, sa.Column) and column.name not in existing:
+                if not column.nullable:
+                    raise RuntimeError(f"Can't add NOT NULL {name}.{column.name}")
+                # without the foreign key, SQLite can't ALTER in constraints
+                op.add_column(name, sa.Column(column.name, column.type, nullable=True))
+    for index_name, columns, unique in indexes:
+        op.create_index(index_name, name, columns, unique=unique, if_not_exists=True)
+
+
+def upgrade() -> None:
+    _create_or_update_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String(), nullable=False),
+        sa.Column("email", sa.String(), nullable=True, unique=True),
+        sa.Column("credits", sa.Integer(), nullable=False),
+        *_timestamps(),
+        indexes=[
+            ("ix_users_id", ["id"], False),
+            ("ix_users_username", ["username"], True),
+        ],
+    )
+    _create_or_update_table(
+        "states",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("date", sa.String(), nullable=False),
+        sa.Column("flag_svg", sa.String(), nullable=False),
+        sa.Column("description", sa.String(), nullable=False),
+        sa.Column("turn_in_progress", sa.Boolean(), nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("latest_snapshot_id", sa.Integer(), nullable=True),
+        *_timestamps(),
+        indexes=[
+            ("ix_states_id", ["id"], False),
+            ("ix_states_latest_snapshot_id", ["latest_snapshot_id"], False),
+        ],
+    )
+    _create_or_update_table(
+        "state_snapshots",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("date", sa.String(), nullable=False),
+        sa.Column("state_id", sa.Integer(), sa.ForeignKey("states.id"), nullable=False),
+        sa.Column("markdown_state", sa.String(), nullable=False),
+        sa.Column("markdown_future_events", sa.String(), nullable=False),
+        sa.Column("markdown_future_events_policy", sa.String(), nullable=False),
+        sa.Column("markdown_delta", sa.String(), nullable=True),
+        sa.Column("markdown_delta_report", sa.String(), nullable=True),
+        sa.Column("markdown_state_delta", sa.String(), nullable=True),
+        sa.Column(
+            "delta_base_id",
+            sa.Integer(),
+            sa.ForeignKey("state_snapshots.id"),
+            nullable=True,
+        ),
+        sa.Column("delta_depth", sa.Integer(), nullable=True),
+        sa.Column("parsed_state", sa.JSON(), nullable=True),
+        sa.Column("parsed_state_version", sa.Integer(), nullable=True),
+        *_timestamps(),
+        indexes=[("ix_state_snapshots_id", ["id"], False)],
+    )
+    _create_or_update_table(
+        "state_metrics",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(
+            "snapshot_id",
+            sa.Integer(),
+            sa.ForeignKey("state_snapshots.id"),
+            nullable=False,
+        ),
+        sa.Column("state_id", sa.Integer(), sa.ForeignKey("states.id"), nullable=False),
+        sa.Column("date", sa.String(), nullable=False),
+        sa.Column("key", sa.String(), nullable=False),
+        sa.Column("value", sa.Float(), nullable=False),
+        sa.Column("unit", sa.String(), nullable=True),
+        sa.Column("latest", sa.Boolean(), nullable=False),
+        sa.UniqueConstraint("snapshot_id", "key"),
+        indexes=[
+            ("ix_state_metrics_snapshot_id", ["snapshot_id"], False),
+            ("ix_state_metrics_ranking", ["key", "latest", "value"], False),
+            ("ix_state_metrics_series", ["state_id", "key", "date"], False),
+        ],
+    )
+    _create_or_update_table(
+        "turn_jobs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("kind", sa.String(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("step", sa.String(), nullable=True),
+        sa.Column("message", sa.String(), nullable=True),
+        sa.Column("state_id", sa.Integer(), sa.ForeignKey("states.id"), nullable=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column(
+            "snapshot_id",
+            sa.Integer(),
+            sa.ForeignKey("state_snapshots.id"),
+            nullable=True,
+        ),
+        sa.Column("payload", sa.JSON(), nullable=False),
+        sa.Column("checkpoint", sa.JSON(), nullable=False),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("worker_id", sa.String(), nullable=True),
+        sa.Column("lease_expires_at", sa.DateTime(timezone=True), nullable=True),
+        *_timestamps(),
+        indexes=[
+            ("ix_turn_jobs_id", ["id"], False),
+            ("ix_turn_jobs_status", ["status"], False),
+            ("ix_turn_jobs_state_id", ["state_id"], False),
+        ],
+    )
+    _create_or_update_table(
+        "job_events",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(
+            "job_id", sa.Integer(), sa.ForeignKey("turn_jobs.id"), nullable=False
+        ),
+        sa.Column("seq", sa.Integer(), nullable=False),
+        sa.Column("type", sa.String(), nullable=False),
+        sa.Column("data", sa.JSON(), nullable=False),
+        *_timestamps(),
+        sa.UniqueConstraint("job_id", "seq"),
+        indexes=[
+            ("ix_job_events_id", ["id"], False),
+            ("ix_job_events_job_id", ["job_id"], False),
+        ],
+    )
+    _create_or_update_table(
+        "compression_dictionaries",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        *_timestamps(),
+    )
+
+
+def downgrade() -> None:
+    for table in [
+        "compression_dictionaries",
+        "job_events",
+        "turn_jobs",
+        "state_metrics",
+        "state_snapshots",
+        "states",
+        "users",
+    ]:
+        op.drop_table(table)
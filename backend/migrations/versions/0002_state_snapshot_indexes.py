@@ -0,0 +1,44 @@
+"""Index state_snapshots by (state_id, date) and states by user_id
+
+Every snapshot read filters on state_id and orders by date: history listing,
+the turn loader's recent history, advice's latest snapshot. Postgres builds the
+indexes concurrently so existing tables stay writable.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:00
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_state_snapshots_state_id_date",
+            "state_snapshots",
+            ["state_id", "date"],
+            if_not_exists=True,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_states_user_id",
+            "states",
+            ["user_id"],
+            if_not_exists=True,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_states_user_id", table_name="states")
+    op.drop_index("ix_state_snapshots_state_id_date", table_name="state_snapshots")
@@ -0,0 +1,69 @@
+"""Point states.latest_snapshot_id at each state's newest snapshot
+
+0001 added the column as NULL and the leaderboard, /states/latest and the
+metric rankings only join on it, so existing states would disappear until
+someone ran the latest_snapshots backfill by hand. Also flips
+state_metrics.latest to match.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 00:00:00
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+states = sa.table(
+    "states", sa.column("id", sa.Integer), sa.column("latest_snapshot_id", sa.Integer)
+)
+state_snapshots = sa.table(
+    "state_snapshots",
+    sa.column("id", sa.Integer),
+    sa.column("state_id", sa.Integer),
+    sa.column("date", sa.String),
+)
+state_metrics = sa.table(
+    "state_metrics",
+    sa.column("snapshot_id", sa.Integer),
+    sa.column("latest", sa.Boolean),
+)
+
+
+def upgrade() -> None:
+    # newest by (date, id), as the latest_snapshots backfill picks it
+    latest_snapshot_id = (
+        sa.select(state_snapshots.c.id)
+        .where(state_snapshots.c.state_id == states.c.id)
+        .order_by(state_snapshots.c.date.desc(), state_snapshots.c.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    op.execute(
+        sa.update(states)
+        .where(states.c.latest_snapshot_id.is_(None))
+        .values(latest_snapshot_id=latest_snapshot_id)
+    )
+    is_latest = state_metrics.c.snapshot_id.in_(
+        sa.select(states.c.latest_snapshot_id).where(
+            states.c.latest_snapshot_id.is_not(None)
+        )
+    )
+    op.execute(
+        sa.update(state_metrics)
+        .where(state_metrics.c.latest != is_latest)
+        .values(latest=is_latest)
+    )
+
+
+def downgrade() -> None:
+    # the ids are derived data, leaving them in place is harmless
+    pass
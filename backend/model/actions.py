@@ -1,10 +1,14 @@
-from typing import List, Tuple
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 from datetime import datetime
+from contextlib import nullcontext
+import functools
 import random
-import asyncio
 import re
 
-from model.providers import OpenAIProvider
+from config import LLM_DIMENSION_ATTEMPTS, SIMULATE_CHANGED_DIMENSIONS_ONLY
+from model.providers import OnDelta, get_provider
+from model.growth import next_year_baseline
+from model.llm_cache import bypass_llm_cache
 from model.state_config import StateDimension, DIMENSIONS
 from model.action_schemas import (
     STATE_CONFIG_FORMAT_TEMPLATE,
@@ -14,9 +18,16 @@ from model.action_schemas import (
 )
 from model.parsing import (
     extract_codeblock,
-    extract_markdown_section,
     parse_events_output,
+    parse_state,
+    section_index,
+    split_changed_dimensions,
+    validate_state,
 )
+from utils.dag import DagNode, run_dag
+
+# Called with (dimension title, completed count, total) as dimensions finish
+OnDimensionDone = Callable[[str, int, int], Awaitable[None]]
 
 
 def _format_month_date(date: str) -> str:
@@ -34,8 +45,70 @@ def _format_questions(questions: List[Tuple[str, int]]) -> str:
     return "\n".join([f"- {q[0]}: {value_to_text[q[1]]}" for q in questions])
 
 
+async def _gather_dimensions(
+    generate: Callable[[StateDimension, Dict[str, str]], Awaitable[str]],
+    dimensions: List[StateDimension] = DIMENSIONS,
+    follow_requirements: bool = False,
+    on_dimension_done: Optional[OnDimensionDone] = None,
+) -> List[str]:
+    """
+    Generate dimensions concurrently, re-running the ones that fail.
+
+    `generate` gets the outputs of the dimensions generated so far (by title).
+    With follow_requirements, a dimension waits for the dimensions in its
+    diff_requires_dimensions (if they are being generated) so it can use them.
+    on_dimension_done is called with (title, completed count, total) as each finishes.
+    Outputs that fail to parse are retried, ones that don't match their template
+    are logged.
+
+    Returns outputs in the same order as `dimensions`.
+    """
+
+    async def run(dimension: StateDimension, outputs: Dict[str, str]) -> str:
+        for attempt in range(LLM_DIMENSION_ATTEMPTS):
+            # a cached response may be the one that failed to parse, so skip it on retry
+            with bypass_llm_cache() if attempt else nullcontext():
+                try:
+                    output = await generate(dimension, outputs)
+                    problems = validate_state(parse_state(output))
+                except Exception as e:
+                    print(f"{dimension.title} failed on attempt {attempt}: {e!r}")
+                    if attempt == LLM_DIMENSION_ATTEMPTS - 1:
+                        raise
+                    continue
+                if problems:
+                    print(f"{dimension.title} does not match its template: {problems}")
+                return output
+
+    titles = [dimension.title for dimension in dimensions]
+    completed = 0
+
+    async def on_done(node: DagNode, _):
+        nonlocal completed
+        completed += 1
+        if on_dimension_done:
+            await on_dimension_done(node.name, completed, len(titles))
+
+    outputs = await run_dag(
+        [
+            DagNode(
+                dimension.title,
+                functools.partial(run, dimension),
+                requires=(
+                    [t for t in dimension.diff_requires_dimensions if t in titles]
+                    if follow_requirements
+                    else []
+                ),
+            )
+            for dimension in dimensions
+        ],
+        on_done=on_done,
+    )
+    return [outputs[title] for title in titles]
+
+
 async def generate_state_flag(state: str) -> str:
-    provider = OpenAIProvider()
+    provider = get_provider()
     prompt = f"""
 Given this fictional state, generate a flag for it. 
 
@@ -72,7 +145,7 @@ Reply with:
 
 async def generate_state_description(state: str) -> str:
     dimensions = ", ".join([d.title for d in DIMENSIONS])
-    provider = OpenAIProvider()
+    provider = get_provider()
     prompt = f"""
 Given this fictional state, generate a detailed technical ~4-sentence wikipedia-style description of the state.
 - Do not include specific numerical values (lean towards qualitative descriptions)
@@ -89,7 +162,7 @@ Given this fictional state, generate a detailed technical ~4-sentence wikipedia-
 async def _generate_state_dimension(
     date: str, overview: str, dimension: StateDimension
 ) -> str:
-    provider = OpenAIProvider()
+    provider = get_provider()
     seed_assumptions = "\n".join([f"- {s}" for s in dimension.seed_assumptions])
     other_dimensions = ", ".join(
         [d.title for d in DIMENSIONS if d.title != dimension.title]
@@ -120,7 +193,7 @@ You are defining specifically {dimension.title}, other experts will define {othe
 
 Reply with the <dimension-template> in a markdown codeblock. Carefully consider the <state-overview> and <assumptions> to provide a highly accurate response.
 """.strip()
-    output = await provider.generate_medium_reasoning(prompt)
+    output = await provider.generate_medium_reasoning(prompt, hedge=True, cache=True)
     md_output = extract_codeblock(output)
     return f"# {dimension.title}\n{md_output}"
 
@@ -130,10 +203,13 @@ def _simplify_user_input(name: str, max_length: int = 30) -> str:
     return repr(name[:max_length])
 
 
-async def generate_state(
-    date: str, name: str, questions: List[Tuple[str, int]]
-) -> Tuple[str, str]:
-    provider = OpenAIProvider()
+async def generate_state_overview(
+    date: str,
+    name: str,
+    questions: List[Tuple[str, int]],
+    on_delta: Optional[OnDelta] = None,
+) -> str:
+    provider = get_provider()
     dimensions = ", ".join([d.title for d in DIMENSIONS])
     seed_assumptions = []
     for dimension in DIMENSIONS:
@@ -161,26 +237,35 @@ Reply with (plain text):
 - Include how the <values> and time period above influence EACH of the dimensions ({dimensions}) of the state
 - Include balanced strengths and flaws and what makes them unique in the world.
 """.strip()
-    overview_output = await provider.generate_high_reasoning(prompt)
+    overview_output = await provider.generate_high_reasoning(prompt, on_delta=on_delta)
     print("--- overview output ---")
     print(overview_output)
     print("--- ---")
+    return overview_output
 
-    dimension_outputs = await asyncio.gather(
-        *[
-            _generate_state_dimension(date, overview_output, dimension)
-            for dimension in DIMENSIONS
-        ]
+
+async def generate_state_dimensions(
+    date: str, overview: str, on_dimension_done: Optional[OnDimensionDone] = None
+) -> str:
+    dimension_outputs = await _gather_dimensions(
+        lambda dimension, _: _generate_state_dimension(date, overview, dimension),
+        on_dimension_done=on_dimension_done,
     )
-    state_output = "\n\n".join(dimension_outputs).strip()
+    return "\n\n".join(dimension_outputs).strip()
+
 
+async def generate_state(
+    date: str, name: str, questions: List[Tuple[str, int]]
+) -> Tuple[str, str]:
+    overview_output = await generate_state_overview(date, name, questions)
+    state_output = await generate_state_dimensions(date, overview_output)
     return overview_output, state_output
 
 
 async def generate_diff_report(
     start_date: datetime, end_date: datetime, prev_state: str, diff_output: str
 ) -> str:
-    provider = OpenAIProvider()
+    provider = get_provider()
     new_state_report_prompt = f"""
 Given this fictional state and the following events between {start_date} and {end_date}, provide a report on the changes in the state.
 
@@ -227,7 +312,7 @@ def _sample_event(events: List[Tuple[float, str]]) -> str:
 async def generate_future_policy_suggestion(
     start_date: datetime, end_date: datetime, prev_state: str, events: str
 ) -> str:
-    provider = OpenAIProvider()
+    provider = get_provider()
     prompt = f"""
 Given this fictional <state> from {start_date} to {end_date} and the following events, provide a policy suggestion for the government to enact.
 
@@ -269,7 +354,7 @@ async def generate_future_events(
             for date, events in historical_events
         ]
     )
-    provider = OpenAIProvider()
+    provider = get_provider()
     dimensions = ", ".join([d.title for d in DIMENSIONS])
     prompt = f"""
 Given this fictional <state> from {start_date} to {end_date}, provide a list of potential random events that could occur within the next year and will require the government to make decisions.
@@ -314,12 +399,30 @@ async def _generate_next_state_dimension(
     start_date: datetime,
     end_date: datetime,
     prev_state: str,
+    baseline: str,
     dimension: StateDimension,
     diff_output: str,
+    updated_dimensions: Optional[Dict[str, str]] = None,
 ) -> str:
+    """
+    baseline is next_year_baseline(prev_state), the dimension is simulated from it.
+    updated_dimensions holds required dimensions already simulated for end_date
+    (by title), the prompt shows those instead of their previous values.
+    """
+    updated_dimensions = updated_dimensions or {}
     prev_state_dims_text = ""
-    for dim in dimension.diff_requires_dimensions + [dimension.title]:
-        prev_state_dimension = extract_markdown_section(prev_state, dim)
+    for dim in dimension.diff_requires_dimensions:
+        if dim in updated_dimensions:
+            updated_dimension = section_index(updated_dimensions[dim]).section(dim)
+            prev_state_dims_text += f"""
+<updated-state-dimension on="{end_date}" title="{dim}">
+```markdown
+{updated_dimension}
+```
+</updated-state-dimension>
+"""
+            continue
+        prev_state_dimension = section_index(prev_state).section(dim)
         prev_state_dims_text += f"""
 <prev-state-dimension on="{start_date}" title="{dim}">
 ```markdown
@@ -327,10 +430,20 @@ async def _generate_next_state_dimension(
 ```
 </prev-state-dimension>
 """
-    provider = OpenAIProvider()
+    baseline_dimension = section_index(baseline).section(dimension.title)
+    prev_state_dims_text += f"""
+<baseline-state-dimension on="{end_date}" title="{dimension.title}">
+```markdown
+{baseline_dimension}
+```
+</baseline-state-dimension>
+"""
+    provider = get_provider()
     new_state_dimension_prompt = f"""
 Given this fictional state and the following events between {start_date} and {end_date}, provide an updated <dimension-template> for {dimension.title} in {end_date} with the changes from <state-recent-changes> applied.
 
+<baseline-state-dimension> is "{dimension.title}" on {start_date} with a year of its annual growth rates already applied (e.g. to population and GDP) and compositions normalized to 100%.
+
 {prev_state_dims_text.strip()}
 
 <state-recent-changes>
@@ -347,20 +460,20 @@ Given this fictional state and the following events between {start_date} and {en
 
 Reply with:
 (1) Brief discussion for how <state-recent-changes> impacted "{dimension.title}" at a high level and how for aspects not mentioned in the update, natural changes you would expect based on the state's previous values.
-(2) For ALL OTHER values in "{dimension.title}", determine the before/after changes.
+(2) For the values in "{dimension.title}" that <state-recent-changes> affects, determine the before/after changes, starting from <baseline-state-dimension>.
 - For all values directly mentioned or clearly implied in <state-recent-changes>, use those values for the after values.
 - Reflect on how the recent events mentioned interact with parts of the dimension (e.g. if we banned or removed something, what metrics should logically also change?)
-- ALL non-zero numerical fields should change at least slightly over the course of a year. Nothing remains the same.
-- Consider both the recent events mentioned and year-over-year variance to compute to new values.
-- Compute the new values major metrics like GDP and population (specific to the "{dimension.title}") using <state-recent-changes> and known growth rates. Show your reasoning.
-- There should also be natural changes in population and resource counts over the course of a year and natural random changes in production, distributions, infrastructure, facilities, and other metrics.
+- Growth rates are already applied in <baseline-state-dimension>, only adjust grown values (e.g. GDP, population) where <state-recent-changes> changes them. Show your reasoning.
+- There should also be natural changes in resource counts over the course of a year and natural random changes in production, distributions, infrastructure, facilities, and other metrics.
 (4) The new <template> in a markdown codeblock.
-- ALL non-zero numerical fields should change
+- Start from the values in <baseline-state-dimension> and apply the changes from (2), the growth already in it must not be applied again.
 - Systems, features, and policies should update as needed to reflect any updated policies.
 - For challenges, lean towards adding a challenge and only remove a challenge if it's no longer relevant.
 - For policies (if any), lean towards adding a policy and only remove a policy if it's no longer relevant.
 """.strip()
-    raw_output = await provider.generate_medium_reasoning(new_state_dimension_prompt)
+    raw_output = await provider.generate_medium_reasoning(
+        new_state_dimension_prompt, hedge=True
+    )
     print(f"--- diff {dimension.title} ---")
     print(raw_output)
     print("--- ---")
@@ -371,7 +484,7 @@ Reply with:
 async def generate_reasonable_policy_event(raw_policy: str) -> str:
     if not raw_policy:
         return "Government Events: None"
-    provider = OpenAIProvider()
+    provider = get_provider()
     prompt = f"""
 Your are a moderator for a game that allows users to play the role of a government leader.
 
@@ -410,7 +523,7 @@ Government Events: <-- formatted policy events, State ... -->
 
 Rephrase <user-action> into a valid policy event and reply with their action formatted as <output-format> exactly with a markdown codeblock. It should start with "Government Events:" and be in one line in paragraph format.
 """.strip()
-    raw_output = await provider.generate_medium_reasoning(prompt)
+    raw_output = await provider.generate_medium_reasoning(prompt, cache=True)
     try:
         output = extract_codeblock(raw_output).replace('"', "")
     except Exception as e:
@@ -421,15 +534,22 @@ Rephrase <user-action> into a valid policy event and reply with their action for
     return output
 
 
-async def generate_next_state(
+async def generate_next_state_diff(
     start_date: datetime,
     end_date: datetime,
     prev_state: str,
     events: str,
     reasonable_policy: str,
     historical_events: List[Tuple[str, List[str]]] = None,
-) -> Tuple[str, str, str]:
-    provider = OpenAIProvider()
+    on_delta: Optional[OnDelta] = None,
+) -> Tuple[str, str, Optional[List[str]]]:
+    """
+    Simulate the year's changes.
+
+    Returns the diff, the formatted events and the titles of the dimensions the
+    diff changed (None if the model didn't list them).
+    """
+    provider = get_provider()
 
     historical_events_str = "No notable historical events"
     if historical_events:
@@ -499,27 +619,84 @@ Reply with (in plain text):
 - Noting how the top challenges in each dimension have evolved.
 - Noting how values might have grown relative to estimated growth rates and how the growth rates themselves might have changed.
 - Include relative changes to GDP, growth rates, population, and other metrics.
+4. Finally, a json codeblock listing the dimensions with any material change (from events, policies, or shifts beyond their usual growth rates):
+```json
+{{"changed_dimensions": ["<-- dimension title -->", ...]}}
+```
+- Use the exact dimension titles ({dimensions_str}).
+- Only leave out a dimension if nothing about it changes beyond its usual growth rates.
 """.strip()
-    diff_output = await provider.generate_high_reasoning(diff_prompt)
+    diff_output = await provider.generate_high_reasoning(diff_prompt, on_delta=on_delta)
     print("---")
     print(diff_output)
     print("---")
+    diff_output, changed_dimensions = split_changed_dimensions(
+        diff_output, [d.title for d in DIMENSIONS]
+    )
+    return diff_output, events_str, changed_dimensions
 
-    dimension_outputs = await asyncio.gather(
-        *[
-            _generate_next_state_dimension(
-                start_date, end_date, prev_state, dimension, diff_output
-            )
+
+def _carry_forward_dimension(baseline: str, dimension: StateDimension) -> str:
+    """The dimension as next_year_baseline grew it, for dimensions left unchanged."""
+    section = section_index(baseline).section(dimension.title).strip()
+    return f"# {dimension.title}\n{section}"
+
+
+async def generate_next_state_dimensions(
+    start_date: datetime,
+    end_date: datetime,
+    prev_state: str,
+    diff_output: str,
+    changed_dimensions: Optional[List[str]] = None,
+    on_dimension_done: Optional[OnDimensionDone] = None,
+) -> str:
+    baseline = next_year_baseline(prev_state)
+    simulated = DIMENSIONS
+    if SIMULATE_CHANGED_DIMENSIONS_ONLY and changed_dimensions is not None:
+        simulated = [
+            dimension
             for dimension in DIMENSIONS
+            if dimension.title in changed_dimensions
+            or dimension.always_simulate
+            or not section_index(prev_state).section(dimension.title).strip()
         ]
+        skipped = [d.title for d in DIMENSIONS if d not in simulated]
+        print(f"Carrying forward unchanged dimensions: {skipped}")
+    simulated_outputs = await _gather_dimensions(
+        lambda dimension, outputs: _generate_next_state_dimension(
+            start_date, end_date, prev_state, baseline, dimension, diff_output, outputs
+        ),
+        simulated,
+        follow_requirements=True,
+        on_dimension_done=on_dimension_done,
     )
+    outputs = dict(zip([d.title for d in simulated], simulated_outputs))
+    dimension_outputs = [
+        outputs.get(dimension.title) or _carry_forward_dimension(baseline, dimension)
+        for dimension in DIMENSIONS
+    ]
+    return "\n\n".join(dimension_outputs).strip()
 
-    new_state_output = "\n\n".join(dimension_outputs).strip()
+
+async def generate_next_state(
+    start_date: datetime,
+    end_date: datetime,
+    prev_state: str,
+    events: str,
+    reasonable_policy: str,
+    historical_events: List[Tuple[str, List[str]]] = None,
+) -> Tuple[str, str, str]:
+    diff_output, events_str, changed_dimensions = await generate_next_state_diff(
+        start_date, end_date, prev_state, events, reasonable_policy, historical_events
+    )
+    new_state_output = await generate_next_state_dimensions(
+        start_date, end_date, prev_state, diff_output, changed_dimensions
+    )
     return diff_output, new_state_output, events_str
 
 
 async def generate_state_advice(state: str, question: str, events: str) -> str:
-    provider = OpenAIProvider()
+    provider = get_provider()
     prompt = f"""
 You are an expert advisor for the government of a fictional country. Given the user's question (the head of state), provide advice for their policies and upcoming events.
 
@@ -544,5 +721,5 @@ Format policy advice in an imperative format:
 
 Be brief, technical, and concise. If writing out suggested policies, limit it to the top 3 most effective ones.
 """.strip()
-    output = await provider.generate_low_reasoning(prompt)
+    output = await provider.generate_low_reasoning(prompt, cache=True)
     return extract_codeblock(output, fix_markdown=False)
@@ -0,0 +1,126 @@
+import re
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from model.parsing import STATE_SCHEMA
+from model.state_config import DIMENSIONS
+
+# The mechanical part of a turn: every "- Field: value" number of a state is
+# extracted into one array, growth_fields are grown by a year of their rate and
+# composition percentages are rescaled to sum to 100%, and only the lines whose
+# numbers changed are rewritten. The LLM then starts each dimension from this
+# baseline instead of working out the growth itself.
+
+_FIELD_RE = re.compile(r"- ([^:\n]+):(.*)")
+_NUMBER_RE = re.compile(r"\d+(?:,\d{3})*(?:\.\d+)?")
+_RATE_RE = re.compile(r"\s*([-+]?\d+(?:\.\d+)?)\s*%")
+_PERCENTAGE_RE = re.compile(r"\s*(\d+(?:\.\d+)?)\s*%\s*(?:<!--.*?-->\s*)?")
+# compositions this close to 100% are left as written (one decimal rounding)
+_COMPOSITION_TOLERANCE = 0.5
+
+_GROWTH_FIELDS = {dimension.title: dimension.growth_fields for dimension in DIMENSIONS}
+
+
+def _format_like(number: str, value: float) -> str:
+    """value formatted like number (thousands separators, decimals)."""
+    decimals = len(number.split(".")[1]) if "." in number else 0
+    if decimals and value < 1000:
+        # e.g. "$2.7 billion", one decimal would round away a year of growth,
+        # counts written as integers (e.g. "950 people") stay integers
+        decimals = max(decimals, 2)
+    return f"{value:,.{decimals}f}" if "," in number else f"{value:.{decimals}f}"
+
+
+def _format_percentage(value: float) -> str:
+    # as _normalize_percentages writes them, without the "%"
+    value = round(float(value), 1)
+    return f"{int(value)}" if value.is_integer() else f"{value:.1f}"
+
+
+def next_year_baseline(markdown: str) -> str:
+    """
+    A state (or some of its "# Dimension" sections) a year on as far as its own
+    numbers go: growth_fields grown by their annual rate and compositions
+    normalized like _fix_compositions does. Other lines are left untouched.
+    """
+    lines = markdown.split("\n")
+    # per metric: line index, (start, end) of the number in the line, value and
+    # composition group (-1 if none)
+    rows: List[int] = []
+    spans: List[Tuple[int, int]] = []
+    values: List[float] = []
+    groups: List[int] = []
+    # (dimension title, field) -> (metric index, value text)
+    fields: Dict[Tuple[str, str], Tuple[int, str]] = {}
+
+    dimension = None
+    group, group_count, group_items = -1, 0, 0
+    for i, line in enumerate(lines):
+        if line.startswith("#"):
+            if line.startswith("# "):
+                dimension = line[2:].strip()
+            group, group_items = -1, 0
+            if STATE_SCHEMA.is_composition_heading(line):
+                group, group_count = group_count, group_count + 1
+            continue
+        # like _fix_compositions, a blank line after the items ends a composition
+        if group >= 0 and group_items and not line.strip():
+            group = -1
+            continue
+        match = _FIELD_RE.fullmatch(line)
+        if not match:
+            continue
+        if group >= 0 and "%" in line:
+            group_items += 1
+            colon = line.rindex(":") + 1
+            percentage = _PERCENTAGE_RE.fullmatch(line, colon)
+            if percentage:
+                rows.append(i)
+                spans.append(percentage.span(1))
+                values.append(float(percentage.group(1)))
+                groups.append(group)
+                continue
+        number = _NUMBER_RE.search(line, match.start(2))
+        if not number:
+            continue
+        fields.setdefault(
+            (dimension, match.group(1).strip()), (len(rows), match.group(2))
+        )
+        rows.append(i)
+        spans.append(number.span())
+        values.append(float(number.group().replace(",", "")))
+        groups.append(-1)
+    if not rows:
+        return markdown
+
+    values = np.array(values)
+    factors = np.ones(len(values))
+    for title, growth_fields in _GROWTH_FIELDS.items():
+        for field, rate_field in growth_fields.items():
+            if (title, field) not in fields or (title, rate_field) not in fields:
+                continue
+            rate = _RATE_RE.match(fields[(title, rate_field)][1])
+            if rate:
+                factors[fields[(title, field)][0]] = 1 + float(rate.group(1)) / 100
+
+    groups = np.array(groups)
+    members = groups >= 0
+    if members.any():
+        totals = np.bincount(
+            groups[members], weights=values[members], minlength=group_count
+        )
+        scales = np.ones(group_count)
+        off = (totals > 0) & (np.abs(totals - 100) > _COMPOSITION_TOLERANCE)
+        scales[off] = 100 / totals[off]
+        factors[members] *= scales[groups[members]]
+
+    new_values = values * factors
+    for index in np.flatnonzero(factors != 1):
+        i, (start, end) = rows[index], spans[index]
+        if groups[index] >= 0:
+            formatted = _format_percentage(new_values[index])
+        else:
+            formatted = _format_like(lines[i][start:end], new_values[index])
+        lines[i] = lines[i][:start] + formatted + lines[i][end:]
+    return "\n".join(lines)
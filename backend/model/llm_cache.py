@@ -0,0 +1,179 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from config import (
+    LLM_CACHE_MODE,
+    LLM_CACHE_BACKEND,
+    LLM_CACHE_PATH,
+    LLM_CACHE_TTL,
+    LLM_CACHE_MAX_ENTRIES,
+)
+
+# Cache modes:
+# - off: never cache
+# - cache: read-through cache (with TTL) for calls that opt in with cache=True
+# - record: call the LLM for every request and store every response
+# - replay: serve every request from stored responses, never call the LLM
+CACHE_MODES = ("off", "cache", "record", "replay")
+
+# Set while retrying so a cached (but unusable) response isn't served again
+_bypass_llm_cache: ContextVar[bool] = ContextVar("bypass_llm_cache", default=False)
+
+
+class LLMCacheMissError(Exception):
+    """Raised in replay mode when a prompt has no recorded response."""
+
+
+@contextmanager
+def bypass_llm_cache():
+    token = _bypass_llm_cache.set(True)
+    try:
+        yield
+    finally:
+        _bypass_llm_cache.reset(token)
+
+
+def cache_key(model: str, reasoning_effort: Optional[str], prompt: str) -> str:
+    payload = json.dumps([model, reasoning_effort, prompt])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCacheBackend(ABC):
+    @abstractmethod
+    async def get(self, key: str, ttl: Optional[int]) -> Optional[str]: ...
+
+    @abstractmethod
+    async def set(self, key: str, value: str): ...
+
+
+class MemoryLLMCache(LLMCacheBackend):
+    """In-process LRU cache."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+
+    async def get(self, key: str, ttl: Optional[int]) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, created_at = entry
+        if ttl and time.time() - created_at > ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str):
+        self._entries[key] = (value, time.time())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class SQLiteLLMCache(LLMCacheBackend):
+    """On-disk cache, shared by all worker processes and reusable for replays."""
+
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_llm_cache_accessed_at "
+                "ON llm_cache (accessed_at)"
+            )
+
+    def _get(self, key: str, ttl: Optional[int]) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if ttl and now - row[1] > ttl:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute(
+                "UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            return row[0]
+
+    def _set(self, key: str, value: str):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            # evict least recently used rows past the size limit
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY accessed_at DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    async def get(self, key: str, ttl: Optional[int]) -> Optional[str]:
+        return await asyncio.to_thread(self._get, key, ttl)
+
+    async def set(self, key: str, value: str):
+        await asyncio.to_thread(self._set, key, value)
+
+
+class LLMCache:
+    def __init__(self, backend: LLMCacheBackend, mode: str, ttl: int):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown LLM cache mode {mode!r}")
+        self.backend = backend
+        self.mode = mode
+        self.ttl = ttl
+
+    def _applies(self, cacheable: bool) -> bool:
+        if self.mode in ("record", "replay"):
+            return True
+        return self.mode == "cache" and cacheable and not _bypass_llm_cache.get()
+
+    async def lookup(self, key: str, cacheable: bool) -> Optional[str]:
+        if not self._applies(cacheable) or self.mode == "record":
+            return None
+        if self.mode == "replay":
+            value = await self.backend.get(key, ttl=None)
+            if value is None:
+                raise LLMCacheMissError(f"No recorded LLM response for {key}")
+            return value
+        return await self.backend.get(key, ttl=self.ttl)
+
+    async def store(self, key: str, value: str, cacheable: bool):
+        if self._applies(cacheable) and self.mode != "replay":
+            await self.backend.set(key, value)
+
+
+_cache: Optional[LLMCache] = None
+
+
+def get_llm_cache() -> LLMCache:
+    global _cache
+    if _cache is None:
+        if LLM_CACHE_BACKEND == "sqlite":
+            backend = SQLiteLLMCache(LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES)
+        else:
+            backend = MemoryLLMCache(LLM_CACHE_MAX_ENTRIES)
+        _cache = LLMCache(backend, mode=LLM_CACHE_MODE, ttl=LLM_CACHE_TTL)
+    return _cache
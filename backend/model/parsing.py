@@ -1,7 +1,15 @@
 import re
+import json
+import functools
 import markdown_to_json
+from dataclasses import dataclass, field
 from typing import Any, List, Tuple, Dict, Optional
 
+from model.state_config import DIMENSIONS
+
+# Bump when parse_state output changes so stored snapshot.parsed_state gets re-parsed
+PARSED_STATE_VERSION = 2
+
 
 def extract_codeblock(text: str, fix_markdown: bool = True) -> str:
     match = re.search(r"```[a-zA-Z]+\n(.*?)```", text, re.DOTALL)
@@ -38,53 +46,82 @@ def extract_markdown_section(markdown_text: str, h1_header_name: str) -> str:
         ```
         extract_markdown_section(text, "Header1") -> "\n- a\n- b\n- c\n"
     """
-    # Split the text into lines
-    lines = markdown_text.splitlines()
-
-    # Find the target header
-    target_header = f"# {h1_header_name}"
+    return section_index(markdown_text).section(h1_header_name)
 
-    # Variables to track extraction
-    content = []
-    is_capturing = False
-
-    for line in lines:
-        # Check if we've hit the target header
-        if line.strip() == target_header:
-            is_capturing = True
-            continue
 
-        # Stop capturing if we hit another h1 header
-        if line.strip().startswith("# ") and is_capturing:
-            break
+class SectionIndex:
+    """
+    The h1 sections of a markdown document, indexed in one pass over its lines, so
+    looking up each dimension of a state doesn't rescan the whole document.
 
-        # Capture content if we're in the right section
-        if is_capturing:
-            content.append(line)
+    Follows extract_markdown_section's rules: a section starts at the first line
+    that is "# Title" once stripped and runs until the next line starting with "# "
+    (repeats of its own header line are skipped over).
+    """
 
-    # Join captured lines and return
-    return "\n".join(content).strip() + "\n"
+    def __init__(self, markdown_text: str):
+        self.markdown_text = markdown_text
+        # title -> (start, end) character offsets of the section's content
+        self.spans: Dict[str, Tuple[int, int]] = {}
+        self._sections: Dict[str, str] = {}
+        title = start = None
+        position = 0
+        for line in markdown_text.splitlines(keepends=True):
+            stripped = line.strip()
+            if stripped.startswith("# ") and stripped[2:] != title:
+                if title is not None:
+                    self.spans.setdefault(title, (start, position))
+                title, start = stripped[2:], position + len(line)
+            position += len(line)
+        if title is not None:
+            self.spans.setdefault(title, (start, position))
+
+    def section(self, title: str) -> str:
+        """Content under "# {title}", the same as extract_markdown_section."""
+        if title not in self._sections:
+            start, end = self.spans.get(title, (0, 0))
+            header = f"# {title}"
+            lines = [
+                line
+                for line in self.markdown_text[start:end].splitlines()
+                if line.strip() != header
+            ]
+            self._sections[title] = "\n".join(lines).strip() + "\n"
+        return self._sections[title]
+
+
+@functools.lru_cache(maxsize=32)
+def section_index(markdown_text: str) -> SectionIndex:
+    """SectionIndex of a document, shared by every lookup on the same text."""
+    return SectionIndex(markdown_text)
+
+
+_HTML_COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+_NUMBER_RE = re.compile(r"\$?(\d+(?:,\d{3})*(?:\.\d+)?)\s*(.*)")
+_PERCENT_RE = re.compile(r"(\d+)%")
+_NON_KEY_CHARS_RE = re.compile(r"[^a-zA-Z ]")
+
+# Multipliers for different scales
+_MULTIPLIERS = {
+    "trillion": 1e12,
+    "billion": 1e9,
+    "million": 1e6,
+    "thousand": 1e3,
+    "k": 1e3,
+}
 
 
 def _md_to_json(markdown: str) -> dict:
     # Remove HTML comments
-    markdown = re.sub(r"<!--.*?-->", "", markdown, flags=re.DOTALL)
+    markdown = _HTML_COMMENT_RE.sub("", markdown)
     return markdown_to_json.dictify(markdown)
 
 
 def _parse_unit(value: str) -> dict:
     result = {"raw": value, "unit": None, "value": value}
+    multipliers = _MULTIPLIERS
 
-    # Define multipliers for different scales
-    multipliers = {
-        "trillion": 1e12,
-        "billion": 1e9,
-        "million": 1e6,
-        "thousand": 1e3,
-        "k": 1e3,
-    }
-
-    if match := re.match(r"\$?(\d+(?:,\d{3})*(?:\.\d+)?)\s*(.*)", value):
+    if match := _NUMBER_RE.match(value):
         value_part, unit = match.groups()
         cleaned_value = value_part.replace(",", "")
         numeric_value = float(cleaned_value)
@@ -102,7 +139,7 @@ def _parse_unit(value: str) -> dict:
             "unit": unit or "units",
             "raw": value,
         }
-    elif match := re.match(r"(\d+)%", value):
+    elif match := _PERCENT_RE.match(value):
         numeric_value = int(match.group(1))
         result = {
             "value": numeric_value,
@@ -114,9 +151,10 @@ def _parse_unit(value: str) -> dict:
     return result
 
 
+@functools.lru_cache(maxsize=4096)
 def _clean_key(key: str) -> str:
     key = key.lower()
-    key = re.sub(r"[^a-zA-Z ]", "", key).strip().replace(" ", "_")
+    key = _NON_KEY_CHARS_RE.sub("", key).strip().replace(" ", "_")
     return key
 
 
@@ -130,9 +168,24 @@ _PARAGRAPH_SUFFIXES = [
 ]
 
 _LIST_PARAGRAPH_SUFFIXES = [" Headlines", " Quotes"]
+_PARAGRAPH_SUFFIX_TUPLE = tuple(_PARAGRAPH_SUFFIXES)
+_LIST_PARAGRAPH_SUFFIX_TUPLE = tuple(_LIST_PARAGRAPH_SUFFIXES)
 
 
-def _parse_kv(data: Any, parent_key: str = "") -> Any:
+def _section_kind(section: Optional["SchemaSection"], parent_key: str) -> str:
+    if section is not None:
+        return section.kind
+    # headings the templates don't define (e.g. added by the LLM) go by their name
+    if parent_key.endswith(_PARAGRAPH_SUFFIX_TUPLE):
+        return "text"
+    if parent_key.endswith(_LIST_PARAGRAPH_SUFFIX_TUPLE):
+        return "list"
+    return "fields"
+
+
+def _parse_kv(
+    data: Any, parent_key: str = "", section: Optional["SchemaSection"] = None
+) -> Any:
     """
     Recursively parse the data, converting "Key: Value" strings into proper key-value pairs
 
@@ -140,23 +193,27 @@ def _parse_kv(data: Any, parent_key: str = "") -> Any:
     - Dictionary values
     - List values
     - "Key: Value" strings
+
+    `section` is the template schema section data was parsed from, if any.
     """
     if isinstance(data, dict):
         new_data = {}
         for key, value in data.items():
-            # Recursively parse nested structures
-            parsed_value = _parse_kv(value, key)
-
             # Handle string keys with colons
+            new_key = key
             if isinstance(key, str) and ":" in key:
-                key = key.split(":", 1)[0].strip()
+                new_key = key.split(":", 1)[0].strip()
+            new_key = _clean_key(new_key)
 
-            new_data[_clean_key(key)] = parsed_value
+            # Recursively parse nested structures
+            child = section.sections.get(new_key) if section else None
+            new_data[new_key] = _parse_kv(value, key, child)
         return new_data
 
-    elif isinstance(data, list) and not parent_key.endswith(tuple(_PARAGRAPH_SUFFIXES)):
+    kind = _section_kind(section, parent_key)
+    if isinstance(data, list) and kind != "text":
         # Handle lists by parsing each element and merge dicts
-        parsed_items = [_parse_kv(item, parent_key) for item in data]
+        parsed_items = [_parse_kv(item, parent_key, section) for item in data]
 
         # If all items are dicts, merge them
         if all(isinstance(item, dict) for item in parsed_items):
@@ -167,13 +224,7 @@ def _parse_kv(data: Any, parent_key: str = "") -> Any:
 
         return parsed_items
 
-    elif (
-        isinstance(data, str)
-        and ":" in data
-        and not parent_key.endswith(
-            tuple(_PARAGRAPH_SUFFIXES + _LIST_PARAGRAPH_SUFFIXES)
-        )
-    ):
+    elif isinstance(data, str) and ":" in data and kind == "fields":
         # Parse "Key: Value" strings
         key, value = data.split(":", 1)
         return {_clean_key(key.strip()): {**_parse_unit(value.strip()), "key": key}}
@@ -184,42 +235,537 @@ def _parse_kv(data: Any, parent_key: str = "") -> Any:
     return data
 
 
-def _get_nested_value(data: dict, key_path: str):
-    """Helper function to get nested dictionary value using dot notation."""
-    keys = key_path.split(".")
-    current = data
-    for key in keys:
-        if not isinstance(current, dict):
-            return None
-        if key not in current:
-            return None
-        current = current[key]
-    return current
+@functools.lru_cache(maxsize=256)
+def _compile_projection(only_keys: Tuple[str, ...]) -> dict:
+    """
+    Merge dot-notation key paths into a tree of keys, where None marks a path's
+    last key (its whole value is kept), e.g. ("a.b", "a.c.d") -> {"a": {"b": None,
+    "c": {"d": None}}}.
+    """
+    tree = {}
+    for key_path in only_keys:
+        *parents, leaf = key_path.split(".")
+        current = tree
+        for key in parents:
+            child = current.get(key, {})
+            if child is None:
+                # already kept whole by a shorter path
+                break
+            current = current.setdefault(key, child)
+        else:
+            current[leaf] = None
+    return tree
 
 
-def _filter_dict_by_keys(data: dict, only_keys: List[str]) -> dict:
-    """Filter dictionary to only include specified nested keys."""
+def _project(data: dict, tree: dict) -> dict:
     result = {}
-    for key_path in only_keys:
-        keys = key_path.split(".")
-        current = result
-        value = _get_nested_value(data, key_path)
-        if value is not None:
-            # Build nested structure
-            for key in keys[:-1]:
-                current = current.setdefault(key, {})
-            current[keys[-1]] = value
+    for key, children in tree.items():
+        value = data.get(key)
+        if value is None:
+            continue
+        if children is None:
+            result[key] = value
+        elif isinstance(value, dict):
+            projected = _project(value, children)
+            if projected:
+                result[key] = projected
     return result
 
 
+def _filter_dict_by_keys(data: dict, only_keys: List[str]) -> dict:
+    """Filter dictionary to only include specified nested keys."""
+    return _project(data, _compile_projection(tuple(only_keys)))
+
+
+def filter_state_keys(data: dict, only_keys: Optional[List[str]] = None) -> dict:
+    """Project an already parsed state down to the given dot-notation key paths."""
+    if only_keys:
+        return _filter_dict_by_keys(data, only_keys)
+    return data
+
+
+def _parse_state_legacy(state_markdown: str) -> dict:
+    return _parse_kv(_md_to_json(state_markdown), "", STATE_SCHEMA.root)
+
+
 def parse_state(state_markdown: str, only_keys: Optional[List[str]] = None) -> dict:
-    data = _md_to_json(state_markdown)
-    data = _parse_kv(data)
+    """
+    Parse a markdown state into nested dicts of "Key: Value" fields. With only_keys
+    (dot-notation key paths), only the sections holding them are parsed.
+    """
     if only_keys:
-        data = _filter_dict_by_keys(data, only_keys)
+        data = _parse_state_projected(state_markdown, only_keys)
+        if data is not None:
+            return data
+    try:
+        data = _parse_state_fast(state_markdown)
+    except _UnsupportedMarkdown:
+        data = _parse_state_legacy(state_markdown)
+    return filter_state_keys(data, only_keys)
+
+
+# --- fast parser ---
+#
+# State documents are always "# Dimension" / "## Section" headings over "- Key: Value"
+# lists and a few paragraphs, so instead of building a CommonMark tree, this reads
+# those lines directly and produces the same output as _parse_state_legacy. Any
+# line that could mean something else in CommonMark (indentation, other list
+# markers, code fences, quotes, HTML, ...) raises _UnsupportedMarkdown and the
+# document goes through _parse_state_legacy instead. `python -m tasks.check_parser`
+# compares the two.
+
+
+class _UnsupportedMarkdown(Exception):
+    pass
+
+
+# first characters of lines that may start a block other than a paragraph
+_BLOCK_START_CHARS = frozenset("#>-*+`~<=_[ \t")
+_ORDERED_ITEM_RE = re.compile(r"\d{1,9}[.)](?: |$)")
+_HEADING_RE = re.compile(r"(#{1,6})(?: +(.*))?$")
+
+
+def _check_text_line(line: str):
+    if (
+        not line
+        or line[0] in _BLOCK_START_CHARS
+        or (line[0].isdigit() and _ORDERED_ITEM_RE.match(line))
+    ):
+        raise _UnsupportedMarkdown(line)
+
+
+def _read_blocks(markdown: str) -> list:
+    """
+    Split markdown into ("h", level, text), ("p", text) and ("l", items) blocks,
+    the way CommonMark would for the lines it accepts.
+    """
+    if "\r" in markdown or "\t" in markdown:
+        raise _UnsupportedMarkdown("line endings or tabs")
+    blocks = []
+    paragraph = None  # lines of the open paragraph
+    items = None  # items of the open list
+    blank_lines = 0
+    for line in markdown.split("\n"):
+        if not line.strip(" "):
+            blank_lines += 1
+            if paragraph is not None:
+                blocks.append(("p", "\n".join(paragraph)))
+                paragraph = None
+            if items is not None and blank_lines >= 2:
+                # two blank lines end a list
+                items = None
+            continue
+        if line[0] == "#":
+            match = _HEADING_RE.match(line)
+            text = match.group(2) if match else None
+            if not text or text.rstrip(" ").endswith("#"):
+                raise _UnsupportedMarkdown(line)
+            if paragraph is not None:
+                blocks.append(("p", "\n".join(paragraph)))
+                paragraph = None
+            items = None
+            blocks.append(("h", len(match.group(1)), text.lstrip(" ")))
+        elif line.startswith("- "):
+            item = line[2:]
+            _check_text_line(item)
+            if paragraph is not None:
+                blocks.append(("p", "\n".join(paragraph)))
+                paragraph = None
+            if items is None:
+                items = []
+                blocks.append(("l", items))
+            items.append(item)
+        else:
+            _check_text_line(line)
+            if items is not None and not blank_lines:
+                # lazy continuation of the last item
+                items[-1] += "\n" + line
+            elif paragraph is not None:
+                paragraph.append(line)
+            else:
+                items = None
+                paragraph = [line]
+        blank_lines = 0
+    if paragraph is not None:
+        blocks.append(("p", "\n".join(paragraph)))
+    return blocks
+
+
+def _nest_blocks(blocks: list, level: int) -> Any:
+    """Group blocks under their headings, like markdown_to_json's CMarkASTNester."""
+    if not any(block[0] == "h" and block[1] == level for block in blocks):
+        return blocks
+    sections = {}
+    children = None
+    for block in blocks:
+        if block[0] == "h" and block[1] == level:
+            # a repeated heading replaces the earlier one's content, in its place
+            children = sections[block[2]] = []
+        elif children is not None:
+            children.append(block)
+    return {
+        heading: _nest_blocks(children, level + 1)
+        for heading, children in sections.items()
+    }
+
+
+def _kv_string(data: str, kind: str) -> Any:
+    if ":" in data and kind == "fields":
+        key, value = data.split(":", 1)
+        return {_clean_key(key.strip()): {**_parse_unit(value.strip()), "key": key}}
     return data
 
 
+def _kv_value(
+    node: Any, parent_key: str, section: Optional["SchemaSection"] = None
+) -> Any:
+    """_parse_kv of the value markdown_to_json would render for node."""
+    if isinstance(node, dict):
+        data = {}
+        for key, children in node.items():
+            new_key = _clean_key(key.split(":", 1)[0].strip() if ":" in key else key)
+            child = section.sections.get(new_key) if section else None
+            data[new_key] = _kv_value(children, key, child)
+        return data
+    kind = _section_kind(section, parent_key)
+    if not node:
+        return _kv_string("", kind)
+    if node[0][0] != "l":
+        # only a leading list is kept as a list, anything else is joined as text
+        text = "\n\n".join(str(block[-1]) for block in node)
+        return _kv_string(text, kind)
+    items = node[0][1]
+    if kind == "text":
+        return "\n".join(["- " + item for item in items])
+    parsed_items = [_kv_string(item, kind) for item in items]
+    if all(isinstance(item, dict) for item in parsed_items):
+        merged = {}
+        for item in parsed_items:
+            merged.update(item)
+        return merged
+    return parsed_items
+
+
+def _parse_state_fast(state_markdown: str) -> dict:
+    if "<!--" in state_markdown:
+        state_markdown = _HTML_COMMENT_RE.sub("", state_markdown)
+    blocks = _read_blocks(state_markdown)
+    levels = [block[1] for block in blocks if block[0] == "h"]
+    if not levels:
+        raise _UnsupportedMarkdown("no headings")
+    return _kv_value(_nest_blocks(blocks, min(levels)), "", STATE_SCHEMA.root)
+
+
+# --- projection ---
+#
+# With only_keys, parse_state cuts the document down to the heading lines on the way
+# to each requested key path plus the section holding it, and parses just that. As
+# sections always end at a heading line, the cut document has the same blocks in
+# those sections as the whole one. Headings are only looked for inside the sections
+# a key path goes through. The patterns match from the newline before a line (the
+# document gets one prepended), which is much faster than "^" with re.MULTILINE.
+
+# headings of level 1..n, by n: inside a level n-1 section these are its subsections
+_SECTION_HEADING_RES = [None] + [
+    re.compile(rf"\n#{{1,{level}}}(?: [^\n]*)?(?![^\n])") for level in range(1, 7)
+]
+# lines that could turn other lines into (or out of) headings: indented headings,
+# setext underlines, code fences, HTML blocks and link reference definitions
+# (tabs and "\r" are checked separately)
+_UNSAFE_TO_CUT_RE = re.compile(r"\n(?: {1,3}#|```|~~~|[=<\[])")
+
+
+class _Section:
+    __slots__ = ("level", "start", "line_end", "end", "_children")
+
+    def __init__(self, level: int, start: int, line_end: int, end: int):
+        self.level = level
+        # heading line, then the section's content up to the next heading at this
+        # level or above
+        self.start = start
+        self.line_end = line_end
+        self.end = end
+        # None until computed, False if two children clean to the same key
+        self._children = None
+
+    def children(self, markdown: str) -> Optional[Dict[str, "_Section"]]:
+        """
+        Sections one level down by key, None if two of them clean to the same key
+        (which one the full parse keeps depends on the raw heading texts).
+        """
+        if self._children is None:
+            children = {}
+            if self.level < 6:
+                level = self.level + 1
+                matches = list(
+                    _SECTION_HEADING_RES[level].finditer(
+                        markdown, self.line_end, self.end
+                    )
+                )
+                for i, match in enumerate(matches):
+                    text = match.group()[level + 1 :].lstrip(" ")
+                    key = _clean_key(
+                        text.split(":", 1)[0].strip() if ":" in text else text
+                    )
+                    if key in children:
+                        children = False
+                        break
+                    end = matches[i + 1].start() if i + 1 < len(matches) else self.end
+                    children[key] = _Section(level, match.start() + 1, match.end(), end)
+            self._children = children
+        return self._children if self._children is not False else None
+
+
+def _cut_ranges(
+    markdown: str, root: _Section, key_path: str
+) -> Optional[List[Tuple[int, int]]]:
+    """Ranges of the markdown needed for key_path, [] if it isn't in the document."""
+    ranges = []
+    section = root
+    for key in key_path.split("."):
+        children = section.children(markdown)
+        if children is None:
+            return None
+        if not children:
+            # nothing nested below here, the whole section is one value
+            break
+        if key not in children:
+            return []
+        if section is not root:
+            ranges.append((section.start, section.line_end))
+        section = children[key]
+    if section is root:
+        return None
+    ranges.append((section.start, section.end))
+    return ranges
+
+
+def _parse_state_projected(state_markdown: str, only_keys: List[str]) -> Optional[dict]:
+    """parse_state with only_keys, or None if the document can't be cut safely."""
+    if "<!--" in state_markdown:
+        state_markdown = _HTML_COMMENT_RE.sub("", state_markdown)
+    markdown = "\n" + state_markdown
+    if "\r" in markdown or "\t" in markdown or _UNSAFE_TO_CUT_RE.search(markdown):
+        return None
+    root = _Section(0, 0, 0, len(markdown))
+    if not root.children(markdown):
+        # no h1 headings (the document nests from a deeper level) or repeated ones
+        return None
+    ranges = []
+    for key_path in only_keys:
+        key_ranges = _cut_ranges(markdown, root, key_path)
+        if key_ranges is None:
+            return None
+        ranges.extend(key_ranges)
+    if not ranges:
+        return {}
+    # sections nest, so a range starting inside the previous one is contained in it
+    pieces = []
+    end = -1
+    for start, range_end in sorted(ranges, key=lambda r: (r[0], -r[1])):
+        if start >= end:
+            pieces.append(markdown[start:range_end].rstrip("\n"))
+            end = range_end
+    try:
+        data = _parse_state_fast("\n".join(pieces))
+    except _UnsupportedMarkdown:
+        return None
+    return filter_state_keys(data, only_keys)
+
+
+# --- template schema ---
+#
+# The DIMENSIONS templates compiled (once, at import) into the sections and
+# "- Key: {Placeholder}" fields they define, keyed by the same dot-notation key
+# paths parse_state produces. Parsing, _fix_compositions and validate_state look a
+# key up here instead of guessing what it is from its name.
+
+# placeholders whose values parse to numbers
+_NUMERIC_PLACEHOLDERS = {"Number", "Percentage", "AmountUSD", "Megawatts"}
+# sample values used to work out the unit parse_state reports for a field
+_UNIT_SAMPLES = {"Number": "1", "Percentage": "1%"}
+_PLACEHOLDER_RE = re.compile(r"\{(\w+)\}")
+_FIELD_VALUE_RE = re.compile(r"\{(\w+)\}(.*)")
+
+
+@dataclass(frozen=True)
+class SchemaField:
+    path: str
+    title: str
+    # e.g. "Percentage", None for values written out in the template
+    placeholder: Optional[str]
+    # unit parse_state reports for a well formed value, None when it varies
+    unit: Optional[str]
+
+
+@dataclass
+class SchemaSection:
+    path: str
+    title: str
+    # "fields" ("- Key: Value" items or subsections), "text" (free paragraphs) or
+    # "list" (items kept as strings, e.g. headlines)
+    kind: str
+    # percentages that should sum to 100%, see _fix_compositions
+    composition: bool = False
+    fields: Dict[str, "SchemaField"] = field(default_factory=dict)
+    # field for keys the LLM picks, e.g. "- {Religion}: {Percentage}"
+    any_field: Optional[SchemaField] = None
+    sections: Dict[str, "SchemaSection"] = field(default_factory=dict)
+
+
+@dataclass
+class StateSchema:
+    root: SchemaSection
+    # every section and fixed-key field, by key path
+    sections: Dict[str, SchemaSection]
+    fields: Dict[str, SchemaField]
+    # cleaned titles of composition sections
+    composition_keys: frozenset
+
+    def get_field(self, key_path: str) -> Optional[SchemaField]:
+        if key_path in self.fields:
+            return self.fields[key_path]
+        parent, _, _ = key_path.rpartition(".")
+        section = self.sections.get(parent)
+        return section.any_field if section else None
+
+    def is_composition_heading(self, line: str) -> bool:
+        title = _HTML_COMMENT_RE.sub("", line).lstrip("#").split(":", 1)[0]
+        return _clean_key(title.strip()) in self.composition_keys
+
+
+def _compile_field(path: str, title: str, value: str) -> SchemaField:
+    placeholder = unit = None
+    if match := _FIELD_VALUE_RE.fullmatch(value):
+        placeholder, rest = match.groups()
+        if placeholder in _UNIT_SAMPLES:
+            unit = _parse_unit(_UNIT_SAMPLES[placeholder] + rest)["unit"]
+    return SchemaField(path=path, title=title, placeholder=placeholder, unit=unit)
+
+
+def _compile_section(schema: StateSchema, title: str, children: Any, parent: str):
+    title = title.strip()
+    key = _clean_key(title.split(":", 1)[0].strip() if ":" in title else title)
+    path = f"{parent}.{key}" if parent else key
+    section = SchemaSection(path=path, title=title, kind="fields")
+    schema.sections[path] = section
+    if isinstance(children, dict):
+        for child_title, grandchildren in children.items():
+            child = _compile_section(schema, child_title, grandchildren, path)
+            section.sections[child.path.rsplit(".", 1)[-1]] = child
+        return section
+
+    items = [item for block in children if block[0] == "l" for item in block[1]]
+    if not items:
+        section.kind = "text"
+    elif not any(":" in item for item in items):
+        section.kind = "list"
+    for item in items:
+        if ":" not in item:
+            continue
+        field_title, value = (part.strip() for part in item.split(":", 1))
+        if _PLACEHOLDER_RE.search(field_title):
+            section.any_field = _compile_field(f"{path}.*", field_title, value)
+            continue
+        schema_field = _compile_field(
+            f"{path}.{_clean_key(field_title)}", field_title, value
+        )
+        section.fields[_clean_key(field_title)] = schema_field
+        schema.fields[schema_field.path] = schema_field
+    section.composition = "Composition" in title and section.kind == "fields"
+    return section
+
+
+def compile_schema(dimensions) -> StateSchema:
+    """Compile state dimension templates into a StateSchema."""
+    schema = StateSchema(
+        root=SchemaSection(path="", title="", kind="fields"),
+        sections={},
+        fields={},
+        composition_keys=frozenset(),
+    )
+    document = "\n\n".join(f"# {d.title}\n{d.template}" for d in dimensions)
+    blocks = _read_blocks(_HTML_COMMENT_RE.sub("", document))
+    for title, children in _nest_blocks(blocks, 1).items():
+        section = _compile_section(schema, title, children, "")
+        schema.root.sections[section.path] = section
+    schema.composition_keys = frozenset(
+        section.path.rsplit(".", 1)[-1]
+        for section in schema.sections.values()
+        if section.composition
+    )
+    return schema
+
+
+STATE_SCHEMA = compile_schema(DIMENSIONS)
+
+
+def _validate_section(value: Any, section: SchemaSection, problems: List[str]):
+    if section.kind == "text":
+        if not isinstance(value, str):
+            problems.append(f"{section.path}: expected text")
+        return
+    if section.kind == "list":
+        if not isinstance(value, list):
+            problems.append(f"{section.path}: expected a list")
+        return
+    if not isinstance(value, dict):
+        problems.append(f"{section.path}: expected fields")
+        return
+    for key, child in section.sections.items():
+        if key not in value:
+            problems.append(f"{child.path}: missing")
+        else:
+            _validate_section(value[key], child, problems)
+    for key, schema_field in section.fields.items():
+        if key not in value:
+            problems.append(f"{schema_field.path}: missing")
+    for key, item in value.items():
+        schema_field = section.fields.get(key, section.any_field)
+        if schema_field is None or key in section.sections:
+            continue
+        path = f"{section.path}.{key}"
+        if not isinstance(item, dict) or "value" not in item:
+            problems.append(f"{path}: expected a value")
+        elif schema_field.placeholder in _NUMERIC_PLACEHOLDERS and not isinstance(
+            item["value"], (int, float)
+        ):
+            problems.append(f"{path}: {item['raw']!r} is not a number")
+        elif schema_field.unit and item["unit"] != schema_field.unit:
+            problems.append(
+                f"{path}: unit {item['unit']!r}, expected {schema_field.unit!r}"
+            )
+
+
+def validate_state(data: dict) -> List[str]:
+    """
+    Check a parsed state against the templates, returning problems such as missing
+    fields or non-numeric values. Only the dimensions present in data are checked.
+    """
+    problems = []
+    for key, section in STATE_SCHEMA.root.sections.items():
+        if key in data:
+            _validate_section(data[key], section, problems)
+    return problems
+
+
+def extract_metrics(
+    data: dict, parent_key: str = ""
+) -> List[Tuple[str, float, Optional[str]]]:
+    """Collect the numeric "Key: Value" leaves of a parsed state as (key path, value, unit)."""
+    metrics = []
+    for key, value in data.items():
+        if not isinstance(value, dict):
+            continue
+        key_path = f"{parent_key}.{key}" if parent_key else key
+        if "raw" in value and "value" in value:
+            if isinstance(value["value"], (int, float)):
+                metrics.append((key_path, float(value["value"]), value["unit"]))
+        else:
+            metrics.extend(extract_metrics(value, key_path))
+    return metrics
+
+
 def _parse_events_section(section: str) -> List[Tuple[float, str]]:
     """Parse a section of events into a list of (probability, event) tuples."""
     events = []
@@ -262,6 +808,29 @@ def parse_events_output(output: str) -> Dict[str, List[Tuple[float, str]]]:
     return categories
 
 
+def split_changed_dimensions(
+    diff_output: str, titles: List[str]
+) -> Tuple[str, Optional[List[str]]]:
+    """
+    Remove the trailing ```json {"changed_dimensions": [...]} block from the diff.
+
+    Returns the diff without it and the changed titles (matched case-insensitively
+    against `titles`), or None if the block is missing or invalid.
+    """
+    matches = list(re.finditer(r"```json\n(.*?)```", diff_output, re.DOTALL))
+    if not matches:
+        return diff_output, None
+    match = matches[-1]
+    try:
+        changed = json.loads(match.group(1))["changed_dimensions"]
+        by_name = {title.lower(): title for title in titles}
+        changed_titles = [by_name[name.strip().lower()] for name in changed]
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return diff_output, None
+    diff_output = (diff_output[: match.start()] + diff_output[match.end() :]).strip()
+    return diff_output, changed_titles
+
+
 def _fix_compositions(markdown: str) -> str:
     """Find sections with "Composition" in their headers and normalize the percentages to sum to 100%."""
     lines = markdown.split("\n")
@@ -273,7 +842,7 @@ def _fix_compositions(markdown: str) -> str:
 
     for i, line in enumerate(lines):
         # Check for composition section headers
-        if line.startswith(("#", "###", "####")) and "Composition" in line:
+        if line.startswith("#") and STATE_SCHEMA.is_composition_heading(line):
             # If we were already in a composition section, normalize and add it
             if in_composition:
                 normalized_lines = _normalize_percentages(composition_items)
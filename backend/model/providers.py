@@ -1,36 +1,256 @@
-from openai import AsyncOpenAI
+from typing import Awaitable, Callable, Optional
+import asyncio
+import random
+import httpx
+import openai
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 
 from config import (
     OPENAI_API_KEY,
     MODEL_HIGH_REASONING,
     MODEL_MEDIUM_REASONING,
     MODEL_LOW_REASONING,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_KEEPALIVE_EXPIRY,
+    LLM_TIMEOUT,
+    LLM_MAX_RETRIES,
+    LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX,
+    LLM_HEDGE_AFTER,
+    LLM_CACHE_MODE,
 )
+from model.scheduler import LLMScheduler, get_scheduler, estimate_tokens
+from model.llm_cache import LLMCache, get_llm_cache, cache_key
+
+_RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    asyncio.TimeoutError,
+)
+
+
+# Called with (offset, text, output tokens so far) as a streamed response arrives.
+# offset is where text starts in the output, a retry starts over from offset 0.
+# The token count is estimated from the streamed chunks until the response's
+# usage arrives, which is then reported with an empty text.
+OnDelta = Callable[[int, str, int], Awaitable[None]]
+
+
+def _create_client() -> AsyncOpenAI:
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        )
+    )
+    # replays never reach the API, so allow running them without a key
+    api_key = OPENAI_API_KEY or ("replay" if LLM_CACHE_MODE == "replay" else None)
+    # retries are handled by OpenAIProvider so they go back through the scheduler
+    return AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+
+def _backoff_delay(attempt: int, error: Exception) -> float:
+    """Full-jitter exponential backoff, honoring Retry-After on 429s when given."""
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2**attempt))
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            retry_after = float(response.headers.get("retry-after", 0))
+        except ValueError:
+            retry_after = 0
+        delay = max(delay, min(retry_after, LLM_BACKOFF_MAX))
+    return delay
 
 
 class OpenAIProvider:
-    def __init__(self):
-        self.client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    def __init__(
+        self,
+        client: Optional[AsyncOpenAI] = None,
+        scheduler: Optional[LLMScheduler] = None,
+        cache: Optional[LLMCache] = None,
+    ):
+        self.client = client or _create_client()
+        self.scheduler = scheduler or get_scheduler()
+        self.cache = cache or get_llm_cache()
+
+    async def close(self):
+        await self.client.close()
+
+    async def _attempt(self, tier: str, model: str, text: str, **kwargs) -> str:
+        async with self.scheduler.slot(tier, estimate_tokens(text)) as slot:
+            response = await asyncio.wait_for(
+                self.client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": text}],
+                    **kwargs,
+                ),
+                timeout=LLM_TIMEOUT,
+            )
+            if response.usage:
+                slot.used_tokens = response.usage.total_tokens
+        return response.choices[0].message.content
+
+    async def _attempt_stream(
+        self, tier: str, model: str, text: str, on_delta: OnDelta, **kwargs
+    ) -> str:
+        """_attempt, streaming the response to on_delta as it is generated."""
+
+        async def read_stream(slot) -> str:
+            stream = await self.client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": text}],
+                stream=True,
+                stream_options={"include_usage": True},
+                **kwargs,
+            )
+            output, tokens = "", 0
+            async for chunk in stream:
+                if chunk.usage:
+                    slot.used_tokens = chunk.usage.total_tokens
+                    await on_delta(len(output), "", chunk.usage.completion_tokens)
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    # chunks carry about one token each
+                    tokens += 1
+                    await on_delta(len(output), delta, tokens)
+                    output += delta
+            return output
+
+        async with self.scheduler.slot(tier, estimate_tokens(text)) as slot:
+            return await asyncio.wait_for(read_stream(slot), timeout=LLM_TIMEOUT)
 
-    async def generate_medium_reasoning(self, text: str) -> str:
-        response = await self.client.chat.completions.create(
-            model=MODEL_MEDIUM_REASONING,
-            messages=[{"role": "user", "content": text}],
+    async def _hedged_attempt(
+        self, tier: str, model: str, text: str, hedge: bool, **kwargs
+    ) -> str:
+        """Run an attempt, racing a duplicate request if the first is slow."""
+        if not hedge or not LLM_HEDGE_AFTER:
+            return await self._attempt(tier, model, text, **kwargs)
+
+        tasks = [asyncio.create_task(self._attempt(tier, model, text, **kwargs))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=LLM_HEDGE_AFTER)
+            if not done:
+                print(f"Hedging slow {tier} request")
+                tasks.append(
+                    asyncio.create_task(self._attempt(tier, model, text, **kwargs))
+                )
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _complete(
+        self,
+        tier: str,
+        model: str,
+        text: str,
+        hedge: bool = False,
+        cache: bool = False,
+        on_delta: Optional[OnDelta] = None,
+        **kwargs,
+    ) -> str:
+        key = cache_key(model, kwargs.get("reasoning_effort"), text)
+        cached = await self.cache.lookup(key, cache)
+        if cached is not None:
+            if on_delta:
+                await on_delta(0, cached, estimate_tokens(cached))
+            return cached
+
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            try:
+                if on_delta:
+                    # not hedged, racing streams would interleave their deltas
+                    output = await self._attempt_stream(
+                        tier, model, text, on_delta, **kwargs
+                    )
+                else:
+                    output = await self._hedged_attempt(
+                        tier, model, text, hedge, **kwargs
+                    )
+                break
+            except _RETRYABLE_ERRORS as e:
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                delay = _backoff_delay(attempt, e)
+                print(f"Retrying {tier} request in {delay:.1f}s after {e!r}")
+                await asyncio.sleep(delay)
+
+        await self.cache.store(key, output, cache)
+        return output
+
+    async def generate_medium_reasoning(
+        self,
+        text: str,
+        hedge: bool = False,
+        cache: bool = False,
+        on_delta: Optional[OnDelta] = None,
+    ) -> str:
+        return await self._complete(
+            "medium",
+            MODEL_MEDIUM_REASONING,
+            text,
+            hedge,
+            cache,
+            on_delta,
             reasoning_effort="medium",
         )
-        return response.choices[0].message.content
 
-    async def generate_high_reasoning(self, text: str) -> str:
-        response = await self.client.chat.completions.create(
-            model=MODEL_HIGH_REASONING,
-            messages=[{"role": "user", "content": text}],
+    async def generate_high_reasoning(
+        self,
+        text: str,
+        hedge: bool = False,
+        cache: bool = False,
+        on_delta: Optional[OnDelta] = None,
+    ) -> str:
+        return await self._complete(
+            "high",
+            MODEL_HIGH_REASONING,
+            text,
+            hedge,
+            cache,
+            on_delta,
             reasoning_effort="medium",
         )
-        return response.choices[0].message.content
 
-    async def generate_low_reasoning(self, text: str) -> str:
-        response = await self.client.chat.completions.create(
-            model=MODEL_LOW_REASONING,
-            messages=[{"role": "user", "content": text}],
+    async def generate_low_reasoning(
+        self,
+        text: str,
+        hedge: bool = False,
+        cache: bool = False,
+        on_delta: Optional[OnDelta] = None,
+    ) -> str:
+        return await self._complete(
+            "low", MODEL_LOW_REASONING, text, hedge, cache, on_delta
         )
-        return response.choices[0].message.content
+
+
+_provider: Optional[OpenAIProvider] = None
+
+
+def get_provider() -> OpenAIProvider:
+    """Process-wide provider so all actions share one keep-alive connection pool."""
+    global _provider
+    if _provider is None:
+        _provider = OpenAIProvider()
+    return _provider
+
+
+async def close_provider():
+    global _provider
+    if _provider is not None:
+        await _provider.close()
+        _provider = None
@@ -0,0 +1,196 @@
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Optional, Tuple
+import asyncio
+import time
+
+from config import (
+    LLM_HIGH_MAX_CONCURRENCY,
+    LLM_HIGH_TOKENS_PER_MINUTE,
+    LLM_MEDIUM_MAX_CONCURRENCY,
+    LLM_MEDIUM_TOKENS_PER_MINUTE,
+    LLM_LOW_MAX_CONCURRENCY,
+    LLM_LOW_TOKENS_PER_MINUTE,
+)
+
+# Who LLM work is queued on behalf of (e.g. "user-12"), used for fair queuing
+llm_owner: ContextVar[str] = ContextVar("llm_owner", default="anonymous")
+
+
+@dataclass
+class TierLimits:
+    max_concurrency: int
+    tokens_per_minute: int = 0  # 0 disables the token budget
+    output_tokens_estimate: int = 2_000
+
+
+@dataclass
+class SchedulerSlot:
+    reserved_tokens: int
+    used_tokens: Optional[int] = None
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for budgeting
+    return len(text) // 4 + 1
+
+
+class _TierScheduler:
+    """
+    Concurrency + tokens-per-minute limiter for one reasoning tier.
+
+    Waiters are grouped by owner and granted round-robin across owners, so one
+    turn fanning out many calls can't starve other users' turns.
+    """
+
+    def __init__(self, name: str, limits: TierLimits):
+        self.name = name
+        self.limits = limits
+        self._running = 0
+        self._queues: Dict[str, Deque[Tuple[asyncio.Future, int]]] = {}
+        self._owners: Deque[str] = deque()
+        self._tokens = float(limits.tokens_per_minute)
+        self._last_refill = time.monotonic()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+
+    def _refill(self):
+        now = time.monotonic()
+        tpm = self.limits.tokens_per_minute
+        if tpm:
+            elapsed = now - self._last_refill
+            self._tokens = min(float(tpm), self._tokens + elapsed * tpm / 60.0)
+        self._last_refill = now
+
+    def _schedule_wakeup(self, tokens_needed: float):
+        if self._wakeup is not None:
+            return
+        delay = tokens_needed * 60.0 / self.limits.tokens_per_minute
+
+        def wake():
+            self._wakeup = None
+            self._dispatch()
+
+        self._wakeup = asyncio.get_running_loop().call_later(delay, wake)
+
+    def _dispatch(self):
+        self._refill()
+        tpm = self.limits.tokens_per_minute
+        while self._owners and self._running < self.limits.max_concurrency:
+            owner = self._owners[0]
+            queue = self._queues[owner]
+            future, tokens = queue[0]
+            if not future.done():
+                # a single request larger than the bucket only waits for a full bucket
+                needed = min(tokens, tpm)
+                if tpm and self._tokens < needed:
+                    self._schedule_wakeup(needed - self._tokens)
+                    break
+                self._running += 1
+                self._tokens -= tokens
+                future.set_result(None)
+            queue.popleft()
+            self._owners.popleft()
+            if queue:
+                self._owners.append(owner)
+            else:
+                del self._queues[owner]
+
+    def _remove_waiter(self, owner: str, future: asyncio.Future):
+        queue = self._queues.get(owner)
+        if queue is None:
+            return
+        for item in list(queue):
+            if item[0] is future:
+                queue.remove(item)
+        if not queue:
+            del self._queues[owner]
+            self._owners.remove(owner)
+
+    async def acquire(self, owner: str, tokens: int):
+        future = asyncio.get_running_loop().create_future()
+        if owner not in self._queues:
+            self._queues[owner] = deque()
+            self._owners.append(owner)
+        self._queues[owner].append((future, tokens))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(tokens, 0)
+            else:
+                self._remove_waiter(owner, future)
+            raise
+
+    def release(self, reserved_tokens: int, used_tokens: Optional[int]):
+        self._running -= 1
+        if self.limits.tokens_per_minute and used_tokens is not None:
+            # settle the estimate against actual usage
+            self._tokens = min(
+                float(self.limits.tokens_per_minute),
+                self._tokens + reserved_tokens - used_tokens,
+            )
+        self._dispatch()
+
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "queued": sum(len(q) for q in self._queues.values()),
+            "queued_owners": len(self._queues),
+            "max_concurrency": self.limits.max_concurrency,
+            "tokens_per_minute": self.limits.tokens_per_minute,
+            "tokens_available": (
+                int(self._tokens) if self.limits.tokens_per_minute else None
+            ),
+        }
+
+
+class LLMScheduler:
+    def __init__(self, tiers: Dict[str, TierLimits]):
+        self._tiers = {name: _TierScheduler(name, t) for name, t in tiers.items()}
+
+    @asynccontextmanager
+    async def slot(self, tier: str, prompt_tokens: int) -> AsyncIterator[SchedulerSlot]:
+        """Wait for a fair turn within the tier's concurrency and token budget."""
+        scheduler = self._tiers[tier]
+        slot = SchedulerSlot(
+            reserved_tokens=prompt_tokens + scheduler.limits.output_tokens_estimate
+        )
+        await scheduler.acquire(llm_owner.get(), slot.reserved_tokens)
+        try:
+            yield slot
+        finally:
+            scheduler.release(slot.reserved_tokens, slot.used_tokens)
+
+    def stats(self) -> dict:
+        return {name: tier.stats() for name, tier in self._tiers.items()}
+
+
+_scheduler: Optional[LLMScheduler] = None
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler(
+            {
+                "high": TierLimits(
+                    max_concurrency=LLM_HIGH_MAX_CONCURRENCY,
+                    tokens_per_minute=LLM_HIGH_TOKENS_PER_MINUTE,
+                    output_tokens_estimate=8_000,
+                ),
+                "medium": TierLimits(
+                    max_concurrency=LLM_MEDIUM_MAX_CONCURRENCY,
+                    tokens_per_minute=LLM_MEDIUM_TOKENS_PER_MINUTE,
+                    output_tokens_estimate=4_000,
+                ),
+                "low": TierLimits(
+                    max_concurrency=LLM_LOW_MAX_CONCURRENCY,
+                    tokens_per_minute=LLM_LOW_TOKENS_PER_MINUTE,
+                    output_tokens_estimate=1_500,
+                ),
+            }
+        )
+    return _scheduler
@@ -1,5 +1,5 @@
 from dataclasses import dataclass, field
-from typing import List
+from typing import Dict, List
 
 
 @dataclass
@@ -8,6 +8,10 @@ class StateDimension:
     template: str
     seed_assumptions: List[str] = field(default_factory=list)
     diff_requires_dimensions: List[str] = field(default_factory=list)
+    # field -> growth rate field, applied by model.growth.next_year_baseline
+    growth_fields: Dict[str, str] = field(default_factory=dict)
+    # re-simulated every turn, even when the diff lists no changes for it
+    always_simulate: bool = False
 
 
 DIMENSIONS = [
@@ -105,6 +109,7 @@ DIMENSIONS = [
             "Assume a single fictional country-specific ethnic group and several real groups for the others in the country (e.g. White, Asian, etc)",
             "Assume a single fictional country-specific religious group and several real religions for the others in the country (e.g. Christianity, Islam, etc)",
         ],
+        growth_fields={"Total Population": "Population Annual Growth Rate"},
     ),
     StateDimension(
         title="Education",
@@ -195,7 +200,7 @@ DIMENSIONS = [
 - The role, organization, and responsibilities of the courts (if any)
 - The role, organization, and responsibilities of law enforcement (if any)
 - The role, organization, and responsibilities of the prisons (if any)
-- The correlation between crime and poverty, education, and other factors -->
+- The correlation between crime and poverty, education, and other factors
 - Government funding -->
 
 ## Crime Metrics
@@ -343,6 +348,11 @@ DIMENSIONS = [
             "Assume an initial GDP of 2,700,000,000 USD (2.7 billion USD)",
             "Assume all real countries (e.g. USA, China, Russia, etc) for import and export partners",
         ],
+        growth_fields={
+            "Gross Domestic Product (GDP)": "GDP Annual Growth Rate",
+            "Total Annual Revenue": "GDP Annual Growth Rate",
+            "Total Annual Expenditure": "GDP Annual Growth Rate",
+        },
     ),
     StateDimension(
         title="International Relations",
@@ -668,5 +678,7 @@ DIMENSIONS = [
 ...
 """.strip(),
         diff_requires_dimensions=["People"],
+        # quotes and headlines are meant to be new every year
+        always_simulate=True,
     ),
 ]
@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, Security
 from fastapi.security import APIKeyHeader
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 
 from utils.emails import send_login_link
-from db.database import get_db
+from db.database import get_async_db
 from db.models import User
 from routers.schemas import (
     UserResponse,
@@ -21,7 +22,7 @@ API_KEY_HEADER = APIKeyHeader(name="Authorization")
 
 
 async def get_current_user_from_token(
-    token: str = Security(API_KEY_HEADER), db: Session = Depends(get_db)
+    token: str = Security(API_KEY_HEADER), db: AsyncSession = Depends(get_async_db)
 ):
     try:
         token = token.replace("Bearer ", "")
@@ -32,16 +33,18 @@ async def get_current_user_from_token(
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    user = db.query(User).filter(User.username == username).first()
+    user = await db.scalar(select(User).filter(User.username == username))
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
     return user
 
 
 @router.post("/create", response_model=AuthResponse)
-async def create_user(request: CreateUserRequest, db: Session = Depends(get_db)):
+async def create_user(
+    request: CreateUserRequest, db: AsyncSession = Depends(get_async_db)
+):
     # Check if user already exists
-    existing_user = db.query(User).filter(User.email == request.email).first()
+    existing_user = await db.scalar(select(User).filter(User.email == request.email))
     if existing_user:
         if existing_user.email.endswith("sshh.io"):
             raise HTTPException(
@@ -58,8 +61,8 @@ async def create_user(request: CreateUserRequest, db: Session = Depends(get_db))
     try:
         new_user = User(username=request.username, email=request.email)
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
+        await db.refresh(new_user)
 
         token = jwt.encode(
             {
@@ -71,7 +74,7 @@ async def create_user(request: CreateUserRequest, db: Session = Depends(get_db))
         )
         return AuthResponse(user=new_user, token=token)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
 
@@ -81,7 +84,7 @@ async def get_current_user(current_user: User = Depends(get_current_user_from_to
 
 
 @router.get("/email-login/{token}", response_model=AuthResponse)
-async def email_login(token: str, db: Session = Depends(get_db)):
+async def email_login(token: str, db: AsyncSession = Depends(get_async_db)):
     try:
         # Decode the token
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
@@ -90,7 +93,7 @@ async def email_login(token: str, db: Session = Depends(get_db)):
             raise HTTPException(status_code=401, detail="Invalid token")
 
         # Get the user
-        user = db.query(User).filter(User.email == email).first()
+        user = await db.scalar(select(User).filter(User.email == email))
         if user is None:
             raise HTTPException(status_code=401, detail="User not found")
 
@@ -114,12 +117,10 @@ async def email_login(token: str, db: Session = Depends(get_db)):
 async def update_email(
     request: UpdateEmailRequest,
     current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    existing_user = (
-        db.query(User)
-        .filter(User.email == request.email, User.id != current_user.id)
-        .first()
+    existing_user = await db.scalar(
+        select(User).filter(User.email == request.email, User.id != current_user.id)
     )
 
     if existing_user:
@@ -128,7 +129,7 @@ async def update_email(
         )
 
     current_user.email = request.email
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
 
     return current_user
@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Depends
+
+from db.models import User
+from model.scheduler import get_scheduler
+from routers.auth import get_current_user_from_token
+
+router = APIRouter(prefix="/api/llm", tags=["llm"])
+
+
+@router.get("/queue")
+async def get_llm_queue(
+    current_user: User = Depends(get_current_user_from_token),
+):
+    """Per-tier LLM scheduler load (running, queued) for this worker."""
+    return get_scheduler().stats()
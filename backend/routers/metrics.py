@@ -0,0 +1,153 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional
+import json
+
+from db.database import AsyncSessionLocal, get_async_db
+from db.models import State, StateMetric
+from routers.schemas import (
+    MetricRankingResponse,
+    MetricSeriesResponse,
+    StateMetricResponse,
+)
+from utils.shared_cache import get_shared_cache
+from config import CACHE_TTL_STATES_LEADERBOARD, CACHE_STALE_TTL_STATES_LEADERBOARD
+
+router = APIRouter(prefix="/api/metrics", tags=["metrics"])
+
+METRIC_RANKING_MAX_LIMIT = 200
+METRIC_SERIES_MAX_KEYS = 32
+
+
+def _parse_percentiles(percentiles: Optional[str]) -> list:
+    try:
+        values = [float(p) for p in (percentiles or "").split(",") if p]
+    except ValueError:
+        values = None
+    if values is None or not all(0 <= p <= 1 for p in values):
+        raise HTTPException(
+            status_code=400, detail="percentiles must be numbers between 0 and 1"
+        )
+    return values
+
+
+@router.get("/states/{state_id}/series", response_model=MetricSeriesResponse)
+async def get_metric_series(
+    state_id: int,
+    keys: str,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Values of one or more comma separated metric key paths over a state's
+    history, as a dates column and one values column per key.
+    """
+    key_paths = [k for k in keys.split(",") if k]
+    if not key_paths or len(key_paths) > METRIC_SERIES_MAX_KEYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"keys must list 1 to {METRIC_SERIES_MAX_KEYS} metrics",
+        )
+
+    metrics = (
+        await db.scalars(
+            select(StateMetric)
+            .filter(StateMetric.state_id == state_id, StateMetric.key.in_(key_paths))
+            .order_by(StateMetric.date, StateMetric.snapshot_id)
+        )
+    ).all()
+
+    dates = sorted({metric.date for metric in metrics})
+    date_index = {date: i for i, date in enumerate(dates)}
+    values = {key: [None] * len(dates) for key in key_paths}
+    units = {key: None for key in key_paths}
+    for metric in metrics:
+        values[metric.key][date_index[metric.date]] = metric.value
+        units[metric.key] = metric.unit
+    return MetricSeriesResponse(
+        state_id=state_id, dates=dates, values=values, units=units
+    )
+
+
+async def _build_percentiles(filters: list, count: int, ranks: List[float]) -> bytes:
+    """
+    Nearest-rank percentiles. Each is an OFFSET over the (key, latest, value)
+    index, which still walks every row before it, hence the caching.
+    """
+    values: Dict[str, float] = {}
+    async with AsyncSessionLocal() as db:
+        for rank in ranks:
+            values[str(rank)] = await db.scalar(
+                select(StateMetric.value)
+                .filter(*filters)
+                .order_by(StateMetric.value)
+                .offset(round(rank * (count - 1)))
+                .limit(1)
+            )
+    return json.dumps(values).encode()
+
+
+@router.get("/{key}", response_model=MetricRankingResponse)
+async def get_metric_ranking(
+    key: str,
+    order: str = "desc",
+    limit: int = Query(10, ge=1, le=METRIC_RANKING_MAX_LIMIT),
+    min_value: Optional[float] = Query(None, alias="min"),
+    max_value: Optional[float] = Query(None, alias="max"),
+    percentiles: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Rank states by the latest value of a metric key path (e.g.
+    people.people_metrics.total_population), optionally within [min, max]
+    and with percentiles (e.g. 0.5,0.9). This endpoint is unauthenticated.
+    """
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be asc or desc")
+    percentile_ranks = _parse_percentiles(percentiles)
+
+    filters = [StateMetric.key == key, StateMetric.latest.is_(True)]
+    if min_value is not None:
+        filters.append(StateMetric.value >= min_value)
+    if max_value is not None:
+        filters.append(StateMetric.value <= max_value)
+
+    count = await db.scalar(
+        select(func.count()).select_from(StateMetric).filter(*filters)
+    )
+    sort_value = StateMetric.value.desc() if order == "desc" else StateMetric.value
+    rows = (
+        await db.execute(
+            select(StateMetric, State.name)
+            .join(State, State.id == StateMetric.state_id)
+            .filter(*filters)
+            .order_by(sort_value, StateMetric.state_id)
+            .limit(limit)
+        )
+    ).all()
+
+    percentile_values = {}
+    if percentile_ranks and count:
+        content = await get_shared_cache().get_or_set(
+            f"metrics:percentiles:{key}:{min_value}:{max_value}:{percentiles}",
+            lambda: _build_percentiles(filters, count, percentile_ranks),
+            ttl=CACHE_TTL_STATES_LEADERBOARD,
+            stale_ttl=CACHE_STALE_TTL_STATES_LEADERBOARD,
+        )
+        percentile_values = json.loads(content)
+
+    return MetricRankingResponse(
+        key=key,
+        count=count,
+        items=[
+            StateMetricResponse(
+                state_id=metric.state_id,
+                name=name,
+                date=metric.date,
+                value=metric.value,
+                unit=metric.unit,
+            )
+            for metric, name in rows
+        ],
+        percentiles=percentile_values,
+    )
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict, Union
 
 
 class UserBase(BaseModel):
@@ -64,6 +64,18 @@ class StateSnapshotResponse(BaseModel):
         from_attributes = True
 
 
+class StateSnapshotSummaryResponse(BaseModel):
+    id: int
+    date: str
+    state_id: int
+    json_state: dict  # only the requested valueKeys
+
+
+class StateSnapshotPageResponse(BaseModel):
+    items: List[Union[StateSnapshotResponse, StateSnapshotSummaryResponse]]
+    next_cursor: Optional[str] = None
+
+
 class CreateNewSnapshotRequest(BaseModel):
     policy: str
 
@@ -78,11 +90,18 @@ class AdviceResponse(BaseModel):
 
 
 class BaseEvent(BaseModel):
+    event_id: Optional[int] = None  # per-job id to resume from with Last-Event-ID
+
     def json_line(self) -> str:
         """Convert event to a JSON line for streaming"""
         return self.model_dump_json() + "\n"
 
 
+class JobCreatedEvent(BaseEvent):
+    type: str = "job_created"
+    job_id: int
+
+
 class StateCreatedEvent(BaseEvent):
     type: str = "state_created"
     id: int
@@ -93,6 +112,28 @@ class StateStatusEvent(BaseEvent):
     message: str
 
 
+class StatePartialTextEvent(BaseEvent):
+    """
+    Streamed text of a step's LLM output, append `text` at `offset` (0 restarts).
+    `tokens` is estimated from the streamed chunks until the response's usage
+    arrives.
+    """
+
+    type: str = "partial_text"
+    step: str
+    offset: int
+    text: str
+    tokens: int
+
+
+class StateDimensionCompleteEvent(BaseEvent):
+    type: str = "dimension_complete"
+    step: str
+    dimension: str
+    completed: int
+    total: int
+
+
 class StateErrorEvent(BaseEvent):
     type: str = "error"
     message: str
@@ -126,5 +167,43 @@ class StateWithLatestSnapshotResponse(BaseModel):
         from_attributes = True
 
 
+class LeaderboardEntryResponse(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    flag_svg: Optional[str] = None
+    snapshot_id: int
+    date: str
+    json_state: dict  # only the requested valueKeys
+
+
+class LeaderboardResponse(BaseModel):
+    items: List[LeaderboardEntryResponse]
+    next_cursor: Optional[str] = None
+    cache_updated_at: Optional[datetime] = None
+
+
+class StateMetricResponse(BaseModel):
+    state_id: int
+    name: str
+    date: str
+    value: float
+    unit: Optional[str]
+
+
+class MetricRankingResponse(BaseModel):
+    key: str
+    count: int  # states with the metric (within min/max)
+    items: List[StateMetricResponse]
+    percentiles: Dict[str, float] = {}
+
+
+class MetricSeriesResponse(BaseModel):
+    state_id: int
+    dates: List[str]
+    values: Dict[str, List[Optional[float]]]  # key path -> value per date
+    units: Dict[str, Optional[str]]
+
+
 class UpdateEmailRequest(BaseModel):
     email: str
@@ -1,15 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Response
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer
+from sqlalchemy import func, and_, or_, select
 from typing import List, Optional
 from datetime import datetime
-from dateutil.relativedelta import relativedelta
-import traceback
 import asyncio
-from fastapi_cache.decorator import cache
+import base64
+import json
+import re
 
-from db.database import get_db
-from db.models import State, StateSnapshot, User
+from db.database import get_async_db, AsyncSessionLocal
+from db.models import State, StateSnapshot, StateMetric, TurnJob, JobEvent, User
 from routers.schemas import (
     StateResponse,
     CreateStateRequest,
@@ -17,82 +19,89 @@ from routers.schemas import (
     CreateNewSnapshotRequest,
     AdviceRequest,
     AdviceResponse,
+    JobCreatedEvent,
     StateCreatedEvent,
     StateStatusEvent,
+    StatePartialTextEvent,
+    StateDimensionCompleteEvent,
     StateCompleteEvent,
     StateSnapshotCompleteEvent,
     StateWithLatestSnapshotResponse,
     StateErrorEvent,
+    LeaderboardEntryResponse,
+    LeaderboardResponse,
+    StateSnapshotSummaryResponse,
+    StateSnapshotPageResponse,
 )
 from routers.auth import get_current_user_from_token
-from model.actions import (
-    generate_state,
-    generate_next_state,
-    generate_state_flag,
-    generate_diff_report,
-    generate_state_advice,
-    generate_future_events,
-    generate_future_policy_suggestion,
-    generate_state_description,
-    generate_reasonable_policy_event,
-)
-from model.parsing import parse_state
+from model.actions import generate_state_advice
+from model.scheduler import llm_owner
+from model.parsing import parse_state, filter_state_keys, PARSED_STATE_VERSION
+from db.snapshots import get_markdown_state
+from tasks.turn_jobs import add_job_event, notify_turn_workers
 from utils.event_stream import event_stream_response
+from utils.shared_cache import get_shared_cache
 from config import (
     CACHE_TTL_STATES_LEADERBOARD,
+    CACHE_STALE_TTL_STATES_LEADERBOARD,
     CREDITS_NEW_STATE_COST,
     CREDITS_NEXT_YEAR_COST,
+    TURN_JOB_POLL_SECONDS,
 )
 
 router = APIRouter(prefix="/api/states", tags=["states"])
 
 START_DATE = "2022-01"
 
+_LATEST_STATE_SNAPSHOTS_ADAPTER = TypeAdapter(List[StateWithLatestSnapshotResponse])
+
+LEADERBOARD_MAX_LIMIT = 200
+MAX_VALUE_KEYS = 32
+SNAPSHOT_PAGE_MAX_LIMIT = 100
+LEADERBOARD_FIELDS = ("description", "flag_svg")
+# parsed_state keys are lowercase words joined by underscores, see _clean_key
+_KEY_PATH_RE = re.compile(r"^[a-z_]+(\.[a-z_]+)*$")
+
 
 @router.get("", response_model=List[StateResponse])
 async def get_states(
     current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    states = db.query(State).filter(State.user_id == current_user.id).all()
-    return states
+    states = await db.scalars(select(State).filter(State.user_id == current_user.id))
+    return states.all()
 
 
 @router.get("/latest", response_model=List[StateWithLatestSnapshotResponse])
-@cache(expire=CACHE_TTL_STATES_LEADERBOARD)
-async def get_latest_state_snapshots(
-    valueKeys: Optional[str] = None,
-    db: Session = Depends(get_db),
-):
+async def get_latest_state_snapshots(valueKeys: Optional[str] = None):
     """Get the latest snapshot from all states along with state data. This endpoint is unauthenticated."""
-    if valueKeys:
-        valueKeys = valueKeys.split(",")
-
-    # Subquery to get the latest snapshot date for each state
-    latest_dates = (
-        db.query(StateSnapshot.state_id, func.max(StateSnapshot.date).label("max_date"))
-        .group_by(StateSnapshot.state_id)
-        .subquery()
+    # same keys in any order or repeated share one cache entry
+    value_keys = sorted(set(_parse_key_paths(valueKeys))) or None
+    content = await get_shared_cache().get_or_set(
+        f"states:latest:{','.join(value_keys or [])}",
+        lambda: _build_latest_state_snapshots(value_keys),
+        ttl=CACHE_TTL_STATES_LEADERBOARD,
+        stale_ttl=CACHE_STALE_TTL_STATES_LEADERBOARD,
     )
+    # already serialized, skip re-validating the cached response
+    return Response(content=content, media_type="application/json")
 
-    # Query to get the states and their latest snapshots
-    latest_states = (
-        db.query(State, StateSnapshot)
-        .join(StateSnapshot, State.id == StateSnapshot.state_id)
-        .join(
-            latest_dates,
-            and_(
-                StateSnapshot.state_id == latest_dates.c.state_id,
-                StateSnapshot.date == latest_dates.c.max_date,
-            ),
-        )
-        .all()
-    )
+
+async def _build_latest_state_snapshots(value_keys: Optional[List[str]]) -> bytes:
+    async with AsyncSessionLocal() as db:
+        latest_states = (
+            await db.execute(
+                select(State, StateSnapshot).join(
+                    StateSnapshot, StateSnapshot.id == State.latest_snapshot_id
+                )
+            )
+        ).all()
+        for _, snapshot in latest_states:
+            await _fix_snapshot_json(db, snapshot, only_keys=value_keys)
 
     result = []
     current_time = datetime.now()
     for state, snapshot in latest_states:
-        _fix_snapshot_json(snapshot, only_keys=valueKeys)
         result.append(
             StateWithLatestSnapshotResponse(
                 id=state.id,
@@ -106,15 +115,172 @@ async def get_latest_state_snapshots(
             )
         )
 
-    return result
+    return _LATEST_STATE_SNAPSHOTS_ADAPTER.dump_json(result)
+
+
+@router.get("/leaderboard", response_model=LeaderboardResponse)
+async def get_leaderboard(
+    sort: Optional[str] = None,
+    order: str = "desc",
+    limit: int = Query(50, ge=1, le=LEADERBOARD_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    valueKeys: Optional[str] = None,
+    fields: str = "flag_svg",
+):
+    """
+    Page through states by the numeric value of a metric key path (e.g.
+    economy.economic_metrics.gross_domestic_product_gdp), returning only the
+    requested valueKeys and state fields. This endpoint is unauthenticated.
+    """
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be asc or desc")
+    value_keys = _parse_key_paths(valueKeys)
+    if sort:
+        _parse_key_paths(sort)
+    state_fields = [f for f in fields.split(",") if f]
+    if any(f not in LEADERBOARD_FIELDS for f in state_fields):
+        raise HTTPException(
+            status_code=400, detail=f"fields must be in {', '.join(LEADERBOARD_FIELDS)}"
+        )
+    try:
+        after = _decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    content = await get_shared_cache().get_or_set(
+        f"states:leaderboard:{sort}:{order}:{limit}:{cursor}:{valueKeys}:{fields}",
+        lambda: _build_leaderboard_page(
+            sort, order, limit, after, value_keys, state_fields
+        ),
+        ttl=CACHE_TTL_STATES_LEADERBOARD,
+        stale_ttl=CACHE_STALE_TTL_STATES_LEADERBOARD,
+    )
+    return Response(content=content, media_type="application/json")
+
+
+def _parse_key_paths(value: Optional[str]) -> List[str]:
+    key_paths = [k for k in (value or "").split(",") if k]
+    if len(key_paths) > MAX_VALUE_KEYS or not all(
+        _KEY_PATH_RE.match(k) for k in key_paths
+    ):
+        raise HTTPException(status_code=400, detail="Invalid metric key path")
+    return key_paths
+
+
+def _encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError(cursor)
+    if not isinstance(values, list) or not values:
+        raise ValueError(cursor)
+    return values
+
+
+def _value_key_columns(value_keys: List[str]) -> list:
+    """Select only the given key paths out of parsed_state, without loading the document."""
+    return [StateSnapshot.parsed_state[tuple(key.split("."))] for key in value_keys]
+
+
+def _nest_values(value_keys: List[str], values: list) -> dict:
+    """Rebuild the nested json_state shape from values selected by _value_key_columns."""
+    json_state = {}
+    for key, value in zip(value_keys, values):
+        if value is None:
+            continue
+        *parents, leaf = key.split(".")
+        current = json_state
+        for parent in parents:
+            current = current.setdefault(parent, {})
+        current[leaf] = value
+    return json_state
+
+
+async def _build_leaderboard_page(
+    sort: Optional[str],
+    order: str,
+    limit: int,
+    after: Optional[list],
+    value_keys: List[str],
+    state_fields: List[str],
+) -> bytes:
+    query = select(
+        State.id,
+        State.name,
+        *[getattr(State, f) for f in state_fields],
+        StateSnapshot.id,
+        StateSnapshot.date,
+        *_value_key_columns(value_keys),
+    ).join(StateSnapshot, StateSnapshot.id == State.latest_snapshot_id)
+
+    if sort:
+        # keyset pagination on (value, id), states missing the metric sort last
+        missing = -1e300 if order == "desc" else 1e300
+        sort_value = func.coalesce(StateMetric.value, missing)
+        query = query.outerjoin(
+            StateMetric,
+            and_(
+                StateMetric.snapshot_id == State.latest_snapshot_id,
+                StateMetric.key == sort,
+            ),
+        )
+        query = query.add_columns(sort_value)
+        if order == "desc":
+            query = query.order_by(sort_value.desc(), State.id)
+        else:
+            query = query.order_by(sort_value, State.id)
+        if after:
+            after_value, after_id = after
+            if order == "desc":
+                beyond = sort_value < after_value
+            else:
+                beyond = sort_value > after_value
+            query = query.filter(
+                or_(beyond, and_(sort_value == after_value, State.id > after_id))
+            )
+    else:
+        query = query.order_by(State.id)
+        if after:
+            query = query.filter(State.id > after[0])
+
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(query.limit(limit + 1))).all()
+
+    items = []
+    for row in rows[:limit]:
+        state_id, name, *row = row
+        extra = dict(zip(state_fields, row[: len(state_fields)]))
+        snapshot_id, date, *values = row[len(state_fields) :]
+        items.append(
+            LeaderboardEntryResponse(
+                id=state_id,
+                name=name,
+                snapshot_id=snapshot_id,
+                date=date,
+                json_state=_nest_values(value_keys, values),
+                **extra,
+            )
+        )
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = _encode_cursor([last[-1], last[0]] if sort else [last[0]])
+    return LeaderboardResponse(
+        items=items, next_cursor=next_cursor, cache_updated_at=datetime.now()
+    ).model_dump_json().encode()
 
 
 @router.get("/{state_id}", response_model=StateResponse)
 async def get_state(
     state_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    state = db.query(State).filter(State.id == state_id).first()
+    state = await db.scalar(select(State).filter(State.id == state_id))
     if not state:
         raise HTTPException(status_code=404, detail="State not found")
     return state
@@ -124,7 +290,7 @@ async def get_state(
 async def create_state(
     request: CreateStateRequest,
     current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     async def event_stream():
         if current_user.credits < CREDITS_NEW_STATE_COST:
@@ -133,70 +299,198 @@ async def create_state(
             ).json_line()
             return
 
-        date = START_DATE
-        start_date = datetime.strptime(date, "%Y-%m")
-        end_date = start_date + relativedelta(months=12)
         state = State(
-            date=date,
+            date=START_DATE,
             name="Developing Nation",
             description="A developing nation.",
             flag_svg='<svg xmlns="http://www.w3.org/2000/svg" width="900" height="600"></svg>',
+            turn_in_progress=True,
             user_id=current_user.id,
         )
         db.add(state)
-        db.flush()
-
-        yield StateCreatedEvent(id=state.id).json_line()
-        questions = [(q.question, q.value) for q in request.questions]
-
-        yield StateStatusEvent(message="Generating initial state...").json_line()
-        md_overview, md_state = await generate_state(
-            date=date, name=request.name, questions=questions
-        )
-
-        yield StateStatusEvent(
-            message="Designing flag, events, and description..."
-        ).json_line()
-        svg_flag, random_events_md, state_description = await asyncio.gather(
-            generate_state_flag(md_overview),
-            generate_future_events(start_date, end_date, md_state, ""),
-            generate_state_description(md_overview),
-        )
-
-        yield StateStatusEvent(message="Generating policy suggestions...").json_line()
-        policy_suggestion = await generate_future_policy_suggestion(
-            start_date, end_date, md_state, random_events_md
-        )
-
-        state_snapshot = StateSnapshot(
-            date=date,
+        await db.flush()
+        job = TurnJob(
+            kind="create_state",
             state_id=state.id,
-            markdown_state=md_state,
-            markdown_future_events=random_events_md,
-            markdown_future_events_policy=policy_suggestion,
+            user_id=current_user.id,
+            payload={
+                "date": START_DATE,
+                "name": request.name,
+                "questions": [(q.question, q.value) for q in request.questions],
+            },
+            checkpoint={},
         )
-        parsed_state = parse_state(state_snapshot.markdown_state)
-        full_name = parsed_state["government"]["government_metadata"][
-            "country_official_name"
-        ]["value"]
-        state.name = full_name
-        state.flag_svg = svg_flag
-        state.description = state_description
-        db.add(state_snapshot)
-        db.commit()
-        db.refresh(state)
-
-        yield StateCompleteEvent(state=state).json_line()
-
-        current_user.credits -= CREDITS_NEW_STATE_COST
-        db.add(current_user)
-        db.commit()
+        db.add(job)
+        await db.flush()
+        await add_job_event(db, job.id, "job_created", {"job_id": job.id})
+        await add_job_event(db, job.id, "state_created", {"id": state.id})
+        await db.commit()
+        notify_turn_workers()
+
+        async for line in _tail_turn_job(job.id):
+            yield line
 
     return event_stream_response(event_stream())
 
 
-def _fix_snapshot_json(snapshot: StateSnapshot, only_keys: Optional[List[str]] = None):
-    snapshot.json_state = parse_state(snapshot.markdown_state, only_keys=only_keys)
+_JOB_EVENTS = {
+    "job_created": JobCreatedEvent,
+    "state_created": StateCreatedEvent,
+    "status": StateStatusEvent,
+    "partial_text": StatePartialTextEvent,
+    "dimension_complete": StateDimensionCompleteEvent,
+    "error": StateErrorEvent,
+}
+
+
+async def _render_job_event(db: AsyncSession, job_id: int, event: JobEvent) -> str:
+    if event.type != "complete":
+        return _JOB_EVENTS[event.type](event_id=event.seq, **event.data).json_line()
+    job = await db.get(TurnJob, job_id)
+    if job.kind == "create_state":
+        state = await db.get(State, job.state_id)
+        return StateCompleteEvent(event_id=event.seq, state=state).json_line()
+    state_snapshot = await db.get(StateSnapshot, job.snapshot_id)
+    await _fix_snapshot_json(db, state_snapshot)
+    return StateSnapshotCompleteEvent(
+        event_id=event.seq, state_snapshot=state_snapshot
+    ).json_line()
+
+
+class _JobEventFeed:
+    """
+    One poller per job in this process, fanning new events out to every open
+    stream, so N streams on a job cost one job_events query per poll, not N.
+    """
+
+    def __init__(self, job_id: int, after_seq: int):
+        self.job_id = job_id
+        self.last_seq = after_seq
+        self.subscribers: set = set()
+        self.task = asyncio.create_task(self._poll())
+
+    async def _poll(self):
+        # runs until the job ends or its last stream closes; never cancelled, so
+        # a closing stream can't interrupt a query mid-flight
+        while self.subscribers:
+            rendered = []
+            try:
+                async with AsyncSessionLocal() as db:
+                    events = (
+                        await db.scalars(
+                            select(JobEvent)
+                            .filter(
+                                JobEvent.job_id == self.job_id,
+                                JobEvent.seq > self.last_seq,
+                            )
+                            .order_by(JobEvent.seq)
+                        )
+                    ).all()
+                    for event in events:
+                        line = await _render_job_event(db, self.job_id, event)
+                        rendered.append((event.seq, event.type, line))
+            except Exception as e:
+                print(f"Job {self.job_id} event poll failed: {e}")
+            for seq, type, line in rendered:
+                self.last_seq = seq
+                for queue in self.subscribers:
+                    queue.put_nowait((seq, type, line))
+                if type in ("complete", "error"):
+                    return
+            await asyncio.sleep(TURN_JOB_POLL_SECONDS)
+
+
+_job_event_feeds: dict = {}
+
+
+def _subscribe_job_events(job_id: int, after_seq: int) -> asyncio.Queue:
+    feed = _job_event_feeds.get(job_id)
+    if feed is None or feed.task.done():
+        feed = _job_event_feeds[job_id] = _JobEventFeed(job_id, after_seq)
+    queue = asyncio.Queue()
+    feed.subscribers.add(queue)
+    return queue
+
+
+def _unsubscribe_job_events(job_id: int, queue: asyncio.Queue):
+    feed = _job_event_feeds.get(job_id)
+    if feed is None:
+        return
+    feed.subscribers.discard(queue)
+    if not feed.subscribers:
+        del _job_event_feeds[job_id]
+
+
+async def _tail_turn_job(job_id: int, last_event_id: int = 0):
+    """Stream a job's logged events after `last_event_id` until it completes or fails."""
+    # subscribe before replaying, so an event is either in the replay or
+    # delivered to the queue afterwards
+    queue = _subscribe_job_events(job_id, last_event_id)
+    try:
+        async with AsyncSessionLocal() as db:
+            events = (
+                await db.scalars(
+                    select(JobEvent)
+                    .filter(JobEvent.job_id == job_id, JobEvent.seq > last_event_id)
+                    .order_by(JobEvent.seq)
+                )
+            ).all()
+            for event in events:
+                last_event_id = event.seq
+                yield await _render_job_event(db, job_id, event)
+                if event.type in ("complete", "error"):
+                    return
+        while True:
+            seq, type, line = await queue.get()
+            if seq <= last_event_id:
+                continue
+            last_event_id = seq
+            yield line
+            if type in ("complete", "error"):
+                return
+    finally:
+        _unsubscribe_job_events(job_id, queue)
+
+
+@router.get("/jobs/{job_id}/events", response_model=None)
+async def get_turn_job_events(
+    job_id: int,
+    last_event_id: int = Header(0, alias="Last-Event-ID"),
+    current_user: User = Depends(get_current_user_from_token),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Reconnect to a job's event stream, replaying events after Last-Event-ID."""
+    job = await db.scalar(
+        select(TurnJob).filter(TurnJob.id == job_id, TurnJob.user_id == current_user.id)
+    )
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return event_stream_response(_tail_turn_job(job_id, last_event_id))
+
+
+async def _get_parsed_state(
+    db: AsyncSession, snapshot: StateSnapshot, only_keys: Optional[List[str]] = None
+) -> dict:
+    """
+    Return the stored parsed state, only re-parsing rows the parsed_states
+    backfill (run at startup) hasn't reached yet, delta rows included (just the
+    sections holding only_keys, if given).
+    """
+    if (
+        snapshot.parsed_state is not None
+        and snapshot.parsed_state_version == PARSED_STATE_VERSION
+    ):
+        return snapshot.parsed_state
+    markdown = await get_markdown_state(db, snapshot)
+    return parse_state(markdown, only_keys=only_keys)
+
+
+async def _fix_snapshot_json(
+    db: AsyncSession, snapshot: StateSnapshot, only_keys: Optional[List[str]] = None
+):
+    parsed_state = await _get_parsed_state(db, snapshot, only_keys)
+    # copy so the extra keys below never leak into the stored column
+    snapshot.json_state = dict(filter_state_keys(parsed_state, only_keys=only_keys))
     snapshot.json_state["date"] = snapshot.date
     if snapshot.markdown_future_events:
         snapshot.json_state["events"] = snapshot.markdown_future_events.split("\n")
@@ -219,26 +513,120 @@ def _fix_snapshot_json(snapshot: StateSnapshot, only_keys: Optional[List[str]] =
 @router.get("/{state_id}/snapshots", response_model=List[StateSnapshotResponse])
 async def get_state_snapshots(
     state_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     snapshots = (
-        db.query(StateSnapshot)
-        .filter(StateSnapshot.state_id == state_id)
-        .order_by(StateSnapshot.date.desc())
-        .all()
-    )
+        await db.scalars(
+            select(StateSnapshot)
+            .filter(StateSnapshot.state_id == state_id)
+            .order_by(StateSnapshot.date.desc())
+        )
+    ).all()
     for snapshot in snapshots:
-        _fix_snapshot_json(snapshot)
+        await _fix_snapshot_json(db, snapshot)
     return snapshots
 
 
+@router.get("/{state_id}/snapshots/page", response_model=StateSnapshotPageResponse)
+async def get_state_snapshot_page(
+    state_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=SNAPSHOT_PAGE_MAX_LIMIT),
+    summary: bool = False,
+    valueKeys: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Page through a state's snapshots, newest first. With summary=true only the
+    id, date and requested valueKeys of each snapshot are returned.
+    """
+    value_keys = _parse_key_paths(valueKeys)
+    try:
+        after = _decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if summary:
+        query = select(
+            StateSnapshot.id, StateSnapshot.date, *_value_key_columns(value_keys)
+        )
+    else:
+        query = select(StateSnapshot).options(defer(StateSnapshot.markdown_delta))
+    query = query.filter(StateSnapshot.state_id == state_id).order_by(
+        StateSnapshot.date.desc(), StateSnapshot.id.desc()
+    )
+    if after:
+        after_date, after_id = after
+        query = query.filter(
+            or_(
+                StateSnapshot.date < after_date,
+                and_(StateSnapshot.date == after_date, StateSnapshot.id < after_id),
+            )
+        )
+    rows = (await db.execute(query.limit(limit + 1))).all()
+
+    if summary:
+        items = [
+            StateSnapshotSummaryResponse(
+                id=snapshot_id,
+                date=date,
+                state_id=state_id,
+                json_state=_nest_values(value_keys, values),
+            )
+            for snapshot_id, date, *values in rows[:limit]
+        ]
+    else:
+        items = [
+            await _fix_snapshot_json(db, row.StateSnapshot, only_keys=value_keys)
+            for row in rows[:limit]
+        ]
+
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = _encode_cursor([items[-1].date, items[-1].id])
+    return StateSnapshotPageResponse(items=items, next_cursor=next_cursor)
+
+
+@router.get(
+    "/{state_id}/snapshots/{snapshot_id}", response_model=StateSnapshotResponse
+)
+async def get_state_snapshot(
+    state_id: int,
+    snapshot_id: int,
+    db: AsyncSession = Depends(get_async_db),
+):
+    snapshot = await db.scalar(
+        select(StateSnapshot).filter(
+            StateSnapshot.id == snapshot_id, StateSnapshot.state_id == state_id
+        )
+    )
+    if not snapshot:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return await _fix_snapshot_json(db, snapshot)
+
+
 @router.post("/{state_id}/snapshots", response_model=None)
 async def create_state_snapshot(
     state_id: int,
     request: CreateNewSnapshotRequest,
     current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
+    state = await db.scalar(
+        select(State).filter(State.id == state_id, State.user_id == current_user.id)
+    )
+    if not state:
+        raise HTTPException(status_code=404, detail="State not found")
+
+    latest_snapshot = await db.scalar(
+        select(StateSnapshot)
+        .filter(StateSnapshot.state_id == state_id)
+        .order_by(StateSnapshot.date.desc())
+        .limit(1)
+    )
+    if not latest_snapshot:
+        raise HTTPException(status_code=404, detail="No previous snapshots found")
+
     async def event_stream():
         if current_user.credits < CREDITS_NEXT_YEAR_COST:
             yield StateErrorEvent(
@@ -246,25 +634,6 @@ async def create_state_snapshot(
             ).json_line()
             return
 
-        state = (
-            db.query(State)
-            .filter(State.id == state_id, State.user_id == current_user.id)
-            .first()
-        )
-        if not state:
-            raise HTTPException(status_code=404, detail="State not found")
-
-        # Get all previous snapshots ordered by date
-        previous_snapshots = (
-            db.query(StateSnapshot)
-            .filter(StateSnapshot.state_id == state_id)
-            .order_by(StateSnapshot.date.desc())
-            .limit(10)
-            .all()
-        )[::-1]
-        if not previous_snapshots:
-            raise HTTPException(status_code=404, detail="No previous snapshots found")
-
         if state.turn_in_progress:
             yield StateErrorEvent(
                 message="Turn already in progress, refresh and try again after a few minutes"
@@ -272,98 +641,22 @@ async def create_state_snapshot(
             return
 
         state.turn_in_progress = True
-        db.add(state)
-        db.commit()
-
-        latest_snapshot = previous_snapshots[-1]
-        current_date = datetime.strptime(latest_snapshot.date, "%Y-%m")
-        next_date = current_date + relativedelta(months=12)
-
-        # Collect historical events with their dates
-        historical_events = [
-            (
-                snapshot.date,
-                (snapshot.markdown_future_events.split("\n")),
-            )
-            for snapshot in previous_snapshots
-            if snapshot.markdown_future_events
-        ]
-
-        try:
-            yield StateStatusEvent(message="Drafting your policies...").json_line()
-            reasonable_policy = await generate_reasonable_policy_event(request.policy)
-
-            yield StateStatusEvent(message="Simulating next year...").json_line()
-            diff, next_state, simulated_events = await generate_next_state(
-                start_date=current_date,
-                end_date=next_date,
-                prev_state=latest_snapshot.markdown_state,
-                events=latest_snapshot.markdown_future_events,
-                reasonable_policy=reasonable_policy,
-                historical_events=historical_events,
-            )
-
-            yield StateStatusEvent(
-                message="Generating report and events..."
-            ).json_line()
-            next_state_report, next_events = await asyncio.gather(
-                generate_diff_report(
-                    start_date=current_date,
-                    end_date=next_date,
-                    prev_state=latest_snapshot.markdown_state,
-                    diff_output=diff,
-                ),
-                generate_future_events(
-                    start_date=next_date,
-                    end_date=next_date + relativedelta(months=12),
-                    prev_state=next_state,
-                    historical_events=historical_events,
-                ),
-            )
-
-            yield StateStatusEvent(
-                message="Generating policy suggestions..."
-            ).json_line()
-            next_events_policy = await generate_future_policy_suggestion(
-                start_date=next_date,
-                end_date=next_date + relativedelta(months=12),
-                prev_state=next_state,
-                events=next_events,
-            )
-
-            current_user.credits -= CREDITS_NEXT_YEAR_COST
-            db.add(current_user)
-            db.commit()
-        except Exception:
-            print(traceback.format_exc())
-            state.turn_in_progress = False
-            db.add(state)
-            db.commit()
-            yield StateErrorEvent(
-                message="Failed to simulate the changes. Try again. If issues persist, reduce policy actions."
-            ).json_line()
-            return
-
-        # patch in the policy events selected by the user
-        latest_snapshot.markdown_future_events = simulated_events
-        state.turn_in_progress = False
-        db.add(state)
-        db.add(latest_snapshot)
-        state_snapshot = StateSnapshot(
-            date=next_date.strftime("%Y-%m"),
+        job = TurnJob(
+            kind="next_turn",
             state_id=state_id,
-            markdown_state=next_state,
-            markdown_delta=diff,
-            markdown_delta_report=next_state_report,
-            markdown_future_events=next_events,
-            markdown_future_events_policy=next_events_policy,
+            user_id=current_user.id,
+            payload={"policy": request.policy, "snapshot_id": latest_snapshot.id},
+            checkpoint={},
         )
-        db.add(state_snapshot)
-        db.commit()
-        db.refresh(state_snapshot)
+        db.add(state)
+        db.add(job)
+        await db.flush()
+        await add_job_event(db, job.id, "job_created", {"job_id": job.id})
+        await db.commit()
+        notify_turn_workers()
 
-        _fix_snapshot_json(state_snapshot)
-        yield StateSnapshotCompleteEvent(state_snapshot=state_snapshot).json_line()
+        async for line in _tail_turn_job(job.id):
+            yield line
 
     return event_stream_response(event_stream())
 
@@ -373,25 +666,25 @@ async def get_advice(
     state_id: int,
     request: AdviceRequest,
     current_user: User = Depends(get_current_user_from_token),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    state = (
-        db.query(State)
-        .filter(State.id == state_id, State.user_id == current_user.id)
-        .first()
+    state = await db.scalar(
+        select(State).filter(State.id == state_id, State.user_id == current_user.id)
     )
     if not state:
         raise HTTPException(status_code=404, detail="State not found")
 
-    latest_snapshot = (
-        db.query(StateSnapshot)
+    latest_snapshot = await db.scalar(
+        select(StateSnapshot)
         .filter(StateSnapshot.state_id == state_id)
         .order_by(StateSnapshot.date.desc())
-        .first()
+        .limit(1)
     )
     if not latest_snapshot:
         raise HTTPException(status_code=404, detail="State not found")
+    llm_owner.set(f"user-{current_user.id}")
+    markdown_state = await get_markdown_state(db, latest_snapshot)
     advice = await generate_state_advice(
-        latest_snapshot.markdown_state, request.question, request.events
+        markdown_state, request.question, request.events
     )
     return AdviceResponse(markdown_advice=advice)
@@ -1,10 +1,11 @@
 from fastapi import APIRouter, Request, HTTPException, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import stripe
 import logging
 
 from config import STRIPE_SECRET_KEY, STRIPE_WEBHOOK_SECRET
-from db.database import get_db
+from db.database import get_async_db
 from db.models import User
 
 
@@ -16,7 +17,7 @@ stripe.api_key = STRIPE_SECRET_KEY
 CREDITS_PER_PURCHASE = 60
 
 
-async def on_session_completed(session: stripe.checkout.Session, db: Session):
+async def on_session_completed(session: stripe.checkout.Session, db: AsyncSession):
     """Handle successful checkout session completion"""
     try:
         if "statesandbox" not in session.client_reference_id:
@@ -27,24 +28,24 @@ async def on_session_completed(session: stripe.checkout.Session, db: Session):
             session.client_reference_id.split("___")[1].replace("ssuser_", "")
         )
 
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await db.scalar(select(User).filter(User.id == user_id))
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
         # Update user credits
         user.credits += CREDITS_PER_PURCHASE
-        db.commit()
+        await db.commit()
 
         print(f"stripe: Successfully processed purchase for user {user_id}")
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"stripe: Error processing session completion: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/stripe-hook")
-async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
+async def stripe_webhook(request: Request, db: AsyncSession = Depends(get_async_db)):
     stripe_signature = request.headers.get("stripe-signature")
     if not stripe_signature:
         raise HTTPException(status_code=400, detail="No stripe signature")
@@ -0,0 +1,262 @@
+import argparse
+from sqlalchemy import or_, exists, select, update, delete
+from sqlalchemy.orm.attributes import flag_modified
+
+from db.compression import load_compression_dictionaries_sync
+from db.database import SessionLocal, init_db
+from db.models import State, StateSnapshot, StateMetric
+from db.snapshots import get_markdown_state_sync, set_markdown_state
+from model.parsing import parse_state, PARSED_STATE_VERSION
+from tasks.turn_jobs import metric_rows
+from config import SNAPSHOT_COMPRESSION, SNAPSHOT_STORAGE
+
+_STALE_PARSE = or_(
+    StateSnapshot.parsed_state_version.is_(None),
+    StateSnapshot.parsed_state_version != PARSED_STATE_VERSION,
+)
+
+
+def _reparse(db, snapshot: StateSnapshot):
+    """
+    Store a current-version parse of the snapshot and rebuild its metrics from
+    it, metric keys only the old parse had are dropped.
+    """
+    snapshot.parsed_state = parse_state(get_markdown_state_sync(db, snapshot))
+    snapshot.parsed_state_version = PARSED_STATE_VERSION
+    latest_snapshot_id = db.scalar(
+        select(State.latest_snapshot_id).where(State.id == snapshot.state_id)
+    )
+    db.execute(delete(StateMetric).where(StateMetric.snapshot_id == snapshot.id))
+    db.add_all(
+        metric_rows(
+            snapshot,
+            snapshot.parsed_state,
+            latest=snapshot.id == latest_snapshot_id,
+        )
+    )
+
+
+def backfill_parsed_states(batch_size: int = 100) -> int:
+    """
+    Re-parse snapshots that are missing parse_state output or are on an old
+    version, rebuilding their metrics too.
+    """
+    db = SessionLocal()
+    updated = 0
+    try:
+        last_id = 0
+        while True:
+            snapshots = (
+                db.query(StateSnapshot)
+                .filter(StateSnapshot.id > last_id, _STALE_PARSE)
+                .order_by(StateSnapshot.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not snapshots:
+                break
+            for snapshot in snapshots:
+                try:
+                    with db.begin_nested():
+                        _reparse(db, snapshot)
+                    updated += 1
+                except Exception as e:
+                    print(f"Error parsing snapshot {snapshot.id}: {e}")
+            last_id = snapshots[-1].id
+            db.commit()
+            print(f"Backfilled parsed states up to snapshot {last_id}")
+    finally:
+        db.close()
+    return updated
+
+
+def backfill_latest_snapshots(batch_size: int = 100) -> int:
+    """Point each state's latest_snapshot_id at its newest snapshot."""
+    db = SessionLocal()
+    updated = 0
+    try:
+        last_id = 0
+        while True:
+            states = (
+                db.query(State)
+                .filter(State.id > last_id)
+                .order_by(State.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not states:
+                break
+            for state in states:
+                latest_snapshot_id = (
+                    db.query(StateSnapshot.id)
+                    .filter(StateSnapshot.state_id == state.id)
+                    .order_by(StateSnapshot.date.desc(), StateSnapshot.id.desc())
+                    .limit(1)
+                    .scalar()
+                )
+                if latest_snapshot_id != state.latest_snapshot_id:
+                    state.latest_snapshot_id = latest_snapshot_id
+                    updated += 1
+            last_id = states[-1].id
+            db.commit()
+            print(f"Backfilled latest snapshots up to state {last_id}")
+    finally:
+        db.close()
+    return updated
+
+
+def backfill_metrics(batch_size: int = 100) -> int:
+    """
+    Index the numeric metrics of snapshots that have none yet, rebuild those of
+    snapshots whose parse is on an old version, and refresh the latest flags.
+    Run after latest_snapshots.
+    """
+    db = SessionLocal()
+    updated = 0
+    try:
+        last_id = 0
+        while True:
+            snapshots = (
+                db.query(StateSnapshot)
+                .filter(
+                    StateSnapshot.id > last_id,
+                    or_(
+                        ~exists().where(StateMetric.snapshot_id == StateSnapshot.id),
+                        _STALE_PARSE,
+                    ),
+                )
+                .order_by(StateSnapshot.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not snapshots:
+                break
+            for snapshot in snapshots:
+                try:
+                    with db.begin_nested():
+                        if snapshot.parsed_state_version == PARSED_STATE_VERSION:
+                            db.add_all(
+                                metric_rows(
+                                    snapshot, snapshot.parsed_state, latest=False
+                                )
+                            )
+                        else:
+                            _reparse(db, snapshot)
+                    updated += 1
+                except Exception as e:
+                    print(f"Error extracting metrics of snapshot {snapshot.id}: {e}")
+            last_id = snapshots[-1].id
+            db.commit()
+            print(f"Backfilled metrics up to snapshot {last_id}")
+
+        is_latest = StateMetric.snapshot_id.in_(select(State.latest_snapshot_id))
+        db.execute(
+            update(StateMetric)
+            .where(StateMetric.latest != is_latest)
+            .values(latest=is_latest)
+        )
+        db.commit()
+    finally:
+        db.close()
+    return updated
+
+
+_COMPRESSED_COLUMNS = [
+    "markdown_state",
+    "markdown_future_events",
+    "markdown_future_events_policy",
+    "markdown_delta",
+    "markdown_delta_report",
+    "markdown_state_delta",
+]
+
+
+def backfill_compressed_snapshots(batch_size: int = 100) -> int:
+    """
+    Rewrite snapshot markdown in the current SNAPSHOT_COMPRESSION format, i.e.
+    compress existing rows (zstd) or decompress them again (none).
+    """
+    db = SessionLocal()
+    updated = 0
+    try:
+        last_id = 0
+        while True:
+            snapshots = (
+                db.query(StateSnapshot)
+                .filter(StateSnapshot.id > last_id)
+                .order_by(StateSnapshot.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not snapshots:
+                break
+            for snapshot in snapshots:
+                for column in _COMPRESSED_COLUMNS:
+                    flag_modified(snapshot, column)
+                updated += 1
+            last_id = snapshots[-1].id
+            db.commit()
+            print(f"Rewrote snapshots up to {last_id} as {SNAPSHOT_COMPRESSION}")
+    finally:
+        db.close()
+    return updated
+
+
+def backfill_snapshot_storage(batch_size: int = 100) -> int:
+    """Re-encode each state's snapshot chain in the current SNAPSHOT_STORAGE mode."""
+    db = SessionLocal()
+    updated = 0
+    try:
+        last_id = 0
+        while True:
+            state_ids = [
+                state_id
+                for state_id, in db.query(State.id)
+                .filter(State.id > last_id)
+                .order_by(State.id)
+                .limit(batch_size)
+            ]
+            if not state_ids:
+                break
+            for state_id in state_ids:
+                snapshots = (
+                    db.query(StateSnapshot)
+                    .filter(StateSnapshot.state_id == state_id)
+                    .order_by(StateSnapshot.date, StateSnapshot.id)
+                    .all()
+                )
+                # rebuild the whole chain before any row is re-encoded
+                markdowns = [get_markdown_state_sync(db, s) for s in snapshots]
+                previous, previous_markdown = None, None
+                for snapshot, markdown in zip(snapshots, markdowns):
+                    set_markdown_state(snapshot, markdown, previous, previous_markdown)
+                    previous, previous_markdown = snapshot, markdown
+                    updated += 1
+                db.flush()
+            last_id = state_ids[-1]
+            db.commit()
+            print(f"Re-encoded snapshots up to state {last_id} as {SNAPSHOT_STORAGE}")
+    finally:
+        db.close()
+    return updated
+
+
+BACKFILLS = {
+    "parsed_states": backfill_parsed_states,
+    "latest_snapshots": backfill_latest_snapshots,
+    "metrics": backfill_metrics,
+    "compressed_snapshots": backfill_compressed_snapshots,
+    "snapshot_storage": backfill_snapshot_storage,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill derived snapshot data.")
+    parser.add_argument("backfill", choices=list(BACKFILLS))
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    init_db()
+    load_compression_dictionaries_sync()
+    count = BACKFILLS[args.backfill](batch_size=args.batch_size)
+    print(f"Backfilled {count} rows")
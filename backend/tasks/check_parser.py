@@ -0,0 +1,311 @@
+import argparse
+import json
+import random
+import re
+import sys
+import time
+
+from model.parsing import (
+    _UnsupportedMarkdown,
+    _parse_state_fast,
+    _parse_state_legacy,
+    extract_metrics,
+    filter_state_keys,
+    parse_state,
+    section_index,
+)
+from model.state_config import DIMENSIONS
+
+# Differential check of the fast state parser against the markdown_to_json one:
+# every document the fast parser accepts must parse to the same JSON (including
+# key order), and documents it rejects fall back to the legacy parser. Projections
+# (parse_state with only_keys) must match filtering the full parse, and
+# section_index lookups the line scan extract_markdown_section used to do.
+
+_WORDS = ["Northern", "Valen", "Oru", "High", "Coastal", "Reformist", "Ancient"]
+
+
+def _fill(placeholder: str, rng: random.Random) -> str:
+    if placeholder == "Percentage":
+        return rng.choice([f"{rng.randint(0, 60)}%", f"{rng.uniform(0, 60):.1f}%"])
+    if placeholder in ("Number", "Megawatts"):
+        return rng.choice(
+            [
+                str(rng.randint(0, 5000)),
+                f"{rng.randint(1, 999):,}{rng.randint(0, 999):03}",
+                f"{rng.uniform(0, 1):.2f}",
+                f"{rng.uniform(1, 90):.2f} million",
+            ]
+        )
+    if placeholder == "AmountUSD":
+        return rng.choice(
+            [
+                f"${rng.uniform(1, 900):.1f} billion",
+                f"{rng.randint(1, 999):,}{rng.randint(0, 999):03},000 USD",
+                f"${rng.randint(100, 99999):,}",
+            ]
+        )
+    if placeholder == "Description":
+        return rng.choice(
+            [
+                "Gradual change across regions",
+                "Mixed: rising in cities, falling elsewhere",
+                "N/A",
+            ]
+        )
+    return " ".join(rng.sample(_WORDS, rng.randint(1, 2)))
+
+
+def synthetic_state(rng: random.Random) -> str:
+    """A state document shaped like LLM output for the DIMENSIONS templates."""
+    sections = []
+    for dimension in DIMENSIONS:
+        body = re.sub(
+            r"\{(\w+)\}", lambda m: _fill(m.group(1), rng), dimension.template
+        )
+        body = re.sub(
+            r"<!--.*?-->",
+            lambda m: m.group(0) if rng.random() < 0.5 else "",
+            body,
+            flags=re.DOTALL,
+        )
+        sections.append(f"# {dimension.title}\n{body}")
+    return "\n\n".join(sections)
+
+
+# Mutations covering the markdown LLMs produce around the templates. Some (e.g.
+# indentation) are meant to be rejected by the fast parser.
+_MUTATIONS = [
+    lambda lines, rng, i: lines.insert(i, ""),
+    lambda lines, rng, i: lines.__setitem__(slice(i, i), ["", ""]),
+    lambda lines, rng, i: lines.insert(i, "Plain text: with a colon"),
+    lambda lines, rng, i: lines.insert(i, "Some plain paragraph text"),
+    lambda lines, rng, i: lines.__setitem__(i, lines[i] + "  "),
+    lambda lines, rng, i: lines.insert(i, "## Extra Section"),
+    lambda lines, rng, i: lines.insert(i, "### Deeper Section"),
+    lambda lines, rng, i: lines.insert(i, "# People"),
+    lambda lines, rng, i: lines.insert(i, "- Extra Key: 12% <!-- note -->"),
+    lambda lines, rng, i: lines.insert(i, "- 2024: a year"),
+    lambda lines, rng, i: lines.insert(i, "  - Nested: 1"),
+    lambda lines, rng, i: lines.insert(i, "* Starred: 2"),
+    lambda lines, rng, i: lines.insert(i, "1. Ordered"),
+    lambda lines, rng, i: lines.insert(i, "\xa0"),
+    lambda lines, rng, i: lines.insert(i, "#"),
+    lambda lines, rng, i: lines.insert(i, "# Economy: again"),
+    # a heading the LLM repeated with a suffix, cleans to the same key
+    lambda lines, rng, i: lines.insert(
+        i, rng.choice([line for line in lines if line.startswith("#")]) + ": again"
+    ),
+    lambda lines, rng, i: lines.insert(i, "#### Skipped Level"),
+    lambda lines, rng, i: lines.insert(i, "```"),
+    lambda lines, rng, i: lines.insert(i, "Underlined"),
+    lambda lines, rng, i: lines.insert(i, "==="),
+    lambda lines, rng, i: lines.__delitem__(i),
+]
+
+
+def mutate(document: str, rng: random.Random, count: int) -> str:
+    lines = document.split("\n")
+    for _ in range(count):
+        rng.choice(_MUTATIONS)(lines, rng, rng.randrange(len(lines)))
+    if rng.random() < 0.2:
+        lines.insert(0, "Intro text before the first heading")
+    return "\n".join(lines)
+
+
+def _database_documents():
+    from db.compression import load_compression_dictionaries_sync
+    from db.database import SessionLocal
+    from db.models import StateSnapshot
+    from db.snapshots import get_markdown_state_sync
+
+    load_compression_dictionaries_sync()
+    with SessionLocal() as db:
+        for snapshot in db.query(StateSnapshot).yield_per(100):
+            yield get_markdown_state_sync(db, snapshot)
+
+
+def _extract_markdown_section_legacy(markdown_text: str, h1_header_name: str) -> str:
+    """extract_markdown_section before SectionIndex, one scan per lookup."""
+    content = []
+    is_capturing = False
+    for line in markdown_text.splitlines():
+        if line.strip() == f"# {h1_header_name}":
+            is_capturing = True
+            continue
+        if line.strip().startswith("# ") and is_capturing:
+            break
+        if is_capturing:
+            content.append(line)
+    return "\n".join(content).strip() + "\n"
+
+
+# Mutations around h1 headers, which only matter for section lookups
+_SECTION_MUTATIONS = [
+    # the header line repeated inside its own section
+    lambda lines, rng, i: lines.insert(i, rng.choice(_HEADERS)),
+    # a whole section repeated, the first one wins
+    lambda lines, rng, i: lines.extend(["", rng.choice(_HEADERS), "- Again: 1"]),
+    lambda lines, rng, i: lines.insert(i, "  " + rng.choice(_HEADERS) + " "),
+    lambda lines, rng, i: lines.insert(i, rng.choice(_HEADERS).replace(" ", "", 1)),
+    lambda lines, rng, i: lines.insert(i, "# Unknown Dimension"),
+    lambda lines, rng, i: lines.__setitem__(i, lines[i] + "\u2028tail"),
+]
+_HEADERS = [f"# {dimension.title}" for dimension in DIMENSIONS]
+
+
+def section_document(rng: random.Random) -> str:
+    document = mutate(synthetic_state(rng), rng, rng.randint(0, 3))
+    lines = document.split("\n")
+    for _ in range(rng.randint(0, 4)):
+        rng.choice(_SECTION_MUTATIONS)(lines, rng, rng.randrange(len(lines)))
+    separator = rng.choice(["\n", "\n", "\r\n", "\r"])
+    return separator.join(lines)
+
+
+def check_sections(documents) -> bool:
+    total = mismatches = 0
+    legacy_seconds = seconds = 0.0
+    titles = [dimension.title for dimension in DIMENSIONS] + ["Unknown Dimension"]
+    for document in documents:
+        start = time.perf_counter()
+        expected = [_extract_markdown_section_legacy(document, t) for t in titles]
+        legacy_seconds += time.perf_counter() - start
+        section_index.cache_clear()
+        start = time.perf_counter()
+        index = section_index(document)
+        actual = [index.section(t) for t in titles]
+        seconds += time.perf_counter() - start
+        for title, a, e in zip(titles, actual, expected):
+            total += 1
+            if a != e:
+                mismatches += 1
+                if mismatches <= 3:
+                    print(f"--- section mismatch {title} ---\n{document[:2000]!r}")
+    print(
+        f"{total} section lookups, {mismatches} mismatched, "
+        f"section_index {legacy_seconds / max(seconds, 1e-9):.1f}x faster"
+    )
+    return mismatches == 0
+
+
+def _outcome(parse, document: str):
+    """(parsed state or the error the parser raised, seconds taken)."""
+    start = time.perf_counter()
+    try:
+        result = parse(document)
+    except _UnsupportedMarkdown:
+        raise
+    except Exception as e:
+        result = f"error: {type(e).__name__}"
+    return result, time.perf_counter() - start
+
+
+def check(documents) -> bool:
+    total = fallbacks = mismatches = 0
+    legacy_seconds = seconds = 0.0
+    for document in documents:
+        total += 1
+        expected, elapsed = _outcome(_parse_state_legacy, document)
+        legacy_seconds += elapsed
+        seconds += _outcome(parse_state, document)[1]
+        try:
+            actual, _ = _outcome(_parse_state_fast, document)
+        except _UnsupportedMarkdown:
+            fallbacks += 1
+            continue
+        # json.dumps so that key order is compared too
+        if json.dumps(actual) != json.dumps(expected):
+            mismatches += 1
+            if mismatches <= 3:
+                print(f"--- mismatch ---\n{document[:2000]}")
+    print(
+        f"{total} documents, {fallbacks} fell back, {mismatches} mismatched, "
+        f"parse_state {legacy_seconds / max(seconds, 1e-9):.1f}x faster"
+    )
+    return mismatches == 0
+
+
+def _key_paths(data: dict, rng: random.Random) -> list:
+    """A leaderboard-like set of key paths: metrics, whole sections and misses."""
+    metrics = [key for key, _, _ in extract_metrics(data)]
+    key_paths = rng.sample(metrics, min(len(metrics), rng.randint(1, 4)))
+    if data and rng.random() < 0.3:
+        section = rng.choice(list(data))
+        key_paths.append(section)
+        if isinstance(data[section], dict) and data[section]:
+            key_paths.append(f"{section}.{rng.choice(list(data[section]))}")
+    if rng.random() < 0.3:
+        key_paths.append("people.no_such_section.value")
+    return key_paths
+
+
+def check_projection(documents, rng: random.Random) -> bool:
+    total = mismatches = 0
+    full_seconds = seconds = 0.0
+    for document in documents:
+        try:
+            data = parse_state(document)
+        except Exception:
+            continue
+        total += 1
+        key_paths = _key_paths(data, rng)
+        start = time.perf_counter()
+        expected = filter_state_keys(parse_state(document), key_paths)
+        full_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        actual = parse_state(document, only_keys=key_paths)
+        seconds += time.perf_counter() - start
+        if json.dumps(actual) != json.dumps(expected):
+            mismatches += 1
+            if mismatches <= 3:
+                print(f"--- projection mismatch {key_paths} ---\n{document[:2000]}")
+    print(
+        f"{total} projections, {mismatches} mismatched, "
+        f"{full_seconds / max(seconds, 1e-9):.1f}x faster than parsing everything"
+    )
+    return mismatches == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the fast state parser with the markdown_to_json one."
+    )
+    parser.add_argument("--documents", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--database",
+        action="store_true",
+        help="also check every snapshot in DATABASE_URL",
+    )
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    ok = check(synthetic_state(rng) for _ in range(args.documents))
+    ok = (
+        check(
+            mutate(synthetic_state(rng), rng, rng.randint(1, 8))
+            for _ in range(args.documents)
+        )
+        and ok
+    )
+    ok = (
+        check_projection((synthetic_state(rng) for _ in range(args.documents)), rng)
+        and ok
+    )
+    ok = (
+        check_projection(
+            (
+                mutate(synthetic_state(rng), rng, rng.randint(1, 8))
+                for _ in range(args.documents)
+            ),
+            rng,
+        )
+        and ok
+    )
+    ok = check_sections(section_document(rng) for _ in range(args.documents)) and ok
+    if args.database:
+        ok = check(_database_documents()) and ok
+        ok = check_projection(_database_documents(), rng) and ok
+        ok = check_sections(_database_documents()) and ok
+    sys.exit(0 if ok else 1)
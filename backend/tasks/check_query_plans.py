@@ -0,0 +1,253 @@
+import argparse
+import json
+import sys
+from typing import List, Optional
+
+from sqlalchemy import and_, insert, or_, select, text, update
+
+from db.compression import load_compression_dictionaries_sync
+from db.database import engine, init_db
+from db.models import State, StateMetric, StateSnapshot, User
+
+# Hot queries of routers/states.py, routers/metrics.py and tasks/turn_jobs.py,
+# as (name, query, table that must not be scanned, index the plan should use).
+# The states table itself is scanned on purpose by the unpaginated leaderboard.
+_METRIC_KEYS = [f"economy.economic_metrics.metric_{i}" for i in range(5)]
+
+
+def _checks(state_id: int, user_id: int):
+    history = (
+        select(StateSnapshot)
+        .filter(StateSnapshot.state_id == state_id)
+        .order_by(StateSnapshot.date.desc())
+    )
+    return [
+        (
+            "snapshot history",
+            history,
+            "state_snapshots",
+            "ix_state_snapshots_state_id_date",
+        ),
+        (
+            "latest snapshot",
+            history.limit(1),
+            "state_snapshots",
+            "ix_state_snapshots_state_id_date",
+        ),
+        (
+            "recent history",
+            history.limit(10),
+            "state_snapshots",
+            "ix_state_snapshots_state_id_date",
+        ),
+        (
+            "snapshot page",
+            select(StateSnapshot.id, StateSnapshot.date)
+            .filter(
+                StateSnapshot.state_id == state_id,
+                or_(
+                    StateSnapshot.date < "2030-01",
+                    and_(StateSnapshot.date == "2030-01", StateSnapshot.id < 10**9),
+                ),
+            )
+            .order_by(StateSnapshot.date.desc(), StateSnapshot.id.desc())
+            .limit(21),
+            "state_snapshots",
+            "ix_state_snapshots_state_id_date",
+        ),
+        (
+            "leaderboard latest snapshots",
+            select(State, StateSnapshot).join(
+                StateSnapshot, StateSnapshot.id == State.latest_snapshot_id
+            ),
+            "state_snapshots",
+            None,
+        ),
+        (
+            "user states",
+            select(State).filter(State.user_id == user_id),
+            "states",
+            "ix_states_user_id",
+        ),
+        (
+            "metric ranking",
+            select(StateMetric)
+            .filter(StateMetric.key == _METRIC_KEYS[0], StateMetric.latest.is_(True))
+            .order_by(StateMetric.value.desc())
+            .limit(10),
+            "state_metrics",
+            "ix_state_metrics_ranking",
+        ),
+        (
+            "metric series",
+            select(StateMetric)
+            .filter(
+                StateMetric.state_id == state_id, StateMetric.key.in_(_METRIC_KEYS[:2])
+            )
+            .order_by(StateMetric.date),
+            "state_metrics",
+            "ix_state_metrics_series",
+        ),
+    ]
+
+
+def seed(states: int, snapshots: int):
+    """Insert a synthetic dataset shaped like production (small markdown bodies)."""
+    with engine.begin() as conn:
+        # a few states per user, like real accounts
+        user_ids = (
+            conn.execute(
+                insert(User).returning(User.id),
+                [
+                    {"username": f"query-plan-check-{i}", "credits": 0}
+                    for i in range(max(states // 3, 1))
+                ],
+            )
+            .scalars()
+            .all()
+        )
+        for first in range(0, states, 500):
+            state_ids = (
+                conn.execute(
+                    insert(State).returning(State.id),
+                    [
+                        {
+                            "name": f"State {i}",
+                            "date": "2022-01",
+                            "flag_svg": "<svg></svg>",
+                            "description": "Synthetic state",
+                            "turn_in_progress": False,
+                            "user_id": user_ids[i % len(user_ids)],
+                        }
+                        for i in range(first, min(first + 500, states))
+                    ],
+                )
+                .scalars()
+                .all()
+            )
+            rows = [
+                {
+                    "state_id": state_id,
+                    "date": f"{2022 + year}-01",
+                    "markdown_state": f"# People\n- Year: {year}",
+                    "markdown_future_events": "",
+                    "markdown_future_events_policy": "",
+                }
+                for state_id in state_ids
+                for year in range(snapshots)
+            ]
+            snapshot_ids = conn.execute(
+                insert(StateSnapshot).returning(
+                    StateSnapshot.id, StateSnapshot.state_id, StateSnapshot.date
+                ),
+                rows,
+            ).all()
+            latest = {}
+            metrics = []
+            for snapshot_id, state_id, date in snapshot_ids:
+                latest[state_id] = max(
+                    latest.get(state_id, (date, 0)), (date, snapshot_id)
+                )
+                for i, key in enumerate(_METRIC_KEYS):
+                    metrics.append(
+                        {
+                            "snapshot_id": snapshot_id,
+                            "state_id": state_id,
+                            "date": date,
+                            "key": key,
+                            "value": float((snapshot_id * 7919 + i) % 1000),
+                            "latest": False,
+                        }
+                    )
+            conn.execute(insert(StateMetric), metrics)
+            for state_id, (_, snapshot_id) in latest.items():
+                conn.execute(
+                    update(State)
+                    .where(State.id == state_id)
+                    .values(latest_snapshot_id=snapshot_id)
+                )
+                conn.execute(
+                    update(StateMetric)
+                    .where(StateMetric.snapshot_id == snapshot_id)
+                    .values(latest=True)
+                )
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("ANALYZE"))
+
+
+def _plan(query) -> List[str]:
+    """Scan/index lines of the query plan, in a dialect independent form."""
+    sql = str(query.compile(engine, compile_kwargs={"literal_binds": True}))
+    with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            lines = []
+
+            def walk(node):
+                line = f"{node['Node Type']} {node.get('Relation Name', '')}"
+                if "Index Name" in node:
+                    line += f" USING INDEX {node['Index Name']}"
+                lines.append(line)
+                for child in node.get("Plans", []):
+                    walk(child)
+
+            walk(plan[0]["Plan"])
+            return lines
+        return [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+
+
+def _is_table_scan(line: str, table: str) -> bool:
+    # postgres: "Seq Scan state_snapshots", sqlite: "SCAN state_snapshots"
+    words = line.split()
+    if engine.dialect.name == "postgresql":
+        return line.startswith("Seq Scan") and table in words
+    return words[:2] == ["SCAN", table] and "INDEX" not in words
+
+
+def check_plans(state_id: int, user_id: int) -> bool:
+    ok = True
+    for name, query, table, index in _checks(state_id, user_id):
+        lines = _plan(query)
+        scanned = any(_is_table_scan(line, table) for line in lines)
+        indexed = index is None or any(index in line for line in lines)
+        passed = not scanned and indexed
+        ok = ok and passed
+        print(f"{'ok' if passed else 'FAIL'}  {name}: {' | '.join(lines)}")
+    return ok
+
+
+def _sample_ids() -> Optional[tuple]:
+    with engine.connect() as conn:
+        return conn.execute(
+            select(State.id, State.user_id).order_by(State.id.desc()).limit(1)
+        ).first()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check that the hot snapshot/metric queries use their indexes."
+    )
+    parser.add_argument("--states", type=int, default=2000)
+    parser.add_argument("--snapshots", type=int, default=20, help="per state")
+    parser.add_argument(
+        "--no-seed",
+        action="store_true",
+        help="check plans against the existing data instead of a synthetic dataset",
+    )
+    args = parser.parse_args()
+
+    init_db()
+    load_compression_dictionaries_sync()
+    if not args.no_seed:
+        if _sample_ids() is not None:
+            sys.exit(
+                "Refusing to seed a database that already has states, use --no-seed"
+            )
+        seed(args.states, args.snapshots)
+        print(f"Seeded {args.states} states x {args.snapshots} snapshots")
+    sample = _sample_ids()
+    if sample is None:
+        sys.exit("No states to check plans against")
+    sys.exit(0 if check_plans(*sample) else 1)
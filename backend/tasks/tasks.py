@@ -1,24 +1,55 @@
 import asyncio
-from sqlalchemy import update
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import update, exists, delete, select
 
-from db.database import SessionLocal
-from db.models import State
+from config import JOB_EVENTS_RETENTION_HOURS
+from db.database import AsyncSessionLocal
+from db.models import State, TurnJob, JobEvent
+from tasks.turn_jobs import ACTIVE_JOB_STATUSES
 
 
 async def reset_stuck_states():
-    """Reset any states that have been stuck in progress for too long."""
+    """Reset any states that have been stuck in progress without an active turn job."""
     while True:
         try:
             print("Resetting stuck states")
-            db = SessionLocal()
-            db.execute(
-                update(State)
-                .where(State.turn_in_progress == True)
-                .values(turn_in_progress=False)
-            )
-            db.commit()
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(State)
+                    .where(
+                        State.turn_in_progress == True,
+                        ~exists().where(
+                            TurnJob.state_id == State.id,
+                            TurnJob.status.in_(ACTIVE_JOB_STATUSES),
+                        ),
+                    )
+                    .values(turn_in_progress=False)
+                )
+                await db.commit()
         except Exception as e:
             print(f"Error resetting stuck states: {e}")
-        finally:
-            db.close()
         await asyncio.sleep(600)
+
+
+async def prune_job_events():
+    """Drop replay buffers of jobs that finished more than the retention window ago."""
+    while True:
+        try:
+            cutoff = datetime.now(timezone.utc) - timedelta(
+                hours=JOB_EVENTS_RETENTION_HOURS
+            )
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    delete(JobEvent).where(
+                        JobEvent.job_id.in_(
+                            select(TurnJob.id).where(
+                                TurnJob.status.not_in(ACTIVE_JOB_STATUSES),
+                                TurnJob.updated_at < cutoff,
+                            )
+                        )
+                    )
+                )
+                await db.commit()
+        except Exception as e:
+            print(f"Error pruning job events: {e}")
+        await asyncio.sleep(60 * 60)
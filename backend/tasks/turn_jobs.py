@@ -0,0 +1,673 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import select, update, or_, and_, func
+import asyncio
+import os
+import socket
+import time
+import traceback
+import uuid
+
+from db.compression import load_compression_dictionaries
+from db.database import AsyncSessionLocal
+from db.models import State, StateSnapshot, StateMetric, TurnJob, JobEvent, User
+from db.snapshots import get_markdown_state, set_markdown_state
+from model.actions import (
+    generate_state_overview,
+    generate_state_dimensions,
+    generate_state_flag,
+    generate_state_description,
+    generate_next_state_diff,
+    generate_next_state_dimensions,
+    generate_diff_report,
+    generate_future_events,
+    generate_future_policy_suggestion,
+    generate_reasonable_policy_event,
+    OnDimensionDone,
+)
+from model.providers import OnDelta
+from model.parsing import extract_metrics, parse_state, PARSED_STATE_VERSION
+from model.scheduler import llm_owner
+from utils.dag import DagNode, run_dag
+from config import (
+    CREDITS_NEW_STATE_COST,
+    CREDITS_NEXT_YEAR_COST,
+    TURN_WORKER_CONCURRENCY,
+    TURN_JOB_LEASE_SECONDS,
+    TURN_JOB_MAX_ATTEMPTS,
+    TURN_JOB_POLL_SECONDS,
+    STREAM_PROGRESS_INTERVAL,
+)
+
+ACTIVE_JOB_STATUSES = ("pending", "running")
+
+JOB_ERROR_MESSAGES = {
+    "create_state": "Failed to create the state. Try again.",
+    "next_turn": "Failed to simulate the changes. Try again. If issues persist, reduce policy actions.",
+}
+
+
+@dataclass
+class TurnStep:
+    name: str
+    message: str
+    run: Callable[[dict], Awaitable[dict]]
+    # steps whose outputs this one reads, it starts as soon as they're done
+    requires: List[str] = field(default_factory=list)
+
+
+class _LeaseLost(Exception):
+    """Another worker took over the job (our lease expired)."""
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _lease_deadline() -> datetime:
+    return _now() + timedelta(seconds=TURN_JOB_LEASE_SECONDS)
+
+
+def metric_rows(
+    snapshot: StateSnapshot, parsed_state: dict, latest: bool
+) -> List[StateMetric]:
+    """StateMetric rows for the numeric values of a snapshot's parsed state."""
+    return [
+        StateMetric(
+            snapshot_id=snapshot.id,
+            state_id=snapshot.state_id,
+            date=snapshot.date,
+            key=key,
+            value=value,
+            unit=unit,
+            latest=latest,
+        )
+        for key, value, unit in extract_metrics(parsed_state)
+    ]
+
+
+async def _add_latest_snapshot(db, state: State, snapshot: StateSnapshot) -> int:
+    """Save a new latest snapshot of the state and index its numeric metrics."""
+    db.add(snapshot)
+    await db.flush()
+    state.latest_snapshot_id = snapshot.id
+    await db.execute(
+        update(StateMetric)
+        .where(StateMetric.state_id == state.id, StateMetric.latest.is_(True))
+        .values(latest=False)
+    )
+    db.add_all(metric_rows(snapshot, snapshot.parsed_state, latest=True))
+    await db.flush()
+    return snapshot.id
+
+
+# --- create_state ---
+
+
+async def _load_create_state_context(db, job: TurnJob) -> dict:
+    start_date = datetime.strptime(job.payload["date"], "%Y-%m")
+    return {"start_date": start_date, "end_date": start_date + relativedelta(months=12)}
+
+
+async def _generate_overview(ctx: dict) -> dict:
+    questions = [(q, v) for q, v in ctx["questions"]]
+    overview = await generate_state_overview(
+        ctx["date"],
+        ctx["name"],
+        questions,
+        on_delta=ctx["progress"].text_stream("overview"),
+    )
+    return {"overview": overview}
+
+
+async def _generate_initial_dimensions(ctx: dict) -> dict:
+    state = await generate_state_dimensions(
+        ctx["date"],
+        ctx["overview"],
+        on_dimension_done=ctx["progress"].dimension_done("dimensions"),
+    )
+    return {"state": state}
+
+
+async def _generate_flag(ctx: dict) -> dict:
+    return {"flag_svg": await generate_state_flag(ctx["overview"])}
+
+
+async def _generate_description(ctx: dict) -> dict:
+    return {"description": await generate_state_description(ctx["overview"])}
+
+
+async def _generate_initial_events(ctx: dict) -> dict:
+    events = await generate_future_events(
+        ctx["start_date"], ctx["end_date"], ctx["state"], []
+    )
+    return {"events": events}
+
+
+async def _generate_initial_policy(ctx: dict) -> dict:
+    events_policy = await generate_future_policy_suggestion(
+        ctx["start_date"], ctx["end_date"], ctx["state"], ctx["events"]
+    )
+    return {"events_policy": events_policy}
+
+
+async def _finalize_create_state(db, job: TurnJob, ctx: dict) -> int:
+    state = await db.get(State, job.state_id)
+    user = await db.get(User, job.user_id)
+    parsed_state = parse_state(ctx["state"])
+    state_snapshot = StateSnapshot(
+        date=ctx["date"],
+        state_id=state.id,
+        markdown_state=ctx["state"],
+        markdown_future_events=ctx["events"],
+        markdown_future_events_policy=ctx["events_policy"],
+        parsed_state=parsed_state,
+        parsed_state_version=PARSED_STATE_VERSION,
+    )
+    state.name = parsed_state["government"]["government_metadata"][
+        "country_official_name"
+    ]["value"]
+    state.flag_svg = ctx["flag_svg"]
+    state.description = ctx["description"]
+    state.turn_in_progress = False
+    user.credits -= CREDITS_NEW_STATE_COST
+    return await _add_latest_snapshot(db, state, state_snapshot)
+
+
+# --- next_turn ---
+
+
+async def _load_next_turn_context(db, job: TurnJob) -> dict:
+    latest_snapshot = await db.get(StateSnapshot, job.payload["snapshot_id"])
+    previous_snapshots = (
+        await db.scalars(
+            select(StateSnapshot)
+            .filter(
+                StateSnapshot.state_id == latest_snapshot.state_id,
+                StateSnapshot.date <= latest_snapshot.date,
+            )
+            .order_by(StateSnapshot.date.desc())
+            .limit(10)
+        )
+    ).all()[::-1]
+    current_date = datetime.strptime(latest_snapshot.date, "%Y-%m")
+    return {
+        "start_date": current_date,
+        "end_date": current_date + relativedelta(months=12),
+        "prev_state": await get_markdown_state(db, latest_snapshot),
+        "events": latest_snapshot.markdown_future_events,
+        # Collect historical events with their dates
+        "historical_events": [
+            (snapshot.date, snapshot.markdown_future_events.split("\n"))
+            for snapshot in previous_snapshots
+            if snapshot.markdown_future_events
+        ],
+    }
+
+
+async def _draft_policy(ctx: dict) -> dict:
+    return {"reasonable_policy": await generate_reasonable_policy_event(ctx["policy"])}
+
+
+async def _simulate_diff(ctx: dict) -> dict:
+    diff, simulated_events, changed_dimensions = await generate_next_state_diff(
+        start_date=ctx["start_date"],
+        end_date=ctx["end_date"],
+        prev_state=ctx["prev_state"],
+        events=ctx["events"],
+        reasonable_policy=ctx["reasonable_policy"],
+        historical_events=ctx["historical_events"],
+        on_delta=ctx["progress"].text_stream("diff"),
+    )
+    return {
+        "diff": diff,
+        "simulated_events": simulated_events,
+        "changed_dimensions": changed_dimensions,
+    }
+
+
+async def _simulate_dimensions(ctx: dict) -> dict:
+    next_state = await generate_next_state_dimensions(
+        start_date=ctx["start_date"],
+        end_date=ctx["end_date"],
+        prev_state=ctx["prev_state"],
+        diff_output=ctx["diff"],
+        # missing from jobs checkpointed before the diff listed its changes
+        changed_dimensions=ctx.get("changed_dimensions"),
+        on_dimension_done=ctx["progress"].dimension_done("dimensions"),
+    )
+    return {"next_state": next_state}
+
+
+async def _generate_report(ctx: dict) -> dict:
+    report = await generate_diff_report(
+        start_date=ctx["start_date"],
+        end_date=ctx["end_date"],
+        prev_state=ctx["prev_state"],
+        diff_output=ctx["diff"],
+    )
+    return {"report": report}
+
+
+async def _generate_next_events(ctx: dict) -> dict:
+    next_date = ctx["end_date"]
+    next_events = await generate_future_events(
+        start_date=next_date,
+        end_date=next_date + relativedelta(months=12),
+        prev_state=ctx["next_state"],
+        historical_events=ctx["historical_events"],
+    )
+    return {"next_events": next_events}
+
+
+async def _generate_next_policy(ctx: dict) -> dict:
+    next_date = ctx["end_date"]
+    next_events_policy = await generate_future_policy_suggestion(
+        start_date=next_date,
+        end_date=next_date + relativedelta(months=12),
+        prev_state=ctx["next_state"],
+        events=ctx["next_events"],
+    )
+    return {"next_events_policy": next_events_policy}
+
+
+async def _finalize_next_turn(db, job: TurnJob, ctx: dict) -> int:
+    state = await db.get(State, job.state_id)
+    user = await db.get(User, job.user_id)
+    latest_snapshot = await db.get(StateSnapshot, job.payload["snapshot_id"])
+
+    user.credits -= CREDITS_NEXT_YEAR_COST
+    # patch in the policy events selected by the user
+    latest_snapshot.markdown_future_events = ctx["simulated_events"]
+    state.turn_in_progress = False
+    state_snapshot = StateSnapshot(
+        date=ctx["end_date"].strftime("%Y-%m"),
+        state_id=state.id,
+        markdown_delta=ctx["diff"],
+        markdown_delta_report=ctx["report"],
+        markdown_future_events=ctx["next_events"],
+        markdown_future_events_policy=ctx["next_events_policy"],
+        parsed_state=parse_state(ctx["next_state"]),
+        parsed_state_version=PARSED_STATE_VERSION,
+    )
+    set_markdown_state(
+        state_snapshot, ctx["next_state"], latest_snapshot, ctx["prev_state"]
+    )
+    return await _add_latest_snapshot(db, state, state_snapshot)
+
+
+@dataclass
+class TurnJobType:
+    load_context: Callable[..., Awaitable[dict]]
+    steps: List[TurnStep]
+    finalize: Callable[..., Awaitable[int]]
+
+
+# Steps run as soon as the steps they require are done, listed in an order that
+# is valid for running them one at a time.
+TURN_JOB_TYPES: Dict[str, TurnJobType] = {
+    "create_state": TurnJobType(
+        load_context=_load_create_state_context,
+        steps=[
+            TurnStep("overview", "Generating initial state...", _generate_overview),
+            TurnStep(
+                "dimensions",
+                "Generating initial state...",
+                _generate_initial_dimensions,
+                requires=["overview"],
+            ),
+            TurnStep(
+                "flag", "Designing flag...", _generate_flag, requires=["overview"]
+            ),
+            TurnStep(
+                "description",
+                "Writing description...",
+                _generate_description,
+                requires=["overview"],
+            ),
+            TurnStep(
+                "events",
+                "Generating events...",
+                _generate_initial_events,
+                requires=["dimensions"],
+            ),
+            TurnStep(
+                "policy_suggestion",
+                "Generating policy suggestions...",
+                _generate_initial_policy,
+                requires=["events"],
+            ),
+        ],
+        finalize=_finalize_create_state,
+    ),
+    "next_turn": TurnJobType(
+        load_context=_load_next_turn_context,
+        steps=[
+            TurnStep("policy", "Drafting your policies...", _draft_policy),
+            TurnStep(
+                "diff", "Simulating next year...", _simulate_diff, requires=["policy"]
+            ),
+            TurnStep(
+                "dimensions",
+                "Simulating next year...",
+                _simulate_dimensions,
+                requires=["diff"],
+            ),
+            TurnStep(
+                "report", "Generating report...", _generate_report, requires=["diff"]
+            ),
+            TurnStep(
+                "events",
+                "Generating events...",
+                _generate_next_events,
+                requires=["dimensions"],
+            ),
+            TurnStep(
+                "policy_suggestion",
+                "Generating policy suggestions...",
+                _generate_next_policy,
+                requires=["events"],
+            ),
+        ],
+        finalize=_finalize_next_turn,
+    ),
+}
+
+# Steps that were merged into one before steps ran concurrently, mapped to the last
+# of the steps they became
+_LEGACY_STEPS = {"flag_events_description": "events", "report_events": "events"}
+
+
+def _completed_steps(job_type: TurnJobType, job: TurnJob) -> List[str]:
+    checkpoint = job.checkpoint or {}
+    if "completed_steps" in checkpoint:
+        return list(checkpoint["completed_steps"])
+    if not job.step:
+        return []
+    # checkpointed by the sequential runner, which only kept the last step
+    step_names = [step.name for step in job_type.steps]
+    last_step = _LEGACY_STEPS.get(job.step, job.step)
+    return step_names[: step_names.index(last_step) + 1]
+
+
+# --- execution ---
+
+
+async def add_job_event(db, job_id: int, type: str, data: Optional[dict] = None):
+    """Append an event to the job's log with the next per-job sequence id."""
+    last_seq = await db.scalar(
+        select(func.max(JobEvent.seq)).where(JobEvent.job_id == job_id)
+    )
+    db.add(JobEvent(job_id=job_id, seq=(last_seq or 0) + 1, type=type, data=data or {}))
+    await db.flush()
+
+
+async def _update_job(
+    job_id: int,
+    worker_id: str,
+    event: Optional[Tuple[str, dict]] = None,
+    **values,
+):
+    """Update a job we hold the lease on, optionally logging an event."""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(TurnJob)
+            .where(TurnJob.id == job_id, TurnJob.worker_id == worker_id)
+            .values(**values)
+        )
+        if result.rowcount != 1:
+            await db.rollback()
+            raise _LeaseLost()
+        if event:
+            await add_job_event(db, job_id, *event)
+        await db.commit()
+
+
+class _JobProgress:
+    """
+    Event log of a running job. Writes are serialized since each event takes the
+    next per-job seq, and streamed text is batched into one partial_text event
+    per STREAM_PROGRESS_INTERVAL.
+    """
+
+    def __init__(self, job_id: int, worker_id: str):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self._lock = asyncio.Lock()
+        self._text: Optional[dict] = None  # partial_text event not yet logged
+        self._flushed_at = 0.0
+
+    async def update(self, event: Optional[Tuple[str, dict]] = None, **values):
+        async with self._lock:
+            await _update_job(self.job_id, self.worker_id, event=event, **values)
+
+    async def flush(self):
+        if self._text is not None:
+            text, self._text = self._text, None
+            self._flushed_at = time.monotonic()
+            await self.update(
+                event=("partial_text", text), lease_expires_at=_lease_deadline()
+            )
+
+    def text_stream(self, step: str) -> OnDelta:
+        async def on_delta(offset: int, text: str, tokens: int):
+            pending = self._text
+            if (
+                pending is not None
+                and pending["step"] == step
+                and pending["offset"] + len(pending["text"]) == offset
+            ):
+                pending["text"] += text
+                pending["tokens"] = tokens
+            else:
+                # another step's text, or a retry starting over
+                await self.flush()
+                self._text = {
+                    "step": step,
+                    "offset": offset,
+                    "text": text,
+                    "tokens": tokens,
+                }
+            if time.monotonic() - self._flushed_at >= STREAM_PROGRESS_INTERVAL:
+                await self.flush()
+
+        return on_delta
+
+    def dimension_done(self, step: str) -> OnDimensionDone:
+        async def on_dimension_done(dimension: str, completed: int, total: int):
+            data = {
+                "step": step,
+                "dimension": dimension,
+                "completed": completed,
+                "total": total,
+            }
+            await self.update(
+                event=("dimension_complete", data), lease_expires_at=_lease_deadline()
+            )
+
+        return on_dimension_done
+
+
+async def _keep_lease(job_id: int, worker_id: str):
+    while True:
+        await asyncio.sleep(TURN_JOB_LEASE_SECONDS / 3)
+        try:
+            await _update_job(job_id, worker_id, lease_expires_at=_lease_deadline())
+        except _LeaseLost:
+            return
+        except Exception as e:
+            print(f"Error renewing lease for turn job {job_id}: {e}")
+
+
+async def _fail_job(job_id: int, worker_id: str, error: str):
+    async with AsyncSessionLocal() as db:
+        job = await db.get(TurnJob, job_id, with_for_update=True)
+        if job is None or job.worker_id != worker_id:
+            return
+        job.status = "failed"
+        job.error = error
+        job.lease_expires_at = None
+        state = await db.get(State, job.state_id) if job.state_id else None
+        if state is not None and job.kind == "create_state":
+            # the placeholder state never got a snapshot, so drop it
+            job.state_id = None
+            await db.delete(state)
+        elif state is not None:
+            state.turn_in_progress = False
+        await add_job_event(db, job_id, "error", {"message": error})
+        await db.commit()
+
+
+async def run_turn_job(job_id: int, worker_id: str):
+    """Run (or resume from its last checkpoint) a claimed job."""
+    lease_task = asyncio.create_task(_keep_lease(job_id, worker_id))
+    kind = None
+    try:
+        async with AsyncSessionLocal() as db:
+            job = await db.get(TurnJob, job_id)
+            kind = job.kind
+            if job.attempts > TURN_JOB_MAX_ATTEMPTS:
+                raise RuntimeError(f"Turn job {job_id} exceeded max attempts")
+            job_type = TURN_JOB_TYPES[kind]
+            checkpoint = dict(job.checkpoint or {})
+            ctx = {**job.payload, **await job_type.load_context(db, job), **checkpoint}
+            completed = _completed_steps(job_type, job)
+            user_id = job.user_id
+
+        progress = _JobProgress(job_id, worker_id)
+
+        async def start_step(node: DagNode):
+            message = steps[node.name].message
+            await progress.update(
+                message=message, event=("status", {"message": message})
+            )
+
+        async def checkpoint_step(node: DagNode, output: dict):
+            await progress.flush()
+            ctx.update(output)
+            checkpoint.update(output)
+            checkpoint["completed_steps"].append(node.name)
+            await progress.update(step=node.name, checkpoint=checkpoint)
+
+        llm_owner.set(f"user-{user_id}")
+        steps = {step.name: step for step in job_type.steps}
+        ctx["progress"] = progress
+        checkpoint["completed_steps"] = completed
+        await run_dag(
+            [
+                DagNode(step.name, lambda _, step=step: step.run(ctx), step.requires)
+                for step in job_type.steps
+            ],
+            done={name: None for name in completed},
+            on_start=start_step,
+            on_done=checkpoint_step,
+        )
+
+        async with AsyncSessionLocal() as db:
+            job = await db.get(TurnJob, job_id, with_for_update=True)
+            if job.worker_id != worker_id:
+                raise _LeaseLost()
+            job.snapshot_id = await job_type.finalize(db, job, ctx)
+            job.status = "completed"
+            job.lease_expires_at = None
+            await add_job_event(db, job_id, "complete")
+            await db.commit()
+    except _LeaseLost:
+        print(f"Lost lease on turn job {job_id}, another worker resumed it")
+    except asyncio.CancelledError:
+        # shutting down, the lease expires and another worker resumes the job
+        raise
+    except Exception:
+        print(traceback.format_exc())
+        await _fail_job(job_id, worker_id, JOB_ERROR_MESSAGES.get(kind, "Job failed."))
+    finally:
+        lease_task.cancel()
+
+
+def _claimable():
+    return or_(
+        TurnJob.status == "pending",
+        and_(TurnJob.status == "running", TurnJob.lease_expires_at < _now()),
+    )
+
+
+async def _claim_job(worker_id: str) -> Optional[int]:
+    async with AsyncSessionLocal() as db:
+        job_id = await db.scalar(
+            select(TurnJob.id).where(_claimable()).order_by(TurnJob.id).limit(1)
+        )
+        if job_id is None:
+            return None
+        # conditional update so only one worker wins the claim
+        result = await db.execute(
+            update(TurnJob)
+            .where(TurnJob.id == job_id, _claimable())
+            .values(
+                status="running",
+                worker_id=worker_id,
+                lease_expires_at=_lease_deadline(),
+                attempts=TurnJob.attempts + 1,
+            )
+        )
+        await db.commit()
+    return job_id if result.rowcount == 1 else None
+
+
+_wakeup: Optional[asyncio.Event] = None
+
+
+def _get_wakeup() -> asyncio.Event:
+    global _wakeup
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    return _wakeup
+
+
+def notify_turn_workers():
+    """Wake in-process workers right away instead of waiting for the next poll."""
+    _get_wakeup().set()
+
+
+async def run_turn_workers(concurrency: int = TURN_WORKER_CONCURRENCY):
+    """Claim and run up to `concurrency` jobs at once until cancelled."""
+    worker_name = f"{socket.gethostname()}-{os.getpid()}"
+    wakeup = _get_wakeup()
+    running = set()
+
+    def on_done(task: asyncio.Task):
+        running.discard(task)
+        wakeup.set()
+
+    try:
+        while True:
+            wakeup.clear()
+            try:
+                while len(running) < concurrency:
+                    # unique per claim so lease checks can tell runs apart
+                    worker_id = f"{worker_name}-{uuid.uuid4().hex[:8]}"
+                    job_id = await _claim_job(worker_id)
+                    if job_id is None:
+                        break
+                    task = asyncio.create_task(run_turn_job(job_id, worker_id))
+                    running.add(task)
+                    task.add_done_callback(on_done)
+            except Exception as e:
+                print(f"Error claiming turn jobs: {e}")
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=TURN_JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        for task in running:
+            task.cancel()
+
+
+if __name__ == "__main__":
+    # TURN_WORKER_MODE=external: run simulation workers separately from the API
+    async def main():
+        await load_compression_dictionaries()
+        await run_turn_workers()
+
+    asyncio.run(main())
@@ -0,0 +1,70 @@
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+
+
+@dataclass
+class DagNode:
+    name: str
+    # called with the results of every finished node (by name)
+    run: Callable[[Dict[str, Any]], Awaitable[Any]]
+    requires: List[str] = field(default_factory=list)
+
+
+def _check_dag(nodes: List[DagNode], done: Dict[str, Any]):
+    names = {node.name for node in nodes}
+    for node in nodes:
+        missing = [r for r in node.requires if r not in names and r not in done]
+        if missing:
+            raise ValueError(f"{node.name} requires unknown nodes {missing}")
+    # a cycle leaves nodes that never become ready
+    ready = set(done)
+    pending = [node for node in nodes if node.name not in done]
+    while pending:
+        runnable = [n for n in pending if all(r in ready for r in n.requires)]
+        if not runnable:
+            raise ValueError(f"Cycle between {[n.name for n in pending]}")
+        ready.update(n.name for n in runnable)
+        pending = [n for n in pending if n.name not in ready]
+
+
+async def run_dag(
+    nodes: List[DagNode],
+    done: Optional[Dict[str, Any]] = None,
+    on_start: Optional[Callable[[DagNode], Awaitable[None]]] = None,
+    on_done: Optional[Callable[[DagNode, Any], Awaitable[None]]] = None,
+) -> Dict[str, Any]:
+    """
+    Run nodes concurrently, each as soon as the nodes it requires have finished.
+
+    `done` holds results of nodes that already ran (e.g. before a resume), those
+    are not run again. Returns the results of all nodes by name. If a node
+    fails, the nodes still running are cancelled and its exception is raised.
+    """
+    _check_dag(nodes, done or {})
+    results = dict(done or {})
+    pending = [node for node in nodes if node.name not in results]
+    running: Dict[asyncio.Task, DagNode] = {}
+
+    try:
+        while pending or running:
+            for node in [n for n in pending if all(r in results for r in n.requires)]:
+                pending.remove(node)
+                # hooks run one at a time, in the scheduler rather than the nodes
+                if on_start:
+                    await on_start(node)
+                running[asyncio.create_task(node.run(results))] = node
+            finished, _ = await asyncio.wait(
+                running, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in finished:
+                node = running.pop(task)
+                results[node.name] = task.result()
+                if on_done:
+                    await on_done(node, results[node.name])
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+    return results
@@ -1,62 +1,124 @@
-from typing import TypeVar, Callable, AsyncGenerator, Any
+from typing import TypeVar, Callable, AsyncGenerator, Any, Optional
 import asyncio
+import contextvars
 from fastapi.responses import StreamingResponse
 from dataclasses import dataclass
 
 from routers.schemas import HeartbeatEvent
+from config import STREAM_HEARTBEAT_INTERVAL, STREAM_IDLE_TIMEOUT
 
 T = TypeVar("T")
 
+HEARTBEAT_TICK_SECONDS = 1.0
+
 
 @dataclass
 class HeartbeatResult:
     event: str
 
 
-async def heartbeat() -> AsyncGenerator[str, None]:
-    """Generate heartbeat events every 2 seconds."""
-    while True:
-        await asyncio.sleep(2)
-        yield HeartbeatEvent().json_line()
+class HeartbeatTicker:
+    """
+    One timer per process that wakes every open stream on each tick.
+
+    Streams await the same tick future instead of each running their own
+    heartbeat timer and task. The timer only runs while streams are subscribed.
+    """
+
+    def __init__(self, tick_seconds: float = HEARTBEAT_TICK_SECONDS):
+        self.tick_seconds = tick_seconds
+        self.subscribers = 0
+        self._tick: Optional[asyncio.Future] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self):
+        self.subscribers += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def unsubscribe(self):
+        self.subscribers -= 1
+
+    def next_tick(self) -> asyncio.Future:
+        if self._tick is None:
+            self._tick = asyncio.get_running_loop().create_future()
+        return self._tick
+
+    async def _run(self):
+        while self.subscribers > 0:
+            await asyncio.sleep(self.tick_seconds)
+            tick, self._tick = self._tick, None
+            if tick is not None and not tick.done():
+                tick.set_result(None)
+
+
+_ticker: Optional[HeartbeatTicker] = None
+
+
+def get_heartbeat_ticker() -> HeartbeatTicker:
+    global _ticker
+    if _ticker is None:
+        _ticker = HeartbeatTicker()
+    return _ticker
 
 
 async def with_heartbeat(
-    stream: AsyncGenerator[str, None]
+    stream: AsyncGenerator[str, None],
+    heartbeat_interval: float = STREAM_HEARTBEAT_INTERVAL,
+    idle_timeout: float = STREAM_IDLE_TIMEOUT,
 ) -> AsyncGenerator[str, None]:
     """
     Wrapper to add heartbeat events to a stream.
 
     Args:
         stream: Original event stream
+        heartbeat_interval: Send a heartbeat after this many seconds without output
+        idle_timeout: Close the stream after this many seconds without a real event (0 disables)
 
     Yields:
         str: Events from original stream interspersed with heartbeat events
     """
-    heartbeat_task = asyncio.create_task(heartbeat().__anext__())
-    stream_task = asyncio.create_task(stream.__anext__())
+    ticker = get_heartbeat_ticker()
+    ticker.subscribe()
+    loop = asyncio.get_running_loop()
+    heartbeat_line = HeartbeatEvent().json_line()
+    last_event = last_sent = loop.time()
+
+    # Run every step of the stream in one context so context vars set by the
+    # stream (e.g. llm_owner) persist across yields like a plain async for.
+    stream_context = contextvars.copy_context()
+    stream_task = asyncio.create_task(stream.__anext__(), context=stream_context)
 
     try:
         while True:
             done, _ = await asyncio.wait(
-                [heartbeat_task, stream_task], return_when=asyncio.FIRST_COMPLETED
+                [ticker.next_tick(), stream_task], return_when=asyncio.FIRST_COMPLETED
             )
+            now = loop.time()
 
             if stream_task in done:
                 try:
                     yield await stream_task
-                    stream_task = asyncio.create_task(stream.__anext__())
+                    last_event = last_sent = now
+                    stream_task = asyncio.create_task(
+                        stream.__anext__(), context=stream_context
+                    )
                 except StopAsyncIteration:
                     break
 
-            if heartbeat_task in done:
-                yield await heartbeat_task
-                heartbeat_task = asyncio.create_task(heartbeat().__anext__())
+            if idle_timeout and now - last_event >= idle_timeout:
+                # clients can resume turn streams with Last-Event-ID
+                print(f"Closing stream idle for {now - last_event:.0f}s")
+                break
+
+            if now - last_sent >= heartbeat_interval:
+                yield heartbeat_line
+                last_sent = now
 
     finally:
-        heartbeat_task.cancel()
+        ticker.unsubscribe()
         stream_task.cancel()
         try:
-            await heartbeat_task
             await stream_task
         except (asyncio.CancelledError, StopAsyncIteration):
             pass
@@ -0,0 +1,233 @@
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import sqlite3
+import threading
+import time
+
+from config import CACHE_BACKEND, CACHE_PATH, REDIS_URL
+
+# How long one process may hold the recompute lock before others take over
+LOCK_TTL_SECONDS = 120
+# How long a process waits on another's recompute before computing it itself,
+# well under the proxy timeout so a crashed or slow filler doesn't cause 504s
+LOCK_WAIT_SECONDS = 5
+
+
+class CacheBackend(ABC):
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        """Return (value, stored_at) or None if missing/expired."""
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, expire: int): ...
+
+    @abstractmethod
+    async def try_lock(self, key: str, ttl: int) -> bool: ...
+
+    @abstractmethod
+    async def unlock(self, key: str): ...
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Per-process cache, only useful with a single worker."""
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[bytes, float, float]] = {}
+        self._locks: Dict[str, float] = {}
+
+    async def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        entry = self._entries.get(key)
+        if entry is None or entry[2] < time.time():
+            return None
+        return entry[0], entry[1]
+
+    async def set(self, key: str, value: bytes, expire: int):
+        now = time.time()
+        self._entries[key] = (value, now, now + expire)
+
+    async def try_lock(self, key: str, ttl: int) -> bool:
+        now = time.time()
+        if self._locks.get(key, 0) > now:
+            return False
+        self._locks[key] = now + ttl
+        return True
+
+    async def unlock(self, key: str):
+        self._locks.pop(key, None)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """File backed cache shared by all uvicorn workers on the same host."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "stored_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_locks ("
+                "key TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+            )
+
+    def _get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at FROM cache WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def _set(self, key: str, value: bytes, expire: int):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                (key, value, now, now + expire),
+            )
+            self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+
+    def _try_lock(self, key: str, ttl: int) -> bool:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM cache_locks WHERE key = ? AND expires_at < ?", (key, now)
+            )
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO cache_locks VALUES (?, ?)", (key, now + ttl)
+            )
+            return cursor.rowcount == 1
+
+    def _unlock(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache_locks WHERE key = ?", (key,))
+
+    async def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: bytes, expire: int):
+        await asyncio.to_thread(self._set, key, value, expire)
+
+    async def try_lock(self, key: str, ttl: int) -> bool:
+        return await asyncio.to_thread(self._try_lock, key, ttl)
+
+    async def unlock(self, key: str):
+        await asyncio.to_thread(self._unlock, key)
+
+
+class RedisCacheBackend(CacheBackend):
+    """Cache shared across hosts, requires the optional `redis` package."""
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise ImportError("CACHE_BACKEND=redis requires `pip install redis`")
+        self._redis = redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        value, stored_at = await self._redis.hmget(key, "value", "stored_at")
+        if value is None:
+            return None
+        return value, float(stored_at)
+
+    async def set(self, key: str, value: bytes, expire: int):
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping={"value": value, "stored_at": time.time()})
+            pipe.expire(key, expire)
+            await pipe.execute()
+
+    async def try_lock(self, key: str, ttl: int) -> bool:
+        return bool(await self._redis.set(f"lock:{key}", 1, nx=True, ex=ttl))
+
+    async def unlock(self, key: str):
+        await self._redis.delete(f"lock:{key}")
+
+
+class SharedCache:
+    """
+    Cache with single-flight recomputes and stale-while-revalidate.
+
+    Within a process concurrent misses share one compute task; across processes
+    the backend lock lets one worker recompute while the others wait for it.
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def get_or_set(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[bytes]],
+        ttl: int,
+        stale_ttl: int = 0,
+    ) -> bytes:
+        """Return the cached value, serving it for `stale_ttl` past `ttl` while it refreshes."""
+        entry = await self.backend.get(key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.time() - stored_at
+            if age < ttl:
+                return value
+            if age < ttl + stale_ttl:
+                self._fill_once(key, compute, ttl + stale_ttl)
+                return value
+        return await asyncio.shield(self._fill_once(key, compute, ttl + stale_ttl))
+
+    def _fill_once(
+        self, key: str, compute: Callable[[], Awaitable[bytes]], expire: int
+    ) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fill(key, compute, expire))
+            self._inflight[key] = task
+
+            def on_done(task: asyncio.Task):
+                self._inflight.pop(key, None)
+                if not task.cancelled() and task.exception():
+                    print(f"Error refreshing cache key {key}: {task.exception()}")
+
+            task.add_done_callback(on_done)
+        return task
+
+    async def _fill(
+        self, key: str, compute: Callable[[], Awaitable[bytes]], expire: int
+    ) -> bytes:
+        started_at = time.time()
+        locked = await self.backend.try_lock(key, LOCK_TTL_SECONDS)
+        if not locked:
+            # another worker is recomputing, wait for its result
+            while time.time() - started_at < LOCK_WAIT_SECONDS:
+                await asyncio.sleep(0.5)
+                entry = await self.backend.get(key)
+                if entry is not None and entry[1] >= started_at:
+                    return entry[0]
+        try:
+            value = await compute()
+            await self.backend.set(key, value, expire)
+            return value
+        finally:
+            if locked:
+                await self.backend.unlock(key)
+
+
+_shared_cache: Optional[SharedCache] = None
+
+
+def get_shared_cache() -> SharedCache:
+    global _shared_cache
+    if _shared_cache is None:
+        if CACHE_BACKEND == "redis":
+            backend = RedisCacheBackend(REDIS_URL)
+        elif CACHE_BACKEND == "memory":
+            backend = MemoryCacheBackend()
+        else:
+            backend = SQLiteCacheBackend(CACHE_PATH)
+        _shared_cache = SharedCache(backend)
+    return _shared_cache
@@ -49,6 +49,12 @@ const SafeInternationalRelationsPage = withErrorBoundary(
 );
 const SafeMediaPage = withErrorBoundary(MediaPage, 'Media');
 
+const STEP_LABELS = {
+  overview: 'Generating initial state',
+  diff: 'Simulating next year',
+  dimensions: 'Updating state dimensions',
+};
+
 function StatePageContent({ stateId }) {
   const { toast } = useToast();
   const router = useRouter();
@@ -58,6 +64,7 @@ function StatePageContent({ stateId }) {
   const [snapshots, setSnapshots] = useState([]);
   const [turnLoading, setTurnLoading] = useState(false);
   const [loadingMessage, setLoadingMessage] = useState('');
+  const [partialText, setPartialText] = useState('');
   const [reportOpen, setReportOpen] = useState(false);
   const [helpOpen, setHelpOpen] = useState(
     searchParams.get('showInfo') === 'true'
@@ -90,14 +97,32 @@ function StatePageContent({ stateId }) {
   const handlePlay = (policy) => {
     setTurnLoading(true);
     setLoadingMessage('Starting simulation...');
+    setPartialText('');
     api.createStateSnapshot(stateId, policy, (event) => {
       switch (event.type) {
         case 'status':
           setLoadingMessage(event.message);
           break;
+        case 'partial_text':
+          // offset 0 starts a new step's output (or a retry)
+          setPartialText((text) =>
+            event.offset === 0
+              ? event.text
+              : text.slice(0, event.offset) + event.text
+          );
+          setLoadingMessage(
+            `${STEP_LABELS[event.step] ?? 'Simulating'}... (~${event.tokens.toLocaleString()} tokens written)`
+          );
+          break;
+        case 'dimension_complete':
+          setLoadingMessage(
+            `${STEP_LABELS[event.step] ?? 'Simulating'}... (${event.completed}/${event.total} dimensions done)`
+          );
+          break;
         case 'error':
           console.log('error', event);
           setLoadingMessage('');
+          setPartialText('');
           setTurnLoading(false);
           toast({
             variant: 'destructive',
@@ -125,6 +150,7 @@ function StatePageContent({ stateId }) {
           }, 1000);
           setTurnLoading(false);
           setLoadingMessage('');
+          setPartialText('');
           if (event.state_snapshot.markdown_delta_report) {
             setLatestReport(event.state_snapshot.markdown_delta_report);
             setReportOpen(true);
@@ -175,6 +201,7 @@ function StatePageContent({ stateId }) {
                 onPlay={handlePlay}
                 turnLoading={turnLoading}
                 loadingMessage={loadingMessage}
+                partialText={partialText}
                 key={latestSnapshot?.date}
               />
               <InfoDialog
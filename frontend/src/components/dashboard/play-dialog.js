@@ -25,6 +25,7 @@ export function PlayDialog({
   onPlay,
   turnLoading,
   loadingMessage,
+  partialText = '',
   stateId,
   events = [],
   eventsPolicy = [],
@@ -127,6 +128,11 @@ export function PlayDialog({
               <p className="text-sm text-muted-foreground text-center">
                 {loadingMessage}
               </p>
+              {partialText && (
+                <pre className="max-h-32 overflow-hidden whitespace-pre-wrap rounded-md bg-muted p-2 text-xs text-muted-foreground">
+                  {partialText.slice(-600)}
+                </pre>
+              )}
             </>
           )}
           {events.length > 0 && (
@@ -3,6 +3,9 @@ export const API_URL =
 
 const TOKEN_KEY = 'state-sandbox-token';
 
+const STREAM_RESUME_ATTEMPTS = 10;
+const FINAL_EVENT_TYPES = ['complete', 'state_snapshot_complete', 'error'];
+
 class ApiClient {
   async _post(endpoint, data) {
     const res = await fetch(`${API_URL}${endpoint}`, {
@@ -22,21 +25,7 @@ class ApiClient {
     return res.json();
   }
 
-  async _postStream(endpoint, data, onMessage) {
-    const res = await fetch(`${API_URL}${endpoint}`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-        Authorization: `Bearer ${localStorage.getItem(TOKEN_KEY)}`,
-      },
-      body: JSON.stringify(data),
-    });
-
-    if (!res.ok) {
-      const errorData = await res.json();
-      throw new Error(errorData.detail || `API error: ${res.statusText}`);
-    }
-
+  async _readStream(res, onMessage) {
     const reader = res.body.getReader();
     const decoder = new TextDecoder();
     let buffer = '';
@@ -63,6 +52,63 @@ class ApiClient {
     }
   }
 
+  async _postStream(endpoint, data, onMessage) {
+    const res = await fetch(`${API_URL}${endpoint}`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        Authorization: `Bearer ${localStorage.getItem(TOKEN_KEY)}`,
+      },
+      body: JSON.stringify(data),
+    });
+
+    if (!res.ok) {
+      const errorData = await res.json();
+      throw new Error(errorData.detail || `API error: ${res.statusText}`);
+    }
+
+    let jobId = null;
+    let lastEventId = 0;
+    let finished = false;
+    const handleEvent = (event) => {
+      if (event.type === 'job_created') jobId = event.job_id;
+      if (event.event_id) lastEventId = event.event_id;
+      if (FINAL_EVENT_TYPES.includes(event.type)) finished = true;
+      onMessage(event);
+    };
+
+    try {
+      await this._readStream(res, handleEvent);
+    } catch (err) {
+      if (!jobId) throw err;
+    }
+
+    // The turn keeps running server side, so resume a dropped stream
+    for (
+      let attempt = 0;
+      !finished && jobId && attempt < STREAM_RESUME_ATTEMPTS;
+      attempt++
+    ) {
+      await new Promise((resolve) => setTimeout(resolve, 1000 * (attempt + 1)));
+      try {
+        const resumed = await fetch(
+          `${API_URL}/api/states/jobs/${jobId}/events`,
+          {
+            headers: {
+              Authorization: `Bearer ${localStorage.getItem(TOKEN_KEY)}`,
+              'Last-Event-ID': String(lastEventId),
+            },
+          }
+        );
+        if (resumed.ok) {
+          await this._readStream(resumed, handleEvent);
+        }
+      } catch (err) {
+        // try again
+      }
+    }
+  }
+
   async _get(endpoint, params) {
     const url = new URL(`${API_URL}${endpoint}`);
     if (params) {
@@ -143,6 +189,33 @@ class ApiClient {
     return this._get('/api/states/latest', { valueKeys: valueKeys.join(',') });
   }
 
+  async getLeaderboard({ sort, order, limit, cursor, valueKeys, fields } = {}) {
+    return this._get('/api/states/leaderboard', {
+      sort,
+      order,
+      limit,
+      cursor,
+      valueKeys: valueKeys?.join(','),
+      fields: fields?.join(','),
+    });
+  }
+
+  async getMetricRanking(key, { order, limit, min, max, percentiles } = {}) {
+    return this._get(`/api/metrics/${key}`, {
+      order,
+      limit,
+      min,
+      max,
+      percentiles: percentiles?.join(','),
+    });
+  }
+
+  async getMetricSeries(stateId, keys) {
+    return this._get(`/api/metrics/states/${stateId}/series`, {
+      keys: keys.join(','),
+    });
+  }
+
   async createAccount(username, email) {
     const data = await this._post('/api/auth/create', { username, email });
     localStorage.setItem(TOKEN_KEY, data.token);
@@ -161,6 +234,22 @@ class ApiClient {
     return this._get(`/api/states/${stateId}/snapshots`);
   }
 
+  async getStateSnapshotPage(
+    stateId,
+    { cursor, limit, summary, valueKeys } = {}
+  ) {
+    return this._get(`/api/states/${stateId}/snapshots/page`, {
+      cursor,
+      limit,
+      summary,
+      valueKeys: valueKeys?.join(','),
+    });
+  }
+
+  async getStateSnapshot(stateId, snapshotId) {
+    return this._get(`/api/states/${stateId}/snapshots/${snapshotId}`);
+  }
+
   async createState(name, questions, onMessage) {
     return this._postStream('/api/states', { name, questions }, onMessage);
   }